@@ -0,0 +1,26 @@
+import { getSong } from "@/library/db";
+import { NextResponse } from "next/server";
+
+export async function GET(
+  request: Request,
+  { params }: { params: { id: string } },
+) {
+  try {
+    const song = await getSong(params.id);
+    if (song === null) {
+      return new Response(JSON.stringify({ error: "Song not found" }), {
+        status: 404,
+        headers: { "Content-Type": "application/json" },
+      });
+    }
+    return NextResponse.json({ song });
+  } catch (error) {
+    console.error(error);
+    return new Response(JSON.stringify({ error: "Error fetching song" }), {
+      status: 500,
+      headers: { "Content-Type": "application/json" },
+    });
+  }
+}
+
+export const dynamic = "force-dynamic";
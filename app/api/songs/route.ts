@@ -1,10 +1,10 @@
-import { getSongs } from "@/library/db";
+import { getSongSummaries } from "@/library/db";
 import { NextResponse } from "next/server";
 
 export async function GET(request: Request) {
   try {
-    const songs = await getSongs();
-    return NextResponse.json({ songs });
+    const summaries = await getSongSummaries();
+    return NextResponse.json({ summaries });
   } catch (error) {
     console.error(error);
     return new Response(JSON.stringify({ error: "Error fetching songs" }), {
@@ -18,7 +18,6 @@ import UserToggle from "./assets/UserToggle";
 import EffectSliders from "./assets/EffectSliders";
 import useAudioScheduler from "./useAudioScheduler";
 
-import { type SongType } from "@/library/musicData";
 import InitAudio from "./assets/InitAudio";
 import Description from "./assets/Description";
 import { A11yAnnouncer } from "@react-three/a11y";
@@ -30,21 +29,14 @@ interface GenDate {
   year: number;
 }
 
-interface MarkupType {
-  original_text: string;
-  sections: any;
-}
-
 // type CallbackFunction = (err: Error | null, ...args: any[]) => void;
 
 export default function Scene({
-  songs,
+  songIds,
   dates,
-  markups,
 }: {
-  songs: SongType[];
+  songIds: string[];
   dates: GenDate[];
-  markups: MarkupType[];
 }) {
   const [isUserEffects, setIsUserEffects] = useState<boolean>(false);
   const [orbitEndabled, setOrbitEnabled] = useState<boolean>(true);
@@ -61,7 +53,7 @@ export default function Scene({
     setReverbLevel,
     switchEffectsGen,
     init,
-  } = useAudioScheduler({ songs }); // TODO: just move all of these functions to the child components
+  } = useAudioScheduler({ songIds }); // TODO: just move all of these functions to the child components
 
   const numberDates = dates.length;
 
@@ -1,7 +1,7 @@
 import { useState, useRef, useEffect, useMemo } from "react";
 import { type Device } from "@rnbo/js";
 
-import { type SongType } from "@/library/musicData";
+import { expandSong, type SongSectionType } from "@/library/musicData";
 import {
   setupDevice,
   setupGain,
@@ -19,7 +19,7 @@ import VariableFilter from "@/library/VariableFilter";
 
 /**
  * Custom hook to handle the audio generation of the generated output.
- * @param {SongType[]} songs - All of the songs generated as a list.
+ * @param {string[]} songIds - The IDs of all of the songs generated as a list. Each song is fetched when it is first selected.
  * @returns {Object} An object containing:
  *  - isPlaying (boolean): Represents if the audio is currently playing.
  *  - currentSong (number): The index of the current song being processed.
@@ -34,14 +34,52 @@ import VariableFilter from "@/library/VariableFilter";
  *  - setScheduleAhead (function): Function to set the scheduling ahead time.
  */
 
-export default function useAudioScheduler({ songs }: { songs: SongType[] }) {
+export default function useAudioScheduler({ songIds }: { songIds: string[] }) {
   const [isPlaying, setIsPlaying] = useState<boolean>(false);
   const [currentSong, setCurrentSong] = useState<number>(0);
+  const [song, setSong] = useState<{ sections: SongSectionType[] } | null>(
+    null,
+  );
+  // songs that have been fetched, so going back to one doesn't fetch it again
+  const fetchedSongs = useRef(
+    new Map<string, { sections: SongSectionType[] }>(),
+  );
+
+  // Fetch the current song (there's nothing to play until it arrives)
+  useEffect(() => {
+    const id = songIds[currentSong];
+    const fetched = fetchedSongs.current.get(id);
+    if (fetched !== undefined) {
+      setSong(fetched);
+      return;
+    }
+    setSong(null);
+    let cancelled = false;
+    fetch(`/api/songs/${id}`)
+      .then(async (result) => {
+        if (!result.ok) {
+          throw new Error(`Error fetching song: ${result.statusText}`);
+        }
+        const body = await result.json();
+        // Songs may be stored deduplicated or columnar, which the player doesn't read
+        const expanded = expandSong(body.song.song);
+        fetchedSongs.current.set(id, expanded);
+        if (!cancelled) {
+          setSong(expanded);
+        }
+      })
+      .catch((e) => {
+        console.error(e);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [songIds, currentSong]);
 
   // Creates an array of bars for the current song.
   const bars = useMemo(() => {
-    return songs[currentSong].sections.flatMap((section) => section.bars);
-  }, [songs, currentSong]);
+    return song?.sections.flatMap((section) => section.bars) ?? [];
+  }, [song]);
 
   const audioContext = useRef<AudioContext | null>(null);
   const audioScheduling = useRef<AudioScheduler | null>(null);
@@ -1,4 +1,5 @@
 import Scene from "./components/Scene";
+import { type SongSummaryType } from "@/library/musicData";
 
 // import PlayButton from "./components/PlayButton";
 export default async function Home() {
@@ -25,11 +26,11 @@ export default async function Home() {
   }
 
   const body = await result.json();
-  const bars = body.songs;
+  // Only the summaries are listed. Songs are fetched when they're played (see /api/songs/[id])
+  const summaries: SongSummaryType[] = body.summaries;
 
-  const songsArray = bars.map((item: any) => item.song);
-  const markupArray = bars.map((item: any) => item.markup);
-  const datesArray = bars.map((item: any) => {
+  const songIds = summaries.map((item) => item._id);
+  const datesArray = summaries.map((item) => {
     const utcDate = new Date(item.created_at_utc);
     const day = utcDate.getUTCDate();
     const month = utcDate.toLocaleString("default", { month: "long" });
@@ -39,7 +40,7 @@ export default async function Home() {
   return (
     <main className="flex w-screen h-screen bg-white">
       <div className="w-screen h-screen">
-        <Scene songs={songsArray} dates={datesArray} markups={markupArray} />
+        <Scene songIds={songIds} dates={datesArray} />
       </div>
     </main>
   );
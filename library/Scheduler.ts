@@ -38,8 +38,6 @@ export default class AudioScheduler {
     drums: "lowpass",
   };
 
-  private readonly changeFrequency: number;
-
   private readonly tempo: number;
   private currentStep: number;
   private currentBar: number;
@@ -75,7 +73,6 @@ export default class AudioScheduler {
     this.currentStep = 0;
     this.currentBar = 0;
     this.nextNoteTime = 0;
-    this.changeFrequency = 16;
 
     this.isPlaying = false;
     this.lookahead = 20.0; // how frequent to call schedule function in ms
@@ -202,72 +199,79 @@ export default class AudioScheduler {
     filter: VariableFilter,
     instrument: InstrumentType,
   ) {
-    // only schedule filter at specified resolution (default is 1)
-    if (this.currentStep % this.changeFrequency === 0) {
-      const bar = this.bars[this.currentBar];
-
-      // hotfix for data being structured the wrong way (sometimes no filter:{filter_type ...} just {filter_type ...})
-      const restructuredData: FilterInformationType = {
-        filter_type: "",
-        filter_value: [],
-      };
-
-      const effectInfo = bar?.[instrument]?.effects;
-
-      // check if filter does not exist
-      if (effectInfo.filter === undefined) {
-        // if effects exist, populate what is in effects into filter (better patch to datatype can be made)
-        if (effectInfo !== undefined) {
-          const unknownEffectType = effectInfo as unknown;
-          const EffectHotfix = unknownEffectType as FilterInformationType;
-          restructuredData.filter_type = EffectHotfix.filter_type;
-          restructuredData.filter_value = EffectHotfix.filter_value;
-        } else {
-          return; // Exit if the required properties are not present
-        }
-      } else {
-        // runs if the data is in the proper format
-        restructuredData.filter_type = effectInfo.filter.filter_type;
-        restructuredData.filter_value = effectInfo.filter.filter_value;
-      }
-      // console.log(instrument, restructuredData);
-      // have the fixed structure be used as the info
-      const instrumentInfo = restructuredData;
-      const filterValue = instrumentInfo.filter_value;
-      const filterType = instrumentInfo.filter_type;
-
-      // sometimes the python outputs "hipass" instead of "highpass"
-      let checkedFilterType: string = "hipass";
-      // change hipass to highpass
-      if (filterType === "hipass") {
-        checkedFilterType = "highpass";
+    const bar = this.bars[this.currentBar];
+
+    // hotfix for data being structured the wrong way (sometimes no filter:{filter_type ...} just {filter_type ...})
+    const restructuredData: FilterInformationType = {
+      filter_type: "",
+      filter_value: [],
+    };
+
+    const effectInfo = bar?.[instrument]?.effects;
+
+    // check if filter does not exist
+    if (effectInfo.filter === undefined) {
+      // if effects exist, populate what is in effects into filter (better patch to datatype can be made)
+      if (effectInfo !== undefined) {
+        const unknownEffectType = effectInfo as unknown;
+        const EffectHotfix = unknownEffectType as FilterInformationType;
+        restructuredData.filter_type = EffectHotfix.filter_type;
+        restructuredData.filter_value = EffectHotfix.filter_value;
       } else {
-        checkedFilterType = filterType;
-      }
-      // makes sure that nothing will blow up. Skips when GPT sucks at following instructions
-      if (!isBiquadFilterType(checkedFilterType)) {
-        filter.switchFilter("lowpass", scheduleTime);
-        filter.changeFrequency(0, "lowpass", scheduleTime);
-        return;
-      }
-      const secondsPerBeat = 60 / this.tempo;
-      const timeTillNextBar =
-        (secondsPerBeat * 4) / (16 / this.changeFrequency); // get a full bar
-      // const timeBetweenFilterChanges = secondsPerBeat
-
-      // Change frequency
-      filter.changeFrequency(
-        filterValue[0],
-        checkedFilterType,
-        scheduleTime + timeTillNextBar,
-      );
-      // console.log(checkedFilterType, filterValue);
-
-      // Only change filter if not the same as the current
-      if (this.currentFilters[instrument] !== checkedFilterType) {
-        this.currentFilters[instrument] = checkedFilterType; // Update the current filter type
-        filter.switchFilter(checkedFilterType, scheduleTime);
+        return; // Exit if the required properties are not present
       }
+    } else {
+      // runs if the data is in the proper format
+      restructuredData.filter_type = effectInfo.filter.filter_type;
+      restructuredData.filter_value = effectInfo.filter.filter_value;
+    }
+    // console.log(instrument, restructuredData);
+    // have the fixed structure be used as the info
+    const instrumentInfo = restructuredData;
+    const filterValue = instrumentInfo.filter_value;
+    const filterType = instrumentInfo.filter_type;
+
+    // the values fall evenly over the bar (one per bar, up to a 16 step curve), each set by the end of its share of
+    // the bar. Only schedule when a new one starts
+    const valuesPerBar = Math.min(Math.max(filterValue.length, 1), 16);
+    const valueIndex = Math.floor((this.currentStep * valuesPerBar) / 16);
+    if (
+      this.currentStep !== 0 &&
+      valueIndex === Math.floor(((this.currentStep - 1) * valuesPerBar) / 16)
+    ) {
+      return;
+    }
+
+    // sometimes the python outputs "hipass" instead of "highpass"
+    let checkedFilterType: string = "hipass";
+    // change hipass to highpass
+    if (filterType === "hipass") {
+      checkedFilterType = "highpass";
+    } else {
+      checkedFilterType = filterType;
+    }
+    // makes sure that nothing will blow up. Skips when GPT sucks at following instructions
+    if (!isBiquadFilterType(checkedFilterType)) {
+      filter.switchFilter("lowpass", scheduleTime);
+      filter.changeFrequency(0, "lowpass", scheduleTime);
+      return;
+    }
+    const secondsPerBeat = 60 / this.tempo;
+    const timeTillNextValue = (secondsPerBeat * 4) / valuesPerBar; // the value's share of the bar
+    // const timeBetweenFilterChanges = secondsPerBeat
+
+    // Change frequency
+    filter.changeFrequency(
+      filterValue[valueIndex],
+      checkedFilterType,
+      scheduleTime + timeTillNextValue,
+    );
+    // console.log(checkedFilterType, filterValue);
+
+    // Only change filter if not the same as the current
+    if (this.currentFilters[instrument] !== checkedFilterType) {
+      this.currentFilters[instrument] = checkedFilterType; // Update the current filter type
+      filter.switchFilter(checkedFilterType, scheduleTime);
     }
   }
 
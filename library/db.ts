@@ -1,62 +1,71 @@
-import {
-  MongoClient,
-  ServerApiVersion,
-  type Collection,
-  type WithId,
-} from "mongodb";
-import { type SongRecordType } from "./musicData";
+import { MongoClient, ObjectId, ServerApiVersion, type Db } from "mongodb";
+import { type SongRecordType, type SongSummaryType } from "./musicData";
 
-// Create a MongoClient with a MongoClientOptions object to set the Stable API version
-// import { ObjectId } from "mongodb";
-
-// https://www.mongodb.com/compatibility/using-typescript-with-mongodb-tutorial
-export async function getSongs(): Promise<Array<WithId<SongRecordType>>> {
-  // Get songs, sorted by date descending
+// One client per server process, so that its connection pool is reused across requests
+let client: Promise<MongoClient> | null = null;
 
+async function getDb(): Promise<Db> {
   const atlas_cluster_uri = process.env.ATLAS_CLUSTER_URI;
   const db_name = process.env.DB_NAME;
-  const client = new MongoClient(atlas_cluster_uri as string, {
-    serverApi: {
-      version: ServerApiVersion.v1,
-      strict: true,
-      deprecationErrors: true,
-    },
-  });
+  if (client === null) {
+    // Create a MongoClient with a MongoClientOptions object to set the Stable API version
+    client = new MongoClient(atlas_cluster_uri as string, {
+      serverApi: {
+        version: ServerApiVersion.v1,
+        strict: true,
+        deprecationErrors: true,
+      },
+    })
+      .connect()
+      .catch((e) => {
+        // Connect again on the next request
+        client = null;
+        throw e;
+      });
+  }
+  return (await client).db(db_name);
+}
 
+// https://www.mongodb.com/compatibility/using-typescript-with-mongodb-tutorial
+/**
+ * Get the summaries of every song (see ./music_generator_lambda/music_generator/music_generator_types/song_summary.py),
+ * sorted by date descending. Summaries are small, and sorted by an index, so no song is read.
+ */
+export async function getSongSummaries(): Promise<SongSummaryType[]> {
   try {
-    // Connect the client to the server	(optional starting in v4.7)
-    await client.connect();
-    // Send a ping to confirm a successful connection
-    const db = client.db(db_name);
-    const songsCollection: Collection = db.collection("songs");
-    const songs = (await songsCollection.find({}).toArray()) as Array<
-      WithId<SongRecordType>
-    >;
-
-    console.log({
-      atlas_cluster_uri,
-      db_name,
-      dates: songs
-        .sort((a, b) => {
-          // Sorted by date descending
-          const aDate = new Date(a.created_at_utc);
-          const bDate = new Date(b.created_at_utc);
-          return bDate.getTime() - aDate.getTime();
-        })
-        .map((song) => song.created_at_utc),
-    });
+    const db = await getDb();
+    const summaries = await db
+      .collection("song_summaries")
+      .find({}, { projection: { created_at: 0 } })
+      .sort({ created_at: -1 })
+      .toArray();
+    return summaries.map((summary) => ({
+      ...summary,
+      _id: summary._id.toHexString(),
+    })) as SongSummaryType[];
+  } catch (e) {
+    console.error(e);
+    throw e;
+  }
+}
 
-    return songs.sort((a, b) => {
-      // Sorted by date descending
-      const aDate = new Date(a.created_at_utc);
-      const bDate = new Date(b.created_at_utc);
-      return bDate.getTime() - aDate.getTime();
-    });
+/**
+ * Get a song, to play it.
+ *
+ * @param id The song's ID (the same as its summary's).
+ * @returns The song, or null if there isn't one with the ID.
+ */
+export async function getSong(id: string): Promise<SongRecordType | null> {
+  if (!ObjectId.isValid(id)) {
+    return null;
+  }
+  try {
+    const db = await getDb();
+    return (await db
+      .collection("songs")
+      .findOne({ _id: new ObjectId(id) })) as SongRecordType | null;
   } catch (e) {
     console.error(e);
     throw e;
-  } finally {
-    // Ensures that the client will close when you finish/error
-    await client.close();
   }
 }
@@ -1,4 +1,5 @@
 import { z } from "zod";
+import { decodeSong } from "./songCodec";
 
 export const MarkupInstrumentSchema = z.object({
   description: z.string(),
@@ -116,8 +117,51 @@ export const Song = z.object({
   markup: MusicalMarkupSchema,
 });
 
+// What lists of songs need of a SongRecord (see ./music_generator_lambda/music_generator/music_generator_types/song_summary.py).
+// Its _id is the song's.
+export const SongSummary = z.object({
+  _id: z.string(),
+  created_at_utc: z.string(),
+  created_day: z.string(),
+  sections: z.array(z.object({ name: z.string(), number_bars: z.number() })),
+  number_bars: z.number(),
+  layout: z.enum(["full", "deduplicated", "columnar"]),
+  size_bytes: z.number(),
+});
+
+// A Song stored in the deduplicated layout (see ./music_generator_lambda/music_generator/music_generator_types/deduplicated_song.py):
+// each distinct bar of a track once, and sections as indices into them. Expand it with expandSong.
+const SectionTrackEffects = z
+  .array(z.union([EffectInformation, FilterInformation]).nullable())
+  .nullish();
+
+export const DeduplicatedSection = z.object({
+  name: z.string(),
+  drums: z.array(z.number()),
+  bass: z.array(z.number()),
+  pad: z.array(z.number()),
+  drums_effects: SectionTrackEffects,
+  bass_effects: SectionTrackEffects,
+  pad_effects: SectionTrackEffects,
+});
+
+export const DeduplicatedSong = z.object({
+  layout: z.literal("deduplicated"),
+  drums: z.array(DrumBar.omit({ effects: true })),
+  bass: z.array(BassBar.omit({ effects: true })),
+  pad: z.array(PadBar.omit({ effects: true })),
+  sections: z.array(DeduplicatedSection),
+});
+
+// A Song stored in the columnar layout (see ./songCodec.ts). The driver serializes its data to JSON as base64.
+export const ColumnarSong = z.object({
+  layout: z.literal("columnar"),
+  data: z.union([z.string(), z.instanceof(Uint8Array)]),
+});
+
+// The song is in whichever layout it was stored in (see Config.song_storage_layout). Expand it with expandSong.
 export const SongRecord = z.object({
-  song: Song,
+  song: z.union([Song, DeduplicatedSong, ColumnarSong]),
   created_at_utc: z.string(),
 });
 
@@ -125,7 +169,51 @@ export type BarType = z.infer<typeof Bar>;
 export type SongSectionType = z.infer<typeof SongSection>;
 export type SongType = z.infer<typeof Song>;
 export type SongRecordType = z.infer<typeof SongRecord>;
+export type SongSummaryType = z.infer<typeof SongSummary>;
 export type FilterInformationType = z.infer<typeof FilterInformation>;
 export type EffectInformationType = z.infer<typeof EffectInformation>;
 export type EffectBarType = z.infer<typeof EffectBar>;
 export type SectionEffectsType = z.infer<typeof SectionEffects>;
+export type DeduplicatedSongType = z.infer<typeof DeduplicatedSong>;
+export type ColumnarSongType = z.infer<typeof ColumnarSong>;
+
+/**
+ * Expand a song stored in any layout into its sections of bars.
+ */
+export function expandSong(
+  song:
+    | DeduplicatedSongType
+    | ColumnarSongType
+    | { sections: SongSectionType[] },
+): { sections: SongSectionType[] } {
+  if ("layout" in song && song.layout === "columnar") {
+    return decodeSong(song.data);
+  }
+  if (!("layout" in song) || song.layout !== "deduplicated") {
+    return song as { sections: SongSectionType[] };
+  }
+  const effects = (
+    trackEffects: DeduplicatedSongType["sections"][number]["drums_effects"],
+    index: number,
+  ) => (trackEffects?.[index] ?? null) as EffectInformationType;
+
+  return {
+    sections: song.sections.map((section) => ({
+      name: section.name,
+      bars: section.drums.map((drums, i) => ({
+        drums: {
+          ...song.drums[drums],
+          effects: effects(section.drums_effects, i),
+        },
+        bass: {
+          ...song.bass[section.bass[i]],
+          effects: effects(section.bass_effects, i),
+        },
+        pad: {
+          ...song.pad[section.pad[i]],
+          effects: effects(section.pad_effects, i),
+        },
+      })),
+    })),
+  };
+}
@@ -0,0 +1,169 @@
+import {
+  type BarType,
+  type EffectInformationType,
+  type SongSectionType,
+} from "./musicData";
+
+// Decodes songs stored in the columnar layout. The format is documented in (and this must follow)
+// ./music_generator_lambda/music_generator/music_generator_types/song_codec.py.
+const SONG_MAGIC = "GGSN";
+const VERSION = 1;
+const STEPS = 16;
+const HAS_PAD = 1 << 3;
+const NO_EFFECTS = 0;
+const EFFECT_INFORMATION = 2;
+const VALUES_THOUSANDTHS = 1;
+
+class Reader {
+  private offset = 0;
+  private readonly view: DataView;
+
+  constructor(private readonly bytes: Uint8Array) {
+    this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  }
+
+  u8(): number {
+    const value = this.view.getUint8(this.offset);
+    this.offset += 1;
+    return value;
+  }
+
+  u16(): number {
+    const value = this.view.getUint16(this.offset, true);
+    this.offset += 2;
+    return value;
+  }
+
+  i16(): number {
+    const value = this.view.getInt16(this.offset, true);
+    this.offset += 2;
+    return value;
+  }
+
+  f64(): number {
+    const value = this.view.getFloat64(this.offset, true);
+    this.offset += 8;
+    return value;
+  }
+
+  string(length: number): string {
+    const value = new TextDecoder().decode(
+      this.bytes.subarray(this.offset, this.offset + length),
+    );
+    this.offset += length;
+    return value;
+  }
+
+  array(count: number, read: () => number): number[] {
+    return Array.from({ length: count }, read);
+  }
+}
+
+function readEffects(
+  reader: Reader,
+  filterTypes: string[],
+  numBars: number,
+): EffectInformationType[] {
+  const kinds = reader.array(numBars * 3, () => reader.u8());
+  const types = reader.array(numBars * 3, () => reader.u8());
+  const counts = reader.array(numBars * 3, () => reader.u8());
+  const numValues = counts.reduce((a, b) => a + b, 0);
+  const values =
+    reader.u8() === VALUES_THOUSANDTHS
+      ? reader.array(numValues, () => reader.i16() / 1000)
+      : reader.array(numValues, () => reader.f64());
+
+  let start = 0;
+  return kinds.map((kind, i) => {
+    if (kind === NO_EFFECTS) {
+      return null as unknown as EffectInformationType;
+    }
+    const filter = {
+      filter_type: filterTypes[types[i]],
+      filter_value: values.slice(start, start + counts[i]),
+    };
+    start += counts[i];
+    // Like the stored tree, effects are either a FilterInformation, or wrap one
+    return (
+      kind === EFFECT_INFORMATION ? { filter } : filter
+    ) as EffectInformationType;
+  });
+}
+
+/**
+ * Decode a song stored in the columnar layout.
+ *
+ * @param data The encoded song, or its base64 (as the driver serializes binary to JSON).
+ */
+export function decodeSong(data: Uint8Array | string): {
+  sections: SongSectionType[];
+} {
+  const reader = new Reader(
+    typeof data === "string" ? Buffer.from(data, "base64") : data,
+  );
+  const magic = reader.string(4);
+  const version = reader.u8();
+  if (magic !== SONG_MAGIC || version > VERSION) {
+    throw new Error(`Can't decode a song encoded as ${magic} ${version}.`);
+  }
+  const notes = ["0"];
+  for (let n = reader.u8(); n > 0; n--) {
+    notes.push(reader.string(reader.u8()));
+  }
+  const chords: string[][] = [];
+  for (let n = reader.u16(); n > 0; n--) {
+    chords.push(
+      reader.array(reader.u8(), () => reader.u8()).map((x) => notes[x]),
+    );
+  }
+  const filterTypes: string[] = [];
+  for (let n = reader.u8(); n > 0; n--) {
+    filterTypes.push(reader.string(reader.u16()));
+  }
+
+  const sections: SongSectionType[] = [];
+  for (let n = reader.u16(); n > 0; n--) {
+    const name = reader.string(reader.u16());
+    const numBars = reader.u16();
+    const flags = reader.array(numBars, () => reader.u8());
+    const drums = reader.array(numBars * 3, () => reader.u16());
+    const bass = reader.array(numBars * STEPS, () => reader.u8());
+    const readChord =
+      reader.u8() === 1 ? () => reader.u8() : () => reader.u16();
+    const pad = reader.array(
+      flags.filter((x) => x & HAS_PAD).length * STEPS,
+      readChord,
+    );
+    const effects = readEffects(reader, filterTypes, numBars);
+
+    const row = (b: number, d: number) =>
+      flags[b] & (1 << d)
+        ? Array.from({ length: STEPS }, (_, s) => (drums[b * 3 + d] >> s) & 1)
+        : null;
+    let padStart = 0;
+    const bars = flags.map((flag, b) => {
+      let chordSequence = null;
+      if (flag & HAS_PAD) {
+        chordSequence = pad
+          .slice(padStart, padStart + STEPS)
+          .map((x) => ({ notes: [...chords[x]] }));
+        padStart += STEPS;
+      }
+      return {
+        drums: {
+          hi_hat: row(b, 0),
+          kick: row(b, 1),
+          snare: row(b, 2),
+          effects: effects[b * 3],
+        },
+        bass: {
+          pattern: bass.slice(b * STEPS, (b + 1) * STEPS).map((x) => notes[x]),
+          effects: effects[b * 3 + 1],
+        },
+        pad: { chord_sequence: chordSequence, effects: effects[b * 3 + 2] },
+      } as unknown as BarType;
+    });
+    sections.push({ name, bars });
+  }
+  return { sections };
+}
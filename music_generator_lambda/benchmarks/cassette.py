@@ -0,0 +1,216 @@
+"""
+Records the completions of real LLM runs to a cassette, and replays them from a chat model stand-in, so that the
+workflows can run offline.
+
+Replayed completions are streamed as fast as possible, or paced to a time to first token and a token rate (fixed, or
+as recorded), so that what's measured is either the pure overhead of everything around the LLM, or a realistic run
+without the bill.
+"""
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.schema import LLMResult
+from langchain.schema.messages import BaseMessage
+from pydantic import BaseModel, Field
+
+from benchmarks.fake_chat_model import Completion, FakeChatModel
+
+
+class Interaction(BaseModel):
+    messages: List[List[str]] = Field(description="[type, content] of each message")
+    completion: str
+    time_to_first_token_seconds: Optional[float] = None
+    seconds: Optional[float] = None
+    # Streamed tokens, or None if the call wasn't streamed
+    tokens: Optional[int] = None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if (
+            not self.tokens
+            or self.seconds is None
+            or self.time_to_first_token_seconds is None
+            or self.seconds <= self.time_to_first_token_seconds
+        ):
+            return None
+        return self.tokens / (self.seconds - self.time_to_first_token_seconds)
+
+
+class CassetteMiss(LookupError):
+    """
+    A prompt that the cassette has no completion for.
+    """
+
+
+class Cassette:
+    """
+    Recorded completions, keyed on their prompt. A prompt that was sent more than once (e.g. the markup prompt, which
+    is the same every day, or a retried section) replays its completions in the order they were recorded, and then
+    starts over.
+
+    Sections run concurrently, so sections with identical prompts (no references, and the same descriptions) can
+    swap completions on replay, after which the prompts that reference them miss.
+    """
+
+    def __init__(self, interactions: Optional[List[Interaction]] = None):
+        self.interactions: List[Interaction] = []
+        self._by_key: Dict[str, List[Interaction]] = {}
+        self._replayed: Dict[str, int] = {}
+        for interaction in interactions or []:
+            self.add(interaction)
+
+    @staticmethod
+    def key(messages: Sequence[Sequence[str]]) -> str:
+        """
+        :return: A hash of the normalized [type, content] messages.
+        """
+        normalized = [(type_, content.strip()) for type_, content in messages]
+        return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+    def add(self, interaction: Interaction) -> None:
+        self.interactions.append(interaction)
+        self._by_key.setdefault(self.key(interaction.messages), []).append(interaction)
+
+    def next_interaction(self, messages: Sequence[BaseMessage]) -> Interaction:
+        """
+        :return: The next recorded completion of `messages`.
+        :raises CassetteMiss: If `messages` were never recorded.
+        """
+        key = self.key([(x.type, x.content) for x in messages])
+        recorded = self._by_key.get(key)
+        if not recorded:
+            raise CassetteMiss(
+                f"No recorded completion for the prompt:\n{messages[-1].content[:500]}"
+            )
+        replayed = self._replayed.get(key, 0)
+        self._replayed[key] = replayed + 1
+        return recorded[replayed % len(recorded)]
+
+    @classmethod
+    def load(cls, filename: str) -> "Cassette":
+        with open(filename) as f:
+            document = json.load(f)
+        return cls([Interaction.parse_obj(x) for x in document["interactions"]])
+
+    def save(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            json.dump(
+                {"version": 1, "interactions": [x.dict() for x in self.interactions]},
+                f,
+                indent=1,
+            )
+
+
+class CassetteRecorder(AsyncCallbackHandler):
+    """
+    Records every chat model call it's a callback of, and adds them to `cassette` when `flush`ed.
+
+    Streams that the caller stops reading early (see `_astream_bars`) never end as far as the callbacks are concerned,
+    so calls are only added once the run is over, in the order they were made, with what was streamed of them.
+    """
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        # By run ID, in the order the calls started
+        self._calls: Dict[UUID, Dict[str, Any]] = {}
+
+    async def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._calls[run_id] = {
+            "messages": [[x.type, x.content] for x in messages[0]],
+            "start": time.monotonic(),
+            "time_to_first_token_seconds": None,
+            "seconds": None,
+            "tokens": [],
+            "completion": None,
+        }
+
+    async def on_llm_new_token(
+        self, token: str, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        call = self._calls.get(run_id)
+        if call is None:
+            return
+        call["seconds"] = time.monotonic() - call["start"]
+        if call["time_to_first_token_seconds"] is None:
+            call["time_to_first_token_seconds"] = call["seconds"]
+        call["tokens"].append(token)
+
+    async def on_llm_end(
+        self, response: LLMResult, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        call = self._calls.get(run_id)
+        if call is not None:
+            call["seconds"] = time.monotonic() - call["start"]
+            call["completion"] = response.generations[0][0].text
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        # Replaying failures (e.g. a 429) as completions would be misleading, so they aren't recorded
+        self._calls.pop(run_id, None)
+
+    def flush(self) -> None:
+        for call in self._calls.values():
+            tokens = call["tokens"]
+            if call["completion"] is None and not tokens:
+                continue
+            self.cassette.add(
+                Interaction(
+                    messages=call["messages"],
+                    completion="".join(tokens)
+                    if call["completion"] is None
+                    else call["completion"],
+                    time_to_first_token_seconds=call["time_to_first_token_seconds"],
+                    seconds=call["seconds"],
+                    tokens=len(tokens) or None,
+                )
+            )
+        self._calls.clear()
+
+
+class ReplayChatModel(FakeChatModel):
+    """
+    A chat model that replays the completions of a cassette.
+
+    By default completions are streamed as fast as they're read, so that a run measures everything but the LLM. Set
+    `time_to_first_token_seconds` and `tokens_per_second`, or `recorded_timing`, to pace them.
+    """
+
+    cassette: Cassette
+    time_to_first_token_seconds: float = 0.0
+    # None for no limit
+    tokens_per_second: Optional[float] = None
+    # Pace each completion as it was recorded, where the cassette has its timing
+    recorded_timing: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    async def _acompletion(self, messages: List[BaseMessage]) -> Completion:
+        interaction = self.cassette.next_interaction(messages)
+        if self.recorded_timing and interaction.time_to_first_token_seconds is not None:
+            return Completion(
+                interaction.completion,
+                interaction.time_to_first_token_seconds,
+                interaction.tokens_per_second or self.tokens_per_second,
+            )
+        return Completion(
+            interaction.completion,
+            self.time_to_first_token_seconds,
+            self.tokens_per_second,
+        )
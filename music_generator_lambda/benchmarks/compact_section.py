@@ -0,0 +1,53 @@
+"""
+Compares the memory a section takes as SongSection models with its CompactSection.
+
+    python -m benchmarks.compact_section [--bars 64]
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Any, Callable, Tuple
+
+from music_generator.music_generator_types.base_song_types import Bar, SongSection
+from music_generator.music_generator_types.compact_section import CompactSection
+
+
+def allocated(build: Callable[[], Any]) -> Tuple[Any, int, int]:
+    """
+    :return: What `build` returned, the bytes it left allocated, and how many objects it left allocated.
+    """
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    return result, size, len(gc.get_objects()) - objects
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bars", type=int, default=64)
+    args = parser.parse_args()
+
+    text = "\n".join(Bar.example().to_llm_format() for _ in range(args.bars))
+    section, section_size, section_objects = allocated(
+        lambda: SongSection.from_llm_format(text, name="verse", length=args.bars)
+    )
+    compact, compact_size, compact_objects = allocated(
+        lambda: CompactSection.from_section(section)
+    )
+    assert compact.to_section() == section
+
+    print(f"{args.bars} bars:")
+    print(
+        f"  SongSection     {section_size / 1024:8.1f}KiB  {section_objects:6d} GC tracked objects"
+    )
+    print(
+        f"  CompactSection  {compact_size / 1024:8.1f}KiB  {compact_objects:6d} GC tracked objects"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Synthetic but realistic LLM outputs (and the models they parse into), for benchmarking.
+
+Everything is generated from a seeded `random.Random`, so a corpus is the same on every run and every commit.
+"""
+import random
+from typing import List, Literal
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BarEncoding,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    Song,
+    SongRecord,
+    SongSection,
+)
+from music_generator.music_generator_types.effect_types import SectionEffects
+from music_generator.music_generator_types.markup_types import MusicalMarkup
+from music_generator.music_generator_types.metrics_types import (
+    GenerationMetrics,
+    StageAttempt,
+)
+
+# "full": a chord every beat. "short": 1, 2 or 4 chords, which get expanded to 16. "silent": no pad at all.
+PadStyle = Literal["full", "short", "silent"]
+Malformation = Literal[
+    "duplicate_row", "ragged_row", "invalid_note", "missing_pad", "unclosed_bar"
+]
+MALFORMATIONS: List[Malformation] = [
+    "duplicate_row",
+    "ragged_row",
+    "invalid_note",
+    "missing_pad",
+    "unclosed_bar",
+]
+
+_HI_HATS = [
+    [0, 0, 1, 0] * 4,
+    [1, 0, 1, 0] * 4,
+    [1, 1, 1, 1] * 4,
+    [0, 1, 1, 1] * 4,
+]
+_KICKS = [[1, 0, 0, 0] * 4, [1, 0, 0, 1, 0, 0, 1, 0] * 2, [1] + [0] * 15]
+_SNARES = [[0, 0, 0, 0, 1, 0, 0, 0] * 2, [0] * 16, [0, 0, 0, 0, 1, 0, 0, 1] * 2]
+_ROOTS = ["C", "D", "Eb", "F", "G", "Ab", "Bb", "A", "F#", "Db"]
+# Semitone offsets of the tones of a minor seventh chord
+_CHORD_SHAPE = [0, 3, 7, 10]
+_SHARPS = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+_FLATS = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B"]
+
+
+def _spell(midi: int, flats: bool) -> str:
+    return f"{(_FLATS if flats else _SHARPS)[midi % 12]}{midi // 12 - 1}"
+
+
+def _midi(root: str, octave: int) -> int:
+    names = _FLATS if "b" in root else _SHARPS
+    return (octave + 1) * 12 + names.index(root)
+
+
+def random_bar(rng: random.Random, pad: PadStyle = "full") -> Bar:
+    """
+    :return: A house music bar: four to the floor drums, a syncopated bass line and minor seventh chords.
+    """
+    root = rng.choice(_ROOTS)
+    flats = "b" in root
+    bass_root = _midi(root, 2)
+
+    bass = ["0"] * 16
+    for step in rng.sample(range(16), rng.randint(2, 8)):
+        bass[step] = _spell(bass_root + rng.choice([0, 0, 7, 12, 10]), flats)
+
+    if pad == "silent":
+        chords = [Chord(notes=[]) for _ in range(16)]
+    else:
+        length = 16 if pad == "full" else rng.choice([1, 2, 4])
+        chords = []
+        for step in range(length):
+            if pad == "full" and step % 4:
+                chords.append(Chord(notes=[]))
+                continue
+            chord_root = _midi(root, 3) + rng.choice([0, 5, 7, 8])
+            chords.append(
+                Chord(notes=[_spell(chord_root + x, flats) for x in _CHORD_SHAPE])
+            )
+
+    return Bar(
+        drums=DrumBar(
+            hi_hat=list(rng.choice(_HI_HATS)),
+            kick=list(rng.choice(_KICKS)),
+            snare=list(rng.choice(_SNARES)),
+        ),
+        bass=BassBar(pattern=bass),
+        pad=PadBar(chord_sequence=chords),
+    )
+
+
+def random_section(
+    rng: random.Random, num_bars: int, pad: PadStyle = "full", name: str = "verse-1"
+) -> SongSection:
+    # Sections repeat themselves, like real ones do (and like compact references exploit)
+    motif = [random_bar(rng, pad) for _ in range(rng.choice([1, 2, 4]))]
+    bars = [
+        motif[i % len(motif)].copy(deep=True)
+        if rng.random() < 0.7
+        else random_bar(rng, pad)
+        for i in range(num_bars)
+    ]
+    return SongSection(bars=bars, name=name)
+
+
+def section_text(
+    section: SongSection, encoding: BarEncoding = "full", pad: PadStyle = "full"
+) -> str:
+    """
+    :return: The section as the LLM writes it, chatter and all.
+    """
+    if encoding == "compact":
+        bars = [
+            bar.to_compact_format(section.bars[:i])
+            for i, bar in enumerate(section.bars)
+        ]
+    else:
+        bars = [_bar_text(bar, short_pad=pad == "short") for bar in section.bars]
+    text = ",\n".join(bars)
+    return f"Here is the {section.name} section:\n\n{text}\n\nLet me know if you want any changes!"
+
+
+def _bar_text(bar: Bar, short_pad: bool) -> str:
+    text = bar.to_llm_format()
+    if not short_pad or not bar.pad.chord_sequence:
+        return text
+    # Only write the chords that sound, e.g. "pad [C3 Eb3 G3 Bb3] [F3 Ab3 C4 Eb4]", as the LLM often does
+    chords = bar.pad.chord_sequence
+    for step in (16, 8, 4, 2, 1):
+        if all(chords[i] == chords[i - i % step] for i in range(16)):
+            break
+    pad = "pad " + " ".join(f"[{' '.join(x.notes)}]" for x in chords[::step])
+    return "\n".join(pad if x.startswith("pad ") else x for x in text.split("\n"))
+
+
+def malformed_section_text(
+    rng: random.Random, section: SongSection, malformation: Malformation
+) -> str:
+    """
+    :return: The section as the LLM writes it, with one of its bars broken.
+    """
+    bars = [bar.to_llm_format() for bar in section.bars]
+    index = rng.randrange(len(bars))
+    lines = bars[index].split("\n")
+    if malformation == "duplicate_row":
+        lines.insert(2, lines[1])
+    elif malformation == "ragged_row":
+        lines[2] = lines[2].rsplit(" ", rng.randint(1, 3))[0]
+    elif malformation == "invalid_note":
+        lines[4] = lines[4].replace("0", "H2", 1)
+    elif malformation == "missing_pad":
+        lines = [x for x in lines if not x.startswith("pad ")]
+    elif malformation == "unclosed_bar":
+        lines = lines[:-1]
+    bars[index] = "\n".join(lines)
+    return ",\n".join(bars)
+
+
+def outline_text(rng: random.Random, num_sections: int) -> str:
+    """
+    :return: A markup outline, as `generate_markup` gets it from the LLM.
+    """
+    names = ["intro"] + [
+        f"{rng.choice(['verse', 'chorus', 'breakdown', 'drop'])}-{i}"
+        for i in range(1, num_sections - 1)
+    ]
+    names.append("outro")
+    sections = []
+    for i, name in enumerate(names):
+        reference = f" like %{names[i - 1]}" if i and rng.random() < 0.5 else ""
+        sections.append(
+            f"##{name} ({rng.choice([4, 8, 16])} bars)\n"
+            f"*Pad - Warm minor seventh chords, slowly opening up{reference}\n"
+            f"*Bass - Syncopated root notes an octave below the pad{reference}\n"
+            f"*Drums - Four to the floor kick with open hi-hats on the off beats\n"
+            f"*Effects - Lowpass filter on the pad, rising over the section"
+        )
+    return "\n\n".join(sections)
+
+
+def effects_text(rng: random.Random, num_bars: int) -> str:
+    """
+    :return: Section effects, as `generate_section_effects` gets them from the LLM.
+    """
+    return "\n".join(
+        f"#{instrument} {rng.choice(['lowpass', 'hipass', 'bandpass'])} "
+        + " ".join(f"{rng.random():.1f}" for _ in range(num_bars))
+        for instrument in ("pad", "bass", "drums")
+    )
+
+
+def song_record(
+    rng: random.Random, num_sections: int = 8, bars_per_section: int = 8
+) -> SongRecord:
+    """
+    :return: A complete record, effects and metrics included, as `daily_generate_song_and_persist` stores it.
+    """
+    markup = MusicalMarkup.from_outline(outline_text(rng, num_sections))
+    song = Song()
+    metrics = GenerationMetrics()
+    for name in markup.sections:
+        section = random_section(rng, bars_per_section, name=name)
+        section.apply_effects(
+            SectionEffects.from_llm_text(
+                effects_text(rng, bars_per_section), name=name, sample_number=1
+            )
+        )
+        song.append_section(section)
+        for stage in ("section", "effects"):
+            metrics.add(
+                StageAttempt(
+                    stage=stage,
+                    section=name,
+                    wall_time_seconds=rng.uniform(5, 60),
+                    prompt_tokens=rng.randint(500, 2000),
+                    completion_tokens=rng.randint(100, 3000),
+                    llm_calls=1,
+                )
+            )
+    return SongRecord(
+        song=song, created_at_utc="2024-01-01T12:00:00", markup=markup, metrics=metrics
+    )
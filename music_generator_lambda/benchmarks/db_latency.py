@@ -0,0 +1,104 @@
+"""
+Measures the latency of the database operations the workflows make, with a new MongoClient per operation (as the
+workflows used to connect) and with the client shared by the process (`db.get_mongo_client`).
+
+    python -m benchmarks.db_latency [--operations 20]
+
+Connects to the database in `.env`. Only a scratch collection is written to, and it's dropped afterwards.
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from bson.raw_bson import RawBSONDocument
+from dotenv import dotenv_values
+from pymongo.collection import Collection
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+
+from music_generator.db import close_mongo_clients, get_database
+from music_generator.music_generator_types.base_song_types import Config
+
+SCRATCH_COLLECTION = "benchmark_db_latency"
+
+Operation = Callable[[Collection], Any]
+
+
+def operations() -> Dict[str, Operation]:
+    document = {"created_at_utc": "2000-01-01T12:00:00+00:00", "song": {}}
+    return {
+        "find_one": lambda collection: collection.find_one(
+            {"created_at_utc": document["created_at_utc"]}
+        ),
+        "count_documents": lambda collection: collection.count_documents({}),
+        "insert_one": lambda collection: collection.insert_one(dict(document)),
+        "delete_one": lambda collection: collection.delete_one(
+            {"created_at_utc": document["created_at_utc"]}
+        ),
+    }
+
+
+def fresh_client(config: Config, operation: Operation) -> float:
+    """
+    :return: The seconds `operation` takes on a client of its own, connection included.
+    """
+    start = time.perf_counter()
+    client = MongoClient(  # type: ignore
+        config.atlas_cluster_uri,
+        server_api=ServerApi("1"),
+        document_class=RawBSONDocument,
+    )
+    operation(client.get_database(config.db_name)[SCRATCH_COLLECTION])
+    seconds = time.perf_counter() - start
+    # Not timed, as the workflows never closed theirs
+    client.close()
+    return seconds
+
+
+def shared_client(config: Config, operation: Operation) -> float:
+    """
+    :return: The seconds `operation` takes on the shared client.
+    """
+    start = time.perf_counter()
+    operation(get_database(config)[SCRATCH_COLLECTION])
+    return time.perf_counter() - start
+
+
+def _summary(seconds: List[float]) -> str:
+    p95 = statistics.quantiles(seconds, n=20)[-1] if len(seconds) > 1 else seconds[0]
+    return f"{statistics.median(seconds) * 1000:8.1f}ms {p95 * 1000:8.1f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--operations", type=int, default=20, help="How many times to time each."
+    )
+    args = parser.parse_args()
+
+    config = Config(**dotenv_values())  # type: ignore
+    # The first operation on the shared client connects, like a cold Lambda's does
+    start = time.perf_counter()
+    get_database(config).command("ping")
+    print(f"Connecting the shared client: {(time.perf_counter() - start) * 1000:.1f}ms")
+    try:
+        print(
+            f"  {'':16s} {'new client: median':>18s} {'p95':>9s} {'shared: median':>15s} {'p95':>9s}"
+        )
+        for name, operation in operations().items():
+            fresh = [fresh_client(config, operation) for _ in range(args.operations)]
+            shared = [shared_client(config, operation) for _ in range(args.operations)]
+            print(
+                f"  {name:16s} {_summary(fresh)}   {_summary(shared)}"
+                f"  ({statistics.median(fresh) / statistics.median(shared):.1f}x faster)"
+            )
+    finally:
+        get_database(config).drop_collection(SCRATCH_COLLECTION)
+        close_mongo_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+The base of the chat model stand-ins, which stream made up (see `synthetic_chat_model.py`) or recorded (see
+`cassette.py`) completions in place of OpenAI's.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain.schema.output import ChatGenerationChunk
+
+# Completions are streamed in tokens of this many characters, like `estimate_tokens` assumes
+CHARS_PER_TOKEN = 4
+
+
+class Completion(NamedTuple):
+    text: str
+    time_to_first_token_seconds: float = 0.0
+    # None for no limit
+    tokens_per_second: Optional[float] = None
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Streams the completions that `_acompletion` makes up, paced to their time to first token and token rate. Only the
+    async API is implemented, as that's all the workflows use.
+    """
+
+    # Reported as the model, so that costs are estimated as they would be for the real one
+    model_name: str = "gpt-4"
+    # Multiplies every simulated delay, e.g. 0.1 to run ten times as fast
+    time_scale: float = 1.0
+
+    async def _acompletion(self, messages: List[BaseMessage]) -> Completion:
+        raise NotImplementedError()
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    @staticmethod
+    def _tokens(text: str) -> Iterator[str]:
+        for i in range(0, len(text), CHARS_PER_TOKEN):
+            yield text[i : i + CHARS_PER_TOKEN]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        raise NotImplementedError("Only the async API is simulated.")
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = ""
+        async for chunk in self._astream(messages, stop=stop, run_manager=run_manager):
+            text += chunk.text
+        # Like a streamed OpenAI completion, there's no token usage, so it's estimated from the streamed tokens
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"model_name": self.model_name},
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        completion = await self._acompletion(messages)
+        tokens_per_second = (
+            completion.tokens_per_second / self.time_scale
+            if completion.tokens_per_second
+            else None
+        )
+        start = (
+            time.monotonic() + completion.time_to_first_token_seconds * self.time_scale
+        )
+        for i, token in enumerate(self._tokens(completion.text)):
+            # Sleep only when ahead of the schedule, rather than once a token, which would add up to far too long
+            ahead = start + (i / tokens_per_second if tokens_per_second else 0.0)
+            ahead -= time.monotonic()
+            await asyncio.sleep(ahead if ahead > 0.001 else 0)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,90 @@
+"""
+Reports how long importing the Lambda handler (and the generation stack it loads on first use) takes, and which
+modules the time goes to.
+
+Each measurement runs in a fresh interpreter with `-X importtime`, so nothing is already imported.
+
+    python -m benchmarks.import_time [--top 15] [--repeat 3]
+
+Exits with 1 if a stage goes over its budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a cold start imports, and what the first invocation imports on top of it
+STAGES = {
+    "lambda_handler": "import lambda_handler",
+    "first invocation": "import lambda_handler; import music_generator.workflows.daily_generate_song; import boto3.session",
+}
+
+# Median seconds each stage may take. The handler's own import is what every cold start pays before it can do anything.
+BUDGETS = {"lambda_handler": 0.5}
+
+
+def measure(statement: str) -> Tuple[float, Dict[str, float]]:
+    """
+    :return: The total import time in seconds, and the import time of each top level package (its modules' own time,
+        excluding the packages they import in turn).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        packages[name.strip().split(".")[0]] += int(self_time) / 1e6
+    total = sum(packages.values())
+    return total, packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    over_budget = []
+    for stage, statement in STAGES.items():
+        runs: List[Tuple[float, Dict[str, float]]] = [
+            measure(statement) for _ in range(args.repeat)
+        ]
+        totals = [x[0] for x in runs]
+        print(
+            f"{stage}: median {statistics.median(totals) * 1000:.0f}ms "
+            f"(min {min(totals) * 1000:.0f}ms, max {max(totals) * 1000:.0f}ms over {args.repeat} runs)"
+        )
+        budget = BUDGETS.get(stage)
+        if budget is not None and statistics.median(totals) > budget:
+            over_budget.append(stage)
+            print(f"  Over its budget of {budget * 1000:.0f}ms!")
+        packages: Dict[str, List[float]] = defaultdict(list)
+        for _, run in runs:
+            for name, seconds in run.items():
+                packages[name].append(seconds)
+        ranked = sorted(
+            packages.items(), key=lambda x: statistics.median(x[1]), reverse=True
+        )
+        for name, seconds in ranked[: args.top]:
+            print(f"  {statistics.median(seconds) * 1000:8.1f}ms  {name}")
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Drives the daily and backfill workflows over hundreds of simulated days, against a synthetic model (see
+`synthetic_chat_model.py`) and an in-memory database (see `local_db.py`), to size concurrency and Lambda memory
+before running large backfills for real.
+
+    python -m benchmarks.load_test backfill --days 300 --workers 2 4 8 --requests-per-minute 200 --tokens-per-minute 40000
+    python -m benchmarks.load_test daily --days 100 --rate-limit-rate 0.05 --malformed-rate 0.1
+
+Simulated delays (latency, token rate, 429 backoff and the rate limit window) are multiplied by `--time-scale`, and
+the times of songs and of stage attempts that called the LLM are divided by it, so a run takes a fraction of the time
+it simulates. Everything else in those (streaming, parsing, storing) takes as long as it does, so it's overstated by
+1 / time scale. The report warns when that's most of the run (the CPU was busy for most of it), in which case raise
+the scale. Attempts that didn't call the LLM (e.g. encoding songs, or cache hits) are reported separately, as they
+took.
+
+Each scenario runs in a fresh process, so that its peak memory is its own.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import logging
+import multiprocessing
+import resource
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from benchmarks.local_db import LocalMongoClient
+from benchmarks.offline_daily import OFFLINE_CONFIG
+from benchmarks.synthetic_chat_model import Lognormal, SyntheticChatModel
+from music_generator.db import find_song_records, set_mongo_client
+from music_generator.utilities.rate_limit import RateLimiter
+from music_generator.workflows.backfill_song_days import afill_missing_songs
+from music_generator.workflows.daily_generate_song import (
+    adaily_generate_song_and_persist,
+)
+
+
+class Scenario(BaseModel):
+    workflow: Literal["daily", "backfill"]
+    days: int
+    workers: int
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    time_to_first_token: Lognormal
+    tokens_per_second: Lognormal
+    rate_limit_rate: float = 0.0
+    malformed_rate: float = 0.0
+    time_scale: float = 0.05
+    seed: int = 0
+
+
+class Percentiles(BaseModel):
+    count: int
+    p50: float
+    p95: float
+    p99: float
+
+    @classmethod
+    def of(cls, values: List[float]) -> "Percentiles":
+        if len(values) < 2:
+            value = values[0] if values else 0.0
+            return cls(count=len(values), p50=value, p95=value, p99=value)
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+        return cls(count=len(values), p50=cuts[49], p95=cuts[94], p99=cuts[98])
+
+
+class LoadReport(BaseModel):
+    scenario: Scenario
+    songs: int
+    failed: int
+    # Simulated
+    seconds: float
+    song_seconds: Percentiles
+    # Simulated seconds of each attempt at each stage that called the LLM, of the songs that were stored
+    stage_seconds: Dict[str, Percentiles]
+    # Real (unscaled) seconds of each attempt at each stage that didn't, of the songs that were stored
+    local_stage_seconds: Dict[str, Percentiles]
+    # Attempts per (song, stage, section), i.e. parse failures that tenacity retried
+    stage_attempts: Dict[str, float]
+    requests: int
+    rate_limited_requests: int
+    malformed_completions: int
+    # LLM requests (including rate limited ones) per request that a run without faults would have made
+    retry_amplification: float
+    baseline_rss_mib: float
+    peak_rss_mib: float
+    # The fraction of the run's wall time that the CPU was busy
+    cpu_fraction: float
+
+    @property
+    def songs_per_hour(self) -> float:
+        return self.songs / self.seconds * 3600 if self.seconds else 0.0
+
+
+def _rss_mib() -> float:
+    # Peak resident set size of the process so far. Kilobytes on Linux (which Lambda is).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _adaily(scenario: Scenario, llm: SyntheticChatModel) -> List[float]:
+    """
+    A song for each day, `scenario.workers` at a time, like overlapping invocations of a warm Lambda.
+
+    :return: The wall time of each song that succeeded.
+    """
+    today = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=12, minute=0, second=0, microsecond=0
+    )
+    semaphore = asyncio.Semaphore(scenario.workers)
+    song_seconds = []
+
+    async def _song(d: datetime.datetime) -> None:
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                await adaily_generate_song_and_persist(
+                    config=OFFLINE_CONFIG, d=d, llm=llm
+                )
+            except Exception:
+                return
+            song_seconds.append(time.monotonic() - start)
+
+    await asyncio.gather(
+        *[_song(today - datetime.timedelta(days=i)) for i in range(scenario.days)]
+    )
+    return song_seconds
+
+
+async def _abackfill(scenario: Scenario, llm: SyntheticChatModel) -> List[float]:
+    """
+    :return: The wall time of each song that succeeded.
+    """
+
+    report = await afill_missing_songs(
+        config=OFFLINE_CONFIG,
+        num_days=scenario.days,
+        max_workers=scenario.workers,
+        llm=llm,
+        # The same budgets, over a scaled minute
+        rate_limiter=RateLimiter(
+            requests_per_minute=scenario.requests_per_minute,
+            tokens_per_minute=scenario.tokens_per_minute,
+            window_seconds=60 * scenario.time_scale,
+        ),
+    )
+    return [x.seconds for x in report.succeeded]
+
+
+def run_scenario(scenario: Scenario) -> LoadReport:
+    # The workflows log (and print) every song and stage
+    logging.disable(logging.CRITICAL)
+
+    client = LocalMongoClient()
+    set_mongo_client(OFFLINE_CONFIG, client)
+    llm = SyntheticChatModel(
+        seed=scenario.seed,
+        time_to_first_token=scenario.time_to_first_token,
+        tokens_per_second=scenario.tokens_per_second,
+        rate_limit_rate=scenario.rate_limit_rate,
+        malformed_rate=scenario.malformed_rate,
+        time_scale=scenario.time_scale,
+    )
+    baseline_rss = _rss_mib()
+
+    start = time.monotonic()
+    cpu_start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_seconds = asyncio.run(
+            _adaily(scenario, llm)
+            if scenario.workflow == "daily"
+            else _abackfill(scenario, llm)
+        )
+    seconds = time.monotonic() - start
+    cpu_seconds = time.process_time() - cpu_start
+
+    stage_seconds: Dict[str, List[float]] = defaultdict(list)
+    local_stage_seconds: Dict[str, List[float]] = defaultdict(list)
+    attempts: Dict[str, int] = defaultdict(int)
+    units: Dict[str, set] = defaultdict(set)
+    ideal_requests = 0
+    for song_id, song_record in find_song_records(OFFLINE_CONFIG):
+        assert song_record.metrics is not None
+        # The markup, and the notes and effects of every section
+        ideal_requests += 1 + 2 * len(song_record.markup.sections)
+        for attempt in song_record.metrics.attempts:
+            if attempt.llm_calls:
+                stage_seconds[attempt.stage].append(
+                    attempt.wall_time_seconds / scenario.time_scale
+                )
+            else:
+                # Nothing simulated to scale
+                local_stage_seconds[attempt.stage].append(attempt.wall_time_seconds)
+            attempts[attempt.stage] += 1
+            units[attempt.stage].add((song_id, attempt.section))
+    songs = len(song_seconds)
+    failed = scenario.days - songs
+    if songs and failed:
+        # Failed songs aren't stored, so assume they'd have been like the rest
+        ideal_requests += ideal_requests * failed // songs
+
+    return LoadReport(
+        scenario=scenario,
+        songs=songs,
+        failed=failed,
+        seconds=seconds / scenario.time_scale,
+        song_seconds=Percentiles.of([x / scenario.time_scale for x in song_seconds]),
+        stage_seconds={k: Percentiles.of(v) for k, v in sorted(stage_seconds.items())},
+        local_stage_seconds={
+            k: Percentiles.of(v) for k, v in sorted(local_stage_seconds.items())
+        },
+        stage_attempts={k: v / len(units[k]) for k, v in sorted(attempts.items())},
+        requests=llm.requests,
+        rate_limited_requests=llm.rate_limited_requests,
+        malformed_completions=llm.malformed_completions,
+        retry_amplification=llm.requests / ideal_requests if ideal_requests else 0.0,
+        baseline_rss_mib=baseline_rss,
+        peak_rss_mib=_rss_mib(),
+        cpu_fraction=cpu_seconds / seconds,
+    )
+
+
+def print_report(report: LoadReport) -> None:
+    scenario = report.scenario
+    print(
+        f"{scenario.workflow}: {scenario.days} days, {scenario.workers} workers"
+        f" ({scenario.requests_per_minute} requests/min, {scenario.tokens_per_minute} tokens/min)"
+    )
+    print(
+        f"  {report.songs} songs ({report.failed} failed) in {report.seconds / 3600:.2f}h:"
+        f" {report.songs_per_hour:.1f} songs/hour"
+    )
+    print(
+        f"  {report.requests} LLM requests ({report.rate_limited_requests} rate limited,"
+        f" {report.malformed_completions} malformed): {report.retry_amplification:.2f}x retry amplification"
+    )
+    print(
+        f"  Peak memory {report.peak_rss_mib:.0f}MiB ({report.peak_rss_mib - report.baseline_rss_mib:.0f}MiB"
+        " over the baseline)"
+    )
+    if report.cpu_fraction > 0.5:
+        print(
+            f"  The CPU was busy for {report.cpu_fraction:.0%} of the run, so the times are overstated."
+            " Raise --time-scale."
+        )
+    print(f"  {'':12s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'attempts':>9s}")
+    rows = [("song", report.song_seconds, None)] + [
+        (stage, percentiles, report.stage_attempts[stage])
+        for stage, percentiles in report.stage_seconds.items()
+    ]
+    for name, percentiles, attempts in rows:
+        print(
+            f"  {name:12s} {percentiles.p50:7.1f}s {percentiles.p95:7.1f}s {percentiles.p99:7.1f}s"
+            + (f" {attempts:9.2f}" if attempts is not None else "")
+        )
+    if report.local_stage_seconds:
+        print("  Without LLM calls (real time):")
+    for name, percentiles in report.local_stage_seconds.items():
+        attempts = report.stage_attempts[name]
+        print(
+            f"  {name:12s} {percentiles.p50 * 1000:6.1f}ms {percentiles.p95 * 1000:6.1f}ms"
+            f" {percentiles.p99 * 1000:6.1f}ms {attempts:9.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("workflow", choices=["daily", "backfill"])
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[4],
+        help="Songs generated at once. Several to compare them.",
+    )
+    parser.add_argument("--requests-per-minute", type=int, default=None)
+    parser.add_argument("--tokens-per-minute", type=int, default=None)
+    parser.add_argument("--time-to-first-token-median", type=float, default=1.5)
+    parser.add_argument("--time-to-first-token-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second-median", type=float, default=30)
+    parser.add_argument("--tokens-per-second-sigma", type=float, default=0.25)
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0.0,
+        help="The probability of a request getting a 429.",
+    )
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.0,
+        help="The probability of a completion being malformed.",
+    )
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        scenario = Scenario(
+            workflow=args.workflow,
+            days=args.days,
+            workers=workers,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            time_to_first_token=Lognormal(
+                median=args.time_to_first_token_median,
+                sigma=args.time_to_first_token_sigma,
+            ),
+            tokens_per_second=Lognormal(
+                median=args.tokens_per_second_median,
+                sigma=args.tokens_per_second_sigma,
+            ),
+            rate_limit_rate=args.rate_limit_rate,
+            malformed_rate=args.malformed_rate,
+            time_scale=args.time_scale,
+            seed=args.seed,
+        )
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            print_report(executor.submit(run_scenario, scenario).result())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+An in-memory stand-in for the parts of pymongo's MongoClient that the workflows use, for running them offline.
+
+Documents are stored BSON encoded and read back as RawBSONDocuments, like `get_mongo_client`'s client returns them,
+so the encoding and decoding costs of real persistence are still paid. Install it with `db.set_mongo_client`.
+"""
+import threading
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+
+Filter = Mapping[str, Any]
+T = TypeVar("T")
+
+_COMPARISONS = {
+    "$eq": lambda value, x: value == x,
+    "$ne": lambda value, x: value != x,
+    "$gt": lambda value, x: value is not None and value > x,
+    "$gte": lambda value, x: value is not None and value >= x,
+    "$lt": lambda value, x: value is not None and value < x,
+    "$lte": lambda value, x: value is not None and value <= x,
+    "$in": lambda value, x: value in x,
+    # Only the BSON types that songs are queried by
+    "$type": lambda value, x: x == "date" and isinstance(value, datetime),
+}
+
+
+class LocalCollection:
+    def __init__(self) -> None:
+        self._documents: Dict[ObjectId, bytes] = {}
+        self._lock = threading.Lock()
+
+    def insert_one(
+        self, document: Dict[str, Any], session: Optional["LocalSession"] = None
+    ) -> InsertOneResult:
+        # Like pymongo, the ID is added to the inserted document
+        document.setdefault("_id", ObjectId())
+        encoded = bson.encode(document)
+        with self._lock:
+            self._documents[document["_id"]] = encoded
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    def find(
+        self,
+        filter: Optional[Filter] = None,
+        projection: Optional[Mapping[str, Any]] = None,
+        sort: Optional[List[Tuple[str, int]]] = None,
+    ) -> Iterator[RawBSONDocument]:
+        """
+        Supports projections that include top level fields, and sorting on top level fields.
+        """
+        with self._lock:
+            documents = list(self._documents.values())
+        matching = [
+            x for x in map(RawBSONDocument, documents) if _matches(x, filter or {})
+        ]
+        for field, direction in reversed(sort or []):
+            matching.sort(key=lambda x: x[field], reverse=direction < 0)
+        for document in matching:
+            if projection is None:
+                yield document
+                continue
+            fields = [k for k, v in projection.items() if v]
+            if projection.get("_id", 1):
+                fields.insert(0, "_id")
+            yield RawBSONDocument(
+                bson.encode({k: document[k] for k in fields if k in document})
+            )
+
+    def find_one(self, filter: Optional[Filter] = None) -> Optional[RawBSONDocument]:
+        return next(self.find(filter), None)
+
+    def count_documents(self, filter: Filter) -> int:
+        return sum(1 for _ in self.find(filter))
+
+    def update_one(self, filter: Filter, update: Mapping[str, Any]) -> UpdateResult:
+        """
+        Supports `$set` and `$push`, on top level and dotted fields.
+        """
+        with self._lock:
+            for _id, encoded in self._documents.items():
+                document = bson.decode(encoded)
+                if not _matches(document, filter):
+                    continue
+                for operator, fields in update.items():
+                    for path, value in fields.items():
+                        *parents, field = path.split(".")
+                        target = document
+                        for parent in parents:
+                            target = target.setdefault(parent, {})
+                        if operator == "$set":
+                            target[field] = value
+                        elif operator == "$push":
+                            target.setdefault(field, []).append(value)
+                        else:
+                            raise NotImplementedError(f"Unsupported update {operator}")
+                self._documents[_id] = bson.encode(document)
+                return UpdateResult({"n": 1, "nModified": 1}, acknowledged=True)
+        return UpdateResult({"n": 0, "nModified": 0}, acknowledged=True)
+
+    def delete_one(
+        self, filter: Filter, session: Optional["LocalSession"] = None
+    ) -> DeleteResult:
+        return self._delete(filter, limit=1)
+
+    def delete_many(
+        self, filter: Filter, session: Optional["LocalSession"] = None
+    ) -> DeleteResult:
+        return self._delete(filter, limit=None)
+
+    def _delete(self, filter: Filter, limit: Optional[int]) -> DeleteResult:
+        with self._lock:
+            deleted: List[ObjectId] = []
+            for _id, encoded in self._documents.items():
+                if limit is not None and len(deleted) >= limit:
+                    break
+                if _matches(RawBSONDocument(encoded), filter):
+                    deleted.append(_id)
+            for _id in deleted:
+                del self._documents[_id]
+        return DeleteResult({"n": len(deleted)}, acknowledged=True)
+
+    def create_indexes(self, indexes: List[Any]) -> List[str]:
+        # Every query scans all the documents, so there's nothing to index
+        return []
+
+    @property
+    def stored_bytes(self) -> int:
+        """
+        :return: The total BSON size of the stored documents.
+        """
+        with self._lock:
+            return sum(len(x) for x in self._documents.values())
+
+
+class LocalDatabase:
+    def __init__(self) -> None:
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            return self._collections.setdefault(name, LocalCollection())
+
+    def __getitem__(self, name: str) -> LocalCollection:
+        return self.get_collection(name)
+
+
+class LocalSession:
+    """
+    Sessions are accepted so that transactional writes run, but aren't isolated: each write is applied as it's made.
+    """
+
+    def __enter__(self) -> "LocalSession":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def with_transaction(self, callback: Callable[["LocalSession"], T]) -> T:
+        return callback(self)
+
+
+class LocalMongoClient:
+    def __init__(self) -> None:
+        self._databases: Dict[str, LocalDatabase] = {}
+        self._lock = threading.Lock()
+
+    def get_database(self, name: str) -> LocalDatabase:
+        with self._lock:
+            return self._databases.setdefault(name, LocalDatabase())
+
+    def __getitem__(self, name: str) -> LocalDatabase:
+        return self.get_database(name)
+
+    def start_session(self) -> LocalSession:
+        return LocalSession()
+
+    def close(self) -> None:
+        pass
+
+
+def _get(document: Mapping[str, Any], path: str) -> Any:
+    value: Any = document
+    for field in path.split("."):
+        if not isinstance(value, Mapping) or field not in value:
+            return None
+        value = value[field]
+    return value
+
+
+def _matches(document: Mapping[str, Any], filter: Filter) -> bool:
+    """
+    :return: Whether `document` matches `filter`. Supports equality and the comparison operators in _COMPARISONS.
+    """
+    for path, condition in filter.items():
+        value = _get(document, path)
+        if isinstance(condition, Mapping) and any(k.startswith("$") for k in condition):
+            for operator, operand in condition.items():
+                if operator not in _COMPARISONS:
+                    raise NotImplementedError(f"Unsupported query operator {operator}")
+                if not _COMPARISONS[operator](value, _as_stored(operand)):
+                    return False
+        elif value != _as_stored(condition):
+            return False
+    return True
+
+
+def _as_stored(operand: Any) -> Any:
+    """
+    :return: `operand` as documents are read back: dates as naive UTC, as BSON keeps them.
+    """
+    if isinstance(operand, datetime) and operand.tzinfo is not None:
+        return operand.astimezone(timezone.utc).replace(tzinfo=None)
+    return operand
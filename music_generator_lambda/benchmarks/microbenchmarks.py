@@ -0,0 +1,291 @@
+"""
+Times the parsers and models on a synthetic corpus (see `corpus.py`), and records the results against the current git
+commit, so that parser and model changes can be judged on numbers.
+
+    python -m benchmarks.microbenchmarks [--filter parse_section] [--compare] [--output benchmarks/results.jsonl]
+
+Each benchmark reports the median time per call, throughput (calls, and bars where it applies, per second) and peak
+memory (measured on a separate call, as tracing slows the timed ones down). Results are appended to `--output` as
+JSON lines. `--compare` shows the change from the latest results recorded for a different commit.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from benchmarks import corpus
+from music_generator.music_generator_types.base_song_types import SongSection
+from music_generator.music_generator_types.effect_types import SectionEffects
+from music_generator.music_generator_types.effects_matrix import EffectsMatrix
+from music_generator.music_generator_types.markup_types import MusicalMarkup
+from music_generator.music_generator_types.song_codec import (
+    decode_compact_sections,
+    decode_song,
+    encode_song,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results.jsonl")
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    # How many bars one call processes, for bars per second. 0 if it doesn't apply.
+    bars: int = 0
+
+
+def _expect_error(parse: Callable[[], Any]) -> Callable[[], None]:
+    def run() -> None:
+        try:
+            parse()
+        except ValueError:
+            return
+        raise AssertionError("Malformed input parsed")
+
+    return run
+
+
+def benchmarks() -> List[Benchmark]:
+    rng = random.Random(0)
+    suite: List[Benchmark] = []
+
+    for encoding in ("full", "compact"):
+        for num_bars in (4, 16, 64):
+            for pad in ("full", "short", "silent"):
+                if encoding == "compact" and pad == "short":
+                    # The compact encoding always writes all 16 chords
+                    continue
+                text = corpus.section_text(
+                    corpus.random_section(rng, num_bars, pad=pad), encoding, pad
+                )
+                suite.append(
+                    Benchmark(
+                        f"parse_section[{encoding},bars={num_bars},pad={pad}]",
+                        lambda text=text, num_bars=num_bars, encoding=encoding: SongSection.from_llm_format(
+                            text, name="verse-1", length=num_bars, encoding=encoding
+                        ),
+                        bars=num_bars,
+                    )
+                )
+
+    for malformation in corpus.MALFORMATIONS:
+        text = corpus.malformed_section_text(
+            rng, corpus.random_section(rng, 16), malformation
+        )
+        suite.append(
+            Benchmark(
+                f"parse_section_malformed[{malformation}]",
+                _expect_error(
+                    lambda text=text: SongSection.from_llm_format(
+                        text, name="verse-1", length=16
+                    )
+                ),
+                bars=16,
+            )
+        )
+
+    for num_sections in (4, 12):
+        outline = corpus.outline_text(rng, num_sections)
+        suite.append(
+            Benchmark(
+                f"markup_from_outline[sections={num_sections}]",
+                lambda outline=outline: MusicalMarkup.from_outline(outline),
+            )
+        )
+
+    for num_bars in (4, 16, 64):
+        effects = corpus.effects_text(rng, num_bars)
+        suite.append(
+            Benchmark(
+                f"section_effects_from_llm_text[bars={num_bars}]",
+                lambda effects=effects: SectionEffects.from_llm_text(
+                    effects, name="verse-1", sample_number=1
+                ),
+                bars=num_bars,
+            )
+        )
+
+    bar = corpus.random_bar(rng)
+    suite.append(Benchmark("bar_to_llm_format", bar.to_llm_format, bars=1))
+
+    for num_sections, bars_per_section in ((4, 8), (8, 16)):
+        record = corpus.song_record(rng, num_sections, bars_per_section)
+        suite.append(
+            Benchmark(
+                f"song_record_dict[sections={num_sections},bars={bars_per_section}]",
+                record.dict,
+                bars=num_sections * bars_per_section,
+            )
+        )
+        encoded = encode_song(record.song)
+        for name, run in (
+            ("encode_song", lambda song=record.song: encode_song(song)),
+            ("decode_song", lambda encoded=encoded: decode_song(encoded)),
+            (
+                "decode_compact_sections",
+                lambda encoded=encoded: decode_compact_sections(encoded),
+            ),
+        ):
+            suite.append(
+                Benchmark(
+                    f"{name}[sections={num_sections},bars={bars_per_section}]",
+                    run,
+                    bars=num_sections * bars_per_section,
+                )
+            )
+
+    for num_bars, samples_per_bar in ((16, 1), (16, 4), (64, 4)):
+        effects = corpus.effects_text(rng, num_bars * samples_per_bar)
+        matrix = EffectsMatrix.from_llm_text(
+            effects, name="verse-1", samples_per_bar=samples_per_bar
+        )
+        section = corpus.random_section(rng, num_bars)
+        for name, run in (
+            (
+                "effects_matrix_from_llm_text",
+                lambda effects=effects, samples_per_bar=samples_per_bar: EffectsMatrix.from_llm_text(
+                    effects, name="verse-1", samples_per_bar=samples_per_bar
+                ),
+            ),
+            (
+                "effects_matrix_apply",
+                lambda matrix=matrix, section=section: matrix.apply(section.bars),
+            ),
+        ):
+            suite.append(
+                Benchmark(
+                    f"{name}[bars={num_bars},samples={samples_per_bar}]",
+                    run,
+                    bars=num_bars,
+                )
+            )
+
+    return suite
+
+
+def measure(benchmark: Benchmark, repeat: int, min_seconds: float) -> Dict[str, float]:
+    # Calibrate the number of calls per repeat, so that each repeat takes at least `min_seconds`
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            benchmark.run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+        calls *= 2 if elapsed < min_seconds / 10 else 1 + int(min_seconds / elapsed)
+
+    times = [elapsed / calls]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            benchmark.run()
+        times.append((time.perf_counter() - start) / calls)
+    seconds = statistics.median(times)
+
+    tracemalloc.start()
+    benchmark.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_per_call": seconds,
+        "calls_per_second": 1 / seconds,
+        "bars_per_second": benchmark.bars / seconds if benchmark.bars else 0.0,
+        "peak_bytes": peak,
+    }
+
+
+def git_commit() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {
+            "commit": git("rev-parse", "--short", "HEAD"),
+            "dirty": bool(git("status", "--porcelain", "--", ".")),
+        }
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": True}
+
+
+def previous_results(output: str, commit: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    :return: Benchmark name -> the latest result recorded for a commit other than `commit`.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(output):
+        return results
+    with open(output) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["commit"] != commit:
+                results[result["benchmark"]] = result
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--filter", default="", help="Only run benchmarks whose name contains this."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Per repeat.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", action="store_true")
+    args = parser.parse_args()
+
+    # The parsers log every expanded pad and invalid bar. That's not what's being measured.
+    logging.disable(logging.CRITICAL)
+
+    commit = git_commit()
+    previous = previous_results(args.output, commit["commit"]) if args.compare else {}
+    run_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    with open(args.output, "a") as f:
+        for benchmark in benchmarks():
+            if args.filter not in benchmark.name:
+                continue
+            result = measure(benchmark, args.repeat, args.min_seconds)
+            line = (
+                f"{benchmark.name:55s} {result['seconds_per_call'] * 1e6:10.1f}us"
+                f" {result['calls_per_second']:10.0f}/s"
+                f" {result['peak_bytes'] / 1024:9.1f}KiB peak"
+            )
+            if result["bars_per_second"]:
+                line += f" {result['bars_per_second']:10.0f} bars/s"
+            if benchmark.name in previous:
+                before = previous[benchmark.name]
+                line += (
+                    f"  {result['seconds_per_call'] / before['seconds_per_call'] - 1:+.0%} time"
+                    f" {result['peak_bytes'] / max(before['peak_bytes'], 1) - 1:+.0%} memory"
+                    f" vs {before['commit']}"
+                )
+            print(line)
+            f.write(
+                json.dumps(
+                    {
+                        "benchmark": benchmark.name,
+                        **commit,
+                        "run_at": run_at,
+                        "python": platform.python_version(),
+                        **result,
+                    }
+                )
+                + "\n"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Runs the daily workflow offline: completions are replayed from a cassette (see `cassette.py`) and songs are stored in
+an in-memory database (see `local_db.py`), so what's measured is the orchestration, parsing and persistence overhead
+of each song.
+
+Record a cassette of real runs (needs the .env of a real run; the songs aren't stored):
+
+    python -m benchmarks.offline_daily record --cassette daily.json --songs 3
+
+Replay it, as fast as possible or paced like GPT-4:
+
+    python -m benchmarks.offline_daily replay --cassette daily.json --songs 20
+    python -m benchmarks.offline_daily replay --cassette daily.json --recorded-timing --time-scale 0.1
+"""
+import argparse
+import datetime
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.cassette import Cassette, CassetteRecorder, ReplayChatModel
+from benchmarks.local_db import LocalMongoClient
+from music_generator.db import find_song_records, set_mongo_client
+from music_generator.music_generator_types.base_song_types import Config
+from music_generator.workflows.daily_generate_song import (
+    daily_generate_song_and_persist,
+    get_chat_openai,
+)
+
+OFFLINE_CONFIG = Config(
+    openai_api_key="offline",
+    anyscale_api_token="offline",
+    atlas_cluster_uri="local://offline",
+    db_name="offline",
+    llm_cache_filename=None,
+    langchain_api_key=None,
+    langchain_project=None,
+)
+
+
+def _days(num_songs: int) -> List[datetime.datetime]:
+    today = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=12, minute=0, second=0, microsecond=0
+    )
+    return [today - datetime.timedelta(days=i) for i in range(num_songs)]
+
+
+def record(cassette_filename: str, num_songs: int, append: bool) -> None:
+    from dotenv import dotenv_values
+
+    config = Config(**dotenv_values())  # type: ignore
+    cassette = (
+        Cassette.load(cassette_filename)
+        if append and os.path.exists(cassette_filename)
+        else Cassette()
+    )
+    recorder = CassetteRecorder(cassette)
+    # The workflow's own models, so that the recorded prompts are exactly the ones it sends
+    for temperature in (0.70, 0.0):
+        get_chat_openai(
+            openai_api_key=config.openai_api_key, temperature=temperature
+        ).callbacks.append(recorder)
+    set_mongo_client(config, LocalMongoClient())
+
+    for d in _days(num_songs):
+        daily_generate_song_and_persist(config=config, d=d)
+    recorder.flush()
+    cassette.save(cassette_filename)
+    print(f"Recorded {len(cassette.interactions)} completions to {cassette_filename}.")
+
+
+def replay(args: argparse.Namespace) -> None:
+    llm = ReplayChatModel(
+        cassette=Cassette.load(args.cassette),
+        time_to_first_token_seconds=args.time_to_first_token,
+        tokens_per_second=args.tokens_per_second,
+        recorded_timing=args.recorded_timing,
+        time_scale=args.time_scale,
+    )
+    client = LocalMongoClient()
+    set_mongo_client(OFFLINE_CONFIG, client)
+
+    wall_times = []
+    for d in _days(args.songs):
+        start = time.perf_counter()
+        daily_generate_song_and_persist(config=OFFLINE_CONFIG, d=d, llm=llm)
+        wall_times.append(time.perf_counter() - start)
+
+    # Seconds each stage spent per song, over every attempt. Sections and effects overlap, so these add up to more
+    # than the wall time.
+    stages: Dict[str, float] = defaultdict(float)
+    for _, song_record in find_song_records(OFFLINE_CONFIG):
+        assert song_record.metrics is not None
+        for attempt in song_record.metrics.attempts:
+            stages[attempt.stage] += attempt.wall_time_seconds / args.songs
+
+    stored = client.get_database(OFFLINE_CONFIG.db_name)["songs"].stored_bytes
+    print(
+        f"{args.songs} songs: {statistics.median(wall_times) * 1000:.1f}ms median, {max(wall_times) * 1000:.1f}ms max"
+        f" per song ({3600 / statistics.mean(wall_times):.0f} songs/hour), {stored / args.songs / 1024:.1f}KiB stored"
+        " per song"
+    )
+    for stage, seconds in sorted(stages.items()):
+        print(f"  {stage:12s} {seconds * 1000:10.1f}ms per song")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("--cassette", required=True)
+    record_parser.add_argument("--songs", type=int, default=1)
+    record_parser.add_argument(
+        "--append", action="store_true", help="Add to an existing cassette."
+    )
+
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("--cassette", required=True)
+    replay_parser.add_argument("--songs", type=int, default=10)
+    replay_parser.add_argument("--time-to-first-token", type=float, default=0.0)
+    replay_parser.add_argument(
+        "--tokens-per-second", type=float, default=None, help="No limit by default."
+    )
+    replay_parser.add_argument(
+        "--recorded-timing",
+        action="store_true",
+        help="Pace each completion as it was recorded.",
+    )
+    replay_parser.add_argument(
+        "--time-scale", type=float, default=1.0, help="Multiplies every delay."
+    )
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.cassette, args.songs, args.append)
+    else:
+        # Every stage logs at INFO, which would swamp the report
+        logging.disable(logging.INFO)
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
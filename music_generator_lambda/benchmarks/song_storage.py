@@ -0,0 +1,141 @@
+"""
+Compares the layouts a song can be stored in (see `Config.song_storage_layout`): their size as BSON (what Mongo
+stores) and JSON (what `/api/songs` sends), and how long `load_song_record` takes to turn a stored document back into
+a Song, every section built (and for the columnar layout, how long decoding into CompactSections takes).
+
+    python -m benchmarks.song_storage [--songs 100]
+    python -m benchmarks.song_storage --catalog
+
+With `--catalog`, the songs are those of the database in `.env`, which is only read.
+"""
+import argparse
+import base64
+import json
+import random
+import time
+from typing import Any, Dict, Iterable, List, Mapping
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from dotenv import dotenv_values
+
+from benchmarks import corpus
+from music_generator.db import find_song_records
+from music_generator.music_generator_types.base_song_types import (
+    Config,
+    SongRecord,
+    SongStorageLayout,
+)
+from music_generator.music_generator_types.deduplicated_song import DeduplicatedSong
+from music_generator.music_generator_types.song_codec import (
+    decode_compact_sections,
+    encode_song,
+)
+from music_generator.music_generator_types.song_loader import load_song_record
+
+LAYOUTS: List[SongStorageLayout] = ["full", "deduplicated", "columnar"]
+
+
+def stored_song(song_record: SongRecord, layout: SongStorageLayout) -> Dict[str, Any]:
+    """
+    :return: The song, as `insert_song` stores it in `layout`.
+    """
+    if layout == "deduplicated":
+        return DeduplicatedSong.from_song(song_record.song).dict()
+    if layout == "columnar":
+        return {"layout": "columnar", "data": encode_song(song_record.song)}
+    return song_record.song.dict()
+
+
+def json_size(document: Mapping[str, Any]) -> int:
+    # The web app's driver sends binary as base64
+    return len(
+        json.dumps(
+            document,
+            separators=(",", ":"),
+            default=lambda x: base64.b64encode(x).decode()
+            if isinstance(x, bytes)
+            else str(x),
+        )
+    )
+
+
+def compare(song_records: Iterable[SongRecord]) -> None:
+    songs = 0
+    compact_seconds = 0.0
+    totals: Dict[str, Dict[str, float]] = {
+        layout: {"song": 0, "bson": 0, "json": 0, "load": 0} for layout in LAYOUTS
+    }
+    for song_record in song_records:
+        songs += 1
+        rest = song_record.dict(exclude={"song"})
+        for layout in LAYOUTS:
+            song = stored_song(song_record, layout)
+            document = {"song": song, **rest}
+            encoded = bson.encode(document)
+            total = totals[layout]
+            total["song"] += len(bson.encode(song))
+            total["bson"] += len(encoded)
+            total["json"] += json_size(document)
+
+            start = time.perf_counter()
+            loaded = load_song_record(RawBSONDocument(encoded))
+            for section in loaded.song.sections:
+                section.bars
+            total["load"] += time.perf_counter() - start
+            assert loaded.song == song_record.song
+
+            if layout == "columnar":
+                start = time.perf_counter()
+                decode_compact_sections(song["data"])
+                compact_seconds += time.perf_counter() - start
+
+    if not songs:
+        print("No songs.")
+        return
+    print(f"{songs} songs (per song):")
+    print(
+        f"  {'':14s} {'song BSON':>12s} {'record BSON':>12s} {'record JSON':>12s} {'load':>10s}"
+    )
+    full = totals["full"]
+    for layout, total in totals.items():
+        print(
+            f"  {layout:14s} {total['song'] / songs / 1024:10.1f}KiB"
+            f" {total['bson'] / songs / 1024:10.1f}KiB {total['json'] / songs / 1024:10.1f}KiB"
+            f" {total['load'] / songs * 1000:8.2f}ms"
+            + (
+                ""
+                if layout == "full"
+                else f"  ({full['song'] / total['song']:.1f}x smaller, {full['load'] / total['load']:.1f}x faster)"
+            )
+        )
+    print(
+        f"  Decoding columnar songs into CompactSections (without the rest of the record) takes"
+        f" {compact_seconds / songs * 1000:.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--songs", type=int, default=100)
+    parser.add_argument("--bars-per-section", type=int, default=8)
+    parser.add_argument(
+        "--catalog", action="store_true", help="Measure the stored songs instead."
+    )
+    args = parser.parse_args()
+
+    if args.catalog:
+        config = Config(**dotenv_values())  # type: ignore
+        compare(x for _, x in find_song_records(config))
+    else:
+        rng = random.Random(0)
+        compare(
+            corpus.song_record(rng, bars_per_section=args.bars_per_section)
+            for _ in range(args.songs)
+        )
+
+
+if __name__ == "__main__":
+    main()
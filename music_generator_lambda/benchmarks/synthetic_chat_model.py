@@ -0,0 +1,109 @@
+"""
+A chat model that makes up plausible completions for every stage of the daily workflow (from `corpus.py`), with
+randomized latency, injected rate limiting and malformed output, for load testing.
+"""
+import asyncio
+import math
+import random
+import re
+from typing import Any, List
+
+import openai
+from langchain.schema.messages import BaseMessage
+from pydantic import BaseModel, PrivateAttr
+
+from benchmarks import corpus
+from benchmarks.fake_chat_model import Completion, FakeChatModel
+
+
+class Lognormal(BaseModel):
+    """
+    A lognormal distribution, which is roughly what LLM latencies follow: most calls near the median, and a long tail
+    of slow ones.
+    """
+
+    median: float
+    # The standard deviation of the log. 0 for always the median, ~0.5 for a p95 of 2.3x the median.
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+
+class SyntheticChatModel(FakeChatModel):
+    """
+    Writes the markup, sections, bar repairs and effects the workflow asks for.
+
+    Rate limited (429) requests are retried inside the model with exponential backoff, as ChatOpenAI does, so they
+    add latency (and requests) rather than failing the stage, until `max_retries` is used up.
+    """
+
+    seed: int = 0
+    time_to_first_token: Lognormal = Lognormal(median=1.5, sigma=0.5)
+    # GPT-4 streams ~20-40 tokens/s
+    tokens_per_second: Lognormal = Lognormal(median=30, sigma=0.25)
+    # The probability of each request being rate limited
+    rate_limit_rate: float = 0.0
+    max_retries: int = 6
+    # The probability of each completion being malformed
+    malformed_rate: float = 0.0
+    # What the model did, for reporting
+    requests: int = 0
+    rate_limited_requests: int = 0
+    malformed_completions: int = 0
+
+    _rng: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "synthetic"
+
+    async def _acompletion(self, messages: List[BaseMessage]) -> Completion:
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            if self._rng.random() >= self.rate_limit_rate:
+                break
+            self.rate_limited_requests += 1
+            if attempt == self.max_retries:
+                raise openai.error.RateLimitError("Rate limit reached (simulated)")
+            # ChatOpenAI's backoff: exponential, between 4 and 10 seconds
+            await asyncio.sleep(min(max(2**attempt, 4), 10) * self.time_scale)
+
+        malformed = self._rng.random() < self.malformed_rate
+        self.malformed_completions += malformed
+        return Completion(
+            self._text(messages[-1].content, malformed),
+            self.time_to_first_token.sample(self._rng),
+            self.tokens_per_second.sample(self._rng),
+        )
+
+    def _text(self, prompt: str, malformed: bool) -> str:
+        rng = self._rng
+        if prompt.startswith("Create an outline"):
+            if malformed:
+                return "I'd be happy to help! What kind of house music track do you have in mind?"
+            return corpus.outline_text(rng, rng.randint(4, 8))
+
+        match = re.search(r"with (\d+) numbers per instrument", prompt)
+        if match:
+            if malformed:
+                return "Sure! The filter opens up over the section."
+            return corpus.effects_text(rng, int(match.group(1)))
+
+        # A repair (which comes after the section prompt), or a section
+        match = re.search(r"Write out only these (\d+) bars", prompt) or re.search(
+            r"Generate (\d+) bars", prompt
+        )
+        if match:
+            section = corpus.random_section(rng, int(match.group(1)))
+            if malformed:
+                return corpus.malformed_section_text(
+                    rng, section, rng.choice(corpus.MALFORMATIONS)
+                )
+            return corpus.section_text(section)
+
+        raise RuntimeError(f"Unrecognized prompt:\n{prompt[:500]}")
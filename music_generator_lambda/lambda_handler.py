@@ -1,26 +1,33 @@
+import asyncio
+import datetime
 import json
 import os
+import time
+from typing import TYPE_CHECKING, Optional
 
-from boto3.session import Session
-from botocore.exceptions import ClientError
-from mypy_boto3_secretsmanager.client import SecretsManagerClient
 from music_generator.music_generator_types.base_song_types import Config
-from music_generator.utilities.set_langchain_environment import (
-    set_langchain_environment,
-)
-from music_generator.workflows.daily_generate_song import (
-    daily_generate_song_and_persist,
-)
-
-
 from music_generator.utilities.logs import get_logger
 
+# langchain, pymongo and boto3 take most of the cold start to import, so they (and the generation stack, which
+# imports them) are imported on first use instead. See `benchmarks/import_time.py`.
+if TYPE_CHECKING:
+    from boto3.session import Session
+    from mypy_boto3_secretsmanager.client import SecretsManagerClient
+
 logger = get_logger(__name__)
 
+# Reused by warm containers. Secrets are re-fetched after SECRETS_TTL_SECONDS so that rotations get picked up.
+SECRETS_TTL_SECONDS = float(os.environ.get("SECRETS_TTL_SECONDS", 15 * 60))
+_session: Optional["Session"] = None
+_config: Optional[Config] = None
+_config_loaded_at = 0.0
+
+
+def get_secret(session: "Session", secret_id: str, region_name: str) -> dict[str, str]:
+    from botocore.exceptions import ClientError
 
-def get_secret(session: Session, secret_id: str, region_name: str) -> dict[str, str]:
     # Create a Secrets Manager client
-    client: SecretsManagerClient = session.client(  # type: ignore
+    client: "SecretsManagerClient" = session.client(  # type: ignore
         service_name="secretsmanager", region_name=region_name
     )
 
@@ -38,36 +45,93 @@ def get_secret(session: Session, secret_id: str, region_name: str) -> dict[str,
     return secret
 
 
-def configure_lambda() -> Config:
+async def aget_secret(
+    session: "Session", secret_id: str, region_name: str
+) -> dict[str, str]:
+    """
+    Async variant of `get_secret`. boto3 is blocking, so the fetch runs on a worker thread.
+    """
+    return await asyncio.to_thread(
+        get_secret, session=session, secret_id=secret_id, region_name=region_name
+    )
+
+
+async def aconfigure_lambda() -> Config:
+    from boto3.session import Session
+
+    global _session
+
     logger.info("Generating configuration using Lambda context...")
     secret_id = os.environ["SECRETS_MANAGER_SECRET_ID"]
     region = os.environ["AWS_REGION"]
     logger.info(f"AWS Region is: {region}. Secrets stored at {secret_id}.")
-    session = Session()
-    secrets = get_secret(session=session, secret_id=secret_id, region_name=region)
+    if _session is None:
+        _session = Session()
+    secrets = await aget_secret(
+        session=_session, secret_id=secret_id, region_name=region
+    )
     config = Config(**secrets)
-    set_langchain_environment(config=config)
+    _apply_config(config)
 
     return config
 
 
+def configure_lambda() -> Config:
+    return asyncio.run(aconfigure_lambda())
+
+
 def configure_local() -> Config:
     from dotenv import dotenv_values
 
     logger.info("Generating configuration using `.env`...")
     config = Config(**dotenv_values())  # type: ignore
-    set_langchain_environment(config=config)
+    _apply_config(config)
     return config
 
 
-def handler(event, context):  # type: ignore
+def _apply_config(config: Config) -> None:
+    from music_generator.utilities.set_langchain_environment import (
+        set_langchain_environment,
+    )
+
+    # The LLM cache isn't turned on: every invocation is meant to generate a new song
+    set_langchain_environment(config=config)
+
+
+async def aget_config() -> Config:
+    """
+    :return: The configuration, reused across warm invocations until it's older than SECRETS_TTL_SECONDS.
+    """
+    global _config, _config_loaded_at
+
+    if (
+        _config is not None
+        and time.monotonic() - _config_loaded_at < SECRETS_TTL_SECONDS
+    ):
+        logger.info("Reusing configuration from a previous invocation.")
+        return _config
+
     try:
-        config = configure_lambda()
+        config = await aconfigure_lambda()
     except KeyError:
         logger.info("Lambda environment setup failed. Opting for local.")
         config = configure_local()
 
-    daily_generate_song_and_persist(config=config)
+    _config = config
+    _config_loaded_at = time.monotonic()
+    return config
+
+
+async def async_handler(event, context):  # type: ignore
+    from music_generator.workflows.daily_generate_song import (
+        adaily_generate_song_and_persist,
+    )
+
+    config = await aget_config()
+
+    await adaily_generate_song_and_persist(
+        config=config, d=datetime.datetime.now(datetime.timezone.utc)
+    )
 
     return {
         "statusCode": 200,
@@ -75,5 +139,10 @@ def handler(event, context):  # type: ignore
     }
 
 
+def handler(event, context):  # type: ignore
+    # One event loop per invocation, so every network wait in the pipeline can overlap
+    return asyncio.run(async_handler(event, context))
+
+
 if __name__ == "__main__":
     print(handler({}, {}))
@@ -1,21 +1,363 @@
-from music_generator.music_generator_types.base_song_types import Config, SongRecord
+import asyncio
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
+import bson
+import dateutil.parser
 
+from music_generator.music_generator_types.base_song_types import (
+    Config,
+    SongRecord,
+    SongStorageLayout,
+)
+from music_generator.music_generator_types.deduplicated_song import DeduplicatedSong
+from music_generator.music_generator_types.metrics_types import StageAttempt
+from music_generator.music_generator_types.song_codec import encode_song
+from music_generator.music_generator_types.song_loader import load_song_record
+from music_generator.music_generator_types.song_summary import SongSummary
+
+
+from bson.objectid import ObjectId
 from bson.raw_bson import RawBSONDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collection import Collection
+from pymongo.database import Database
 from pymongo.mongo_client import MongoClient
+from pymongo.client_session import ClientSession
 from pymongo.server_api import ServerApi
 
+SONGS_COLLECTION = "songs"
+# A SongSummary of each song, with the song's ID and date fields. Written and deleted with the song, in one
+# transaction (see `insert_song` and `delete_songs`).
+SONG_SUMMARIES_COLLECTION = "song_summaries"
+# Besides `created_at_utc` (an ISO string, which doesn't compare reliably), songs (and their summaries) are stored with
+# when they were created as a BSON date (`created_at`), and the UTC day of it as "YYYY-MM-DD" (`created_day`). See
+# `song_dates`.
+SONG_INDEXES: List[IndexModel] = [
+    # Ranges of time, e.g. deleting songs before or after a date
+    IndexModel([("created_at", ASCENDING), ("created_day", ASCENDING)]),
+    # Ranges of days, latest song first within each
+    IndexModel([("created_day", ASCENDING), ("created_at", DESCENDING)]),
+]
+
+_ClientKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+_clients: Dict[_ClientKey, MongoClient] = {}
+_indexed: Set[Tuple[_ClientKey, str]] = set()
+_clients_lock = threading.Lock()
+
+
+def _client_options(config: Config) -> Dict[str, Any]:
+    """
+    :returns: The `config` settings of the client, as MongoClient options.
+    """
+    options = {
+        "maxPoolSize": config.mongo_max_pool_size,
+        "minPoolSize": config.mongo_min_pool_size,
+        "maxIdleTimeMS": config.mongo_max_idle_time_ms,
+        "connectTimeoutMS": config.mongo_connect_timeout_ms,
+        "serverSelectionTimeoutMS": config.mongo_server_selection_timeout_ms,
+        "socketTimeoutMS": config.mongo_socket_timeout_ms,
+        "w": config.mongo_write_concern,
+    }
+    return {k: v for k, v in options.items() if v is not None}
+
+
+def _client_key(config: Config) -> _ClientKey:
+    return config.atlas_cluster_uri, tuple(sorted(_client_options(config).items()))
+
+
+def get_mongo_client(config: Config) -> MongoClient:
+    """
+    :returns: A client for `config.atlas_cluster_uri` with the `config.mongo_*` settings, shared by every caller in
+        the process with the same ones. Clients hold a connection pool, so reusing one (e.g. across warm Lambda
+        invocations) skips the DNS lookups, TLS and handshakes of reconnecting.
+    """
+    key = _client_key(config)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = MongoClient(  # type: ignore
+                config.atlas_cluster_uri,
+                server_api=ServerApi("1"),
+                document_class=RawBSONDocument,
+                **_client_options(config),
+            )
+            _clients[key] = client
+        return client
+
+
+def set_mongo_client(config: Config, client: Optional[MongoClient]) -> None:
+    """
+    Make `get_mongo_client` return `client` for `config`, e.g. a local stand-in for offline runs (see
+    benchmarks/local_db.py). None forgets it, so that the next call connects for real.
+    """
+    key = _client_key(config)
+    with _clients_lock:
+        if client is None:
+            _clients.pop(key, None)
+        else:
+            _clients[key] = client
+        _indexed.difference_update({x for x in _indexed if x[0] == key})
+
+
+def close_mongo_clients() -> None:
+    """
+    Close and forget every shared client, e.g. at the end of a script. Lambda containers don't need to: their
+    clients are reused until the container is stopped.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _indexed.clear()
+    for client in clients:
+        client.close()
+
+
+def get_database(config: Config) -> Database[RawBSONDocument]:
+    """
+    :returns: `config.db_name`, on the shared client.
+    """
+    return get_mongo_client(config).get_database(config.db_name)
+
+
+def get_songs_collection(config: Config) -> Collection[RawBSONDocument]:
+    """
+    :returns: The collection of SongRecords (see `insert_song` and `find_song_records`), on the shared client.
+    """
+    return get_database(config).get_collection(SONGS_COLLECTION)
+
+
+def get_song_summaries_collection(config: Config) -> Collection[RawBSONDocument]:
+    """
+    :returns: The collection of SongSummaries (see `insert_song`), on the shared client.
+    """
+    return get_database(config).get_collection(SONG_SUMMARIES_COLLECTION)
+
+
+def as_utc(d: datetime) -> datetime:
+    """
+    :returns: `d` in UTC. A naive `d` is taken to be UTC already.
+    """
+    return (
+        d.replace(tzinfo=timezone.utc)
+        if d.tzinfo is None
+        else d.astimezone(timezone.utc)
+    )
+
+
+def day_key(d: datetime) -> str:
+    """
+    :returns: The `created_day` of songs created at `d`.
+    """
+    return as_utc(d).date().isoformat()
+
+
+def song_dates(created_at_utc: str) -> Dict[str, Any]:
+    """
+    :param created_at_utc: An ISO 8601 time. Without an offset, it's taken to be UTC.
+    :returns: The indexed date fields of a song created then.
+    :raises ValueError: If `created_at_utc` isn't an ISO 8601 time.
+    """
+    created_at = as_utc(dateutil.parser.isoparse(created_at_utc))
+    return {"created_at": created_at, "created_day": day_key(created_at)}
+
+
+class SongDate(NamedTuple):
+    id: ObjectId
+    # UTC, naive (as pymongo reads dates)
+    created_at: datetime
+    created_day: str
+
+
+def find_song_dates(
+    config: Config, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Iterator[SongDate]:
+    """
+    Iterate over when the stored songs were created, without reading anything else of them.
+
+    :param start: Only songs created at or after this time (UTC if naive), if given.
+    :param end: Only songs created before this time (UTC if naive), if given.
+    :returns: The ID and dates of each song, oldest first, as the cursor reaches it.
+    """
+    created_at: Dict[str, Any] = {"$type": "date"}
+    if start is not None:
+        created_at["$gte"] = as_utc(start)
+    if end is not None:
+        created_at["$lt"] = as_utc(end)
+    for document in get_songs_collection(config).find(
+        {"created_at": created_at},
+        projection={"created_at": 1, "created_day": 1},
+        sort=[("created_at", ASCENDING)],
+    ):
+        yield SongDate(
+            id=document["_id"],
+            created_at=document["created_at"],
+            created_day=document["created_day"],
+        )
+
+
+def find_song_days(
+    config: Config, start: Optional[date] = None, end: Optional[date] = None
+) -> Iterator[str]:
+    """
+    Iterate over the days that have songs. The query is answered from the `created_day` index alone, so no song is
+    read.
+
+    :param start: Only days from this one on, if given.
+    :param end: Only days before this one, if given.
+    :returns: Each day's `created_day` ("YYYY-MM-DD") once, in order, as the cursor reaches it.
+    """
+    # Every day key is >= "", so the range always has a lower bound and the index can cover it
+    created_day: Dict[str, str] = {"$gte": start.isoformat() if start else ""}
+    if end is not None:
+        created_day["$lt"] = end.isoformat()
+    previous = None
+    for document in get_songs_collection(config).find(
+        {"created_day": created_day},
+        projection={"_id": 0, "created_day": 1},
+        sort=[("created_day", ASCENDING)],
+    ):
+        day = document["created_day"]
+        if day != previous:
+            yield day
+            previous = day
+
+
+def ensure_song_indexes(config: Config) -> None:
+    """
+    Create SONG_INDEXES on the songs and their summaries if they don't exist. Only the first call for a client and
+    database does anything.
+    """
+    key = (_client_key(config), config.db_name)
+    with _clients_lock:
+        if key in _indexed:
+            return
+    get_songs_collection(config).create_indexes(SONG_INDEXES)
+    get_song_summaries_collection(config).create_indexes(SONG_INDEXES)
+    with _clients_lock:
+        _indexed.add(key)
+
+
+def song_summary_document(
+    song_id: ObjectId,
+    song_record: SongRecord,
+    layout: SongStorageLayout,
+    size_bytes: int,
+) -> Dict[str, Any]:
+    """
+    :param size_bytes: The BSON size of the stored record.
+    :returns: The summary of a stored song, as it's stored.
+    """
+    return {
+        "_id": song_id,
+        **SongSummary.from_song_record(
+            song_record, layout=layout, size_bytes=size_bytes
+        ).dict(),
+        **song_dates(song_record.created_at_utc),
+    }
+
 
 def insert_song(config: Config, song_record: SongRecord) -> str:
     """
+    Store the record, with its song in `config.song_storage_layout` (`find_song_records` reads either), and its
+    summary, in one transaction.
+
     :returns: The ID of the inserted record.
     """
-    client = MongoClient(  # type: ignore
-        config.atlas_cluster_uri,
-        server_api=ServerApi("1"),
-        document_class=RawBSONDocument,
+    ensure_song_indexes(config)
+    collection = get_songs_collection(config)
+    summaries = get_song_summaries_collection(config)
+    start = time.monotonic()
+    song: Dict[str, Any]
+    if config.song_storage_layout == "deduplicated":
+        song = DeduplicatedSong.from_song(song_record.song).dict()
+    elif config.song_storage_layout == "columnar":
+        song = {"layout": "columnar", "data": encode_song(song_record.song)}
+    else:
+        song = song_record.song.dict()
+    if song_record.metrics is not None:
+        # Only the encoding is timed: the insert can't be without writing the record twice
+        song_record.metrics.add(
+            StageAttempt(
+                stage="encode_song", wall_time_seconds=time.monotonic() - start
+            )
+        )
+    document = {
+        "_id": ObjectId(),
+        "song": song,
+        **song_record.dict(exclude={"song"}),
+        **song_dates(song_record.created_at_utc),
+    }
+    summary = song_summary_document(
+        document["_id"],
+        song_record,
+        layout=config.song_storage_layout,
+        size_bytes=len(bson.encode(document)),
     )
-    db = client.get_database(config.db_name)
-    collection = db.get_collection("songs")
-    inserted = collection.insert_one(song_record.dict())  # type:ignore
-    return str(inserted.inserted_id)  # type: ignore
+
+    def _insert(session: ClientSession) -> None:
+        collection.insert_one(document, session=session)  # type:ignore
+        summaries.insert_one(summary, session=session)  # type:ignore
+
+    with get_mongo_client(config).start_session() as session:
+        session.with_transaction(_insert)
+    return str(document["_id"])
+
+
+def delete_songs(config: Config, filter: Mapping[str, Any]) -> int:
+    """
+    Delete the matching songs and their summaries, in one transaction.
+
+    :param filter: A MongoDB filter on the fields that songs and summaries share: `_id`, `created_at_utc`,
+        `created_at` and `created_day`.
+    :returns: The number of deleted records.
+    """
+    collection = get_songs_collection(config)
+    summaries = get_song_summaries_collection(config)
+
+    def _delete(session: ClientSession) -> int:
+        summaries.delete_many(filter, session=session)
+        return collection.delete_many(filter, session=session).deleted_count
+
+    with get_mongo_client(config).start_session() as session:
+        return session.with_transaction(_delete)
+
+
+def find_song_records(
+    config: Config,
+    query: Optional[Mapping[str, Any]] = None,
+    validation_sample_rate: float = 0.0,
+) -> Iterator[Tuple[str, SongRecord]]:
+    """
+    Iterate over stored songs without validating them (see `load_song_record`).
+
+    :param query: A MongoDB filter. All songs if None.
+    :param validation_sample_rate: The fraction of records to validate fully.
+    :returns: The ID and record of each matching song, as the cursor reaches it.
+    """
+    collection = get_songs_collection(config)
+    for document in collection.find(query or {}):
+        yield str(document["_id"]), load_song_record(  # type: ignore
+            document, validation_sample_rate=validation_sample_rate  # type: ignore
+        )
+
+
+async def ainsert_song(config: Config, song_record: SongRecord) -> str:
+    """
+    Async variant of `insert_song`. pymongo is blocking, so the write runs on a worker thread.
+
+    :returns: The ID of the inserted record.
+    """
+    return await asyncio.to_thread(insert_song, config=config, song_record=song_record)
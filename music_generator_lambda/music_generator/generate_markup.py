@@ -1,6 +1,6 @@
+import asyncio
 import logging
-from typing import Union
-from langchain.callbacks import get_openai_callback
+from typing import Optional, Union
 from langchain.chat_models import ChatOpenAI
 
 # from langchain.schema.language_model import BaseChatModel
@@ -19,7 +19,16 @@ from tenacity import (
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from music_generator.music_generator_types.base_song_types import Config
 from music_generator.music_generator_types.markup_types import MusicalMarkup
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.utilities.llm_cache import get_llm_cache
 from music_generator.utilities.logs import get_logger
+from music_generator.utilities.rate_limit import estimate_tokens, rate_limited
+from music_generator.utilities.stage_metrics import (
+    record_cache_hit,
+    record_parse_failures,
+    timed_stage,
+    track_llm_call,
+)
 
 logger = get_logger(__name__)
 
@@ -31,9 +40,17 @@ logger = get_logger(__name__)
     ),
     stop=stop_after_attempt(3),
 )
-def generate_markup(
-    song_description: str, llm: Union[BaseChatModel, BaseLLM]
+@timed_stage("markup")
+async def agenerate_markup(
+    song_description: str,
+    llm: Union[BaseChatModel, BaseLLM],
+    metrics: Optional[GenerationMetrics] = None,
+    cache_scope: Optional[str] = None,
 ) -> MusicalMarkup:
+    """
+    :param cache_scope: What a cached outline is keyed on besides the prompt, e.g. the song's date, so that it's
+        only replayed for that song (see `LLMResponseCache`).
+    """
     format_instructions = """You are generating songs in a musical markup language.
 
 A song consists of a number of sections.
@@ -58,6 +75,8 @@ Whenever referring to previous material, refer to sections.
 """
 
     result = ""
+    cache = get_llm_cache()
+    cached = None
     # if llm
 
     if isinstance(llm, BaseLLM):
@@ -81,16 +100,47 @@ Whenever referring to previous material, refer to sections.
             "Prompt:\n" + "\n".join([f"{x.type}: {x.content}" for x in _input])
         )
 
-        with get_openai_callback() as cb:
-            output = llm(_input)
-
-        logger.info(
-            f"Used {cb.total_tokens} tokens ({cb.prompt_tokens} prompt, {cb.completion_tokens} completion) @ ${(cb.total_cost):.3f}"
-        )
-        result = output.content
+        cached = await cache.alookup(_input, llm, cache_scope) if cache else None
+        if cached is not None:
+            record_cache_hit()
+            result = cached
+        else:
+            async with rate_limited(estimate_tokens(_input, 1000)) as record_usage:
+                with track_llm_call(_input, llm) as call:
+                    output = await llm.apredict_messages(_input, callbacks=[call])
+                record_usage(call.total_tokens)
+            result = output.content
     logger.debug(f"Output:\n{result}")
 
-    return MusicalMarkup.from_outline(result)
+    try:
+        markup = MusicalMarkup.from_outline(result)
+    except ValueError:
+        # Includes pydantic's ValidationError
+        record_parse_failures(1)
+        raise
+    if cache and cached is None:
+        # Only cache outlines that parse, so that retries don't replay a bad one
+        await cache.aupdate(_input, llm, result, cache_scope)
+    return markup
+
+
+def generate_markup(
+    song_description: str,
+    llm: Union[BaseChatModel, BaseLLM],
+    metrics: Optional[GenerationMetrics] = None,
+    cache_scope: Optional[str] = None,
+) -> MusicalMarkup:
+    """
+    Synchronous wrapper around `agenerate_markup`.
+    """
+    return asyncio.run(
+        agenerate_markup(
+            song_description=song_description,
+            llm=llm,
+            metrics=metrics,
+            cache_scope=cache_scope,
+        )
+    )
 
 
 if __name__ == "__main__":
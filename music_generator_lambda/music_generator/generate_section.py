@@ -1,8 +1,8 @@
+import asyncio
 import logging
-from typing import Union
+from typing import Optional, Union
 
 # from langchain import PromptTemplate
-from langchain.callbacks import get_openai_callback
 from langchain.chat_models import ChatOpenAI
 
 # from langchain.schema.language_model import BaseChatModel
@@ -10,7 +10,12 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.llms.base import BaseLLM
 from langchain.prompts import ChatPromptTemplate
 from langchain.prompts.chat import HumanMessagePromptTemplate
-from langchain.schema.messages import SystemMessage
+from langchain.schema.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
 from pydantic import ValidationError
 from tenacity import (
     before_sleep_log,
@@ -21,19 +26,80 @@ from tenacity import (
 
 from music_generator.music_generator_types.base_song_types import (
     Bar,
+    BarEncoding,
     Config,
     Song,
     SongSection,
+    SongSectionStreamParser,
 )
 from music_generator.music_generator_types.markup_types import (
     MarkupSection,
     MarkupInstrument,
 )
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.utilities.llm_cache import get_llm_cache
 from music_generator.utilities.logs import get_logger
+from music_generator.utilities.rate_limit import estimate_tokens, rate_limited
+from music_generator.utilities.stage_metrics import (
+    record_cache_hit,
+    record_parse_failures,
+    timed_stage,
+    track_llm_call,
+)
 
 logger = get_logger(__name__)
 
 
+async def _astream_bars(
+    llm: BaseChatModel, messages: list[BaseMessage], parser: SongSectionStreamParser
+) -> str:
+    """
+    Stream a completion into `parser`, stopping as soon as it has all of its bars.
+
+    Completions are read from (and, if every bar in them is valid, written to) the LLM cache, keyed on the section
+    too: sections with the same descriptions have the same prompt, but each replays its own (sampled) completion.
+
+    :return: The text of the completion that was read.
+    """
+    cache = get_llm_cache()
+    cached = await cache.alookup(messages, llm, parser.name) if cache else None
+    if cached is not None:
+        record_cache_hit()
+        parser.feed(cached)
+        return cached
+
+    result = ""
+    # Roughly 150 tokens per bar written out in full
+    async with rate_limited(
+        estimate_tokens(messages, 150 * parser.length)
+    ) as record_usage:
+        with track_llm_call(messages, llm) as call:
+            stream = llm.astream(messages, config={"callbacks": [call]})
+            try:
+                async for chunk in stream:
+                    call.on_first_token()
+                    result += chunk.content
+                    try:
+                        parser.feed(chunk.content)
+                    except ValueError:
+                        # Strict parsers raise on the first invalid bar
+                        record_parse_failures(1)
+                        raise
+                    if parser.is_complete:
+                        logger.info(
+                            f"Received all {parser.length} bars. Ignoring the rest of the completion."
+                        )
+                        break
+            finally:
+                await stream.aclose()
+        record_usage(call.total_tokens)
+
+    record_parse_failures(len(parser.errors))
+    if cache and not parser.errors:
+        await cache.aupdate(messages, llm, result, parser.name)
+    return result
+
+
 @retry(
     # This line makes tenacity log the produced exception before sleeping for its wait-interval
     before_sleep=before_sleep_log(logger, logging.WARNING),
@@ -42,13 +108,24 @@ logger = get_logger(__name__)
     ),
     stop=stop_after_attempt(3),
 )
-def generate_section(
+@timed_stage("section")
+async def agenerate_section(
     markup_section: MarkupSection,
     prev_gens: Song,
     llm: Union[BaseChatModel, BaseLLM],
+    max_repair_attempts: int = 2,
+    encoding: BarEncoding = "full",
+    metrics: Optional[GenerationMetrics] = None,
 ) -> SongSection:
     """
     Generate the notes of a song (SongSection) from an abstract description (MarkupSection) using the given LLM.
+
+    `encoding="compact"` asks the LLM for hex drum rows, run-length rests and references to repeated bars (see
+    `Bar.to_compact_format`), which takes a fraction of the completion tokens.
+
+    Bars that fail validation (or never arrive) are re-requested on their own, up to `max_repair_attempts` times,
+    and spliced back into the section. Only if that fails is the whole section regenerated. With
+    `max_repair_attempts=0`, the first invalid bar aborts the completion.
     """
 
     def generate_instrument_description(
@@ -70,14 +147,8 @@ def generate_section(
 
         return description
 
-    if isinstance(llm, BaseLLM):
-        raise NotImplementedError("This only works with chat models")
-    else:
-        # https://python.langchain.com/docs/modules/model_io/prompts/prompt_templates/#chat-prompt-template
-        chat_prompt_template: ChatPromptTemplate = ChatPromptTemplate.from_messages(  # pyright: ignore[reportUnknownMemberType]
-            [
-                SystemMessage(
-                    content=f"""Your job is to take a text description of a section of a song and express it in a machine readable tabular format.
+    format_instructions: dict[str, str] = {
+        "full": f"""Your job is to take a text description of a section of a song and express it in a machine readable tabular format.
 
 # Formatting:
 - Your output will be a sequence of bars.
@@ -89,11 +160,37 @@ def generate_section(
 {Bar.example().to_llm_format()}
 
 The text you produce will be programatically parsed into a song. Please follow the format instructions carefully. To reiterate, under no condition should you give anything but all measures fully without any shorthand.
-""".strip()
-                ),
+""".strip(),
+        "compact": f"""Your job is to take a text description of a section of a song and express it in a machine readable tabular format.
+
+# Formatting:
+- Your output will be a sequence of bars.
+- Each bar is enclosed by triple braces on each side: {{{{{{ content }}}}}}.
+- Every bar is 16 steps long (Each is a 16th note).
+- Drum rows (hi_hat, kick, snare) are exactly 4 hex digits. Each bit is a 16th note, the first 16th note being the most significant bit: 8888 is a hit on every beat, ffff is a hit on every 16th note, 0000 is silence.
+- In the bass row, 0*N is N 16th notes of rest. In the pad row, []*N is N 16th notes of rest.
+- If a bar is exactly the same as an earlier bar, only write the number of that bar: {{{{{{ = 1 }}}}}} repeats bar 1.
+- Otherwise, always specify the activity of *all* instruments in the bar.
+- An example of a properly formatted bar is as follows:
+{Bar.example().to_compact_format()}
+- An example of a bar repeating the bar above (bar 1) is as follows:
+{Bar.example().to_compact_format(previous=[Bar.example()])}
+
+The text you produce will be programatically parsed into a song. Please follow the format instructions carefully. Always write a bar (or a reference to an earlier bar) for every bar of the section.
+""".strip(),
+    }
+
+    if isinstance(llm, BaseLLM):
+        raise NotImplementedError("This only works with chat models")
+    else:
+        # https://python.langchain.com/docs/modules/model_io/prompts/prompt_templates/#chat-prompt-template
+        chat_prompt_template: ChatPromptTemplate = ChatPromptTemplate.from_messages(  # pyright: ignore[reportUnknownMemberType]
+            [
+                SystemMessage(content=format_instructions[encoding]),
                 HumanMessagePromptTemplate.from_template("{prompt}"),
             ]
         )
+        # The instruments of SECTION_PROMPT_INSTRUMENTS, which `MusicalMarkup.dependency_graph` waits on
         _input = chat_prompt_template.format_messages(
             prompt=f"""Generate {markup_section.number_bars} bars of a house song using the following descriptions...
 
@@ -111,19 +208,87 @@ write out all bars no matter what.""".strip(),
             "Prompt:\n" + "\n".join([f"{x.type}: {x.content}" for x in _input])
         )
 
-        with get_openai_callback() as cb:
-            logger.info("Generating section (this make take a while)...")
-            output = llm(_input)
-
-        logger.info(
-            f"Used {cb.total_tokens} tokens ({cb.prompt_tokens} prompt, {cb.completion_tokens} completion) @ ${(cb.total_cost):.3f}"
+        # Bars are validated as they stream in, and we stop reading once we have all the bars we asked for.
+        parser = SongSectionStreamParser(
+            name=markup_section.name,
+            length=markup_section.number_bars,
+            strict=max_repair_attempts == 0,
+            encoding=encoding,
         )
-        result = output.content
+        logger.info("Generating section (this make take a while)...")
+        result = await _astream_bars(llm=llm, messages=_input, parser=parser)
+        logger.debug(f"Output:\n{result}")
 
-    logger.debug(f"Output:\n{result}")
+        for attempt in range(max_repair_attempts):
+            missing = parser.missing_indices
+            if not missing:
+                break
+            logger.info(
+                f"Repairing bars {[i + 1 for i in missing]} of {markup_section.name} (attempt {attempt + 1})..."
+            )
+            problems = "\n".join(
+                f"- Bar {i + 1}: {parser.errors.get(i, 'missing')}" for i in missing
+            )
+            # References in the reply are to the bars of the section, not of the reply
+            repair_parser = SongSectionStreamParser(
+                name=markup_section.name,
+                length=len(missing),
+                strict=False,
+                encoding=encoding,
+                reference_bars=parser.bars,
+            )
+            repair = await _astream_bars(
+                llm=llm,
+                messages=[
+                    *_input,
+                    AIMessage(content=result),
+                    HumanMessage(
+                        content=f"""The following bars are invalid or missing:
+{problems}
 
-    return SongSection.from_llm_format(
-        text=result, name=markup_section.name, length=markup_section.number_bars
+Write out only these {len(missing)} bars, in this order, following the format instructions.""".strip()
+                    ),
+                ],
+                parser=repair_parser,
+            )
+            logger.debug(f"Repair output:\n{repair}")
+            for repair_index, (index, bar) in enumerate(
+                zip(missing, repair_parser.bars)
+            ):
+                if bar is not None:
+                    parser.splice(index, bar)
+                else:
+                    parser.errors[index] = repair_parser.errors[repair_index]
+
+    try:
+        return parser.result()
+    except ValueError:
+        if not parser.errors:
+            # No bars at all. Invalid bars were counted as they were streamed.
+            record_parse_failures(1)
+        raise
+
+
+def generate_section(
+    markup_section: MarkupSection,
+    prev_gens: Song,
+    llm: Union[BaseChatModel, BaseLLM],
+    max_repair_attempts: int = 2,
+    encoding: BarEncoding = "full",
+    metrics: Optional[GenerationMetrics] = None,
+) -> SongSection:
+    """
+    Synchronous wrapper around `agenerate_section`.
+    """
+    return asyncio.run(
+        agenerate_section(
+            markup_section=markup_section,
+            prev_gens=prev_gens,
+            llm=llm,
+            max_repair_attempts=max_repair_attempts,
+            encoding=encoding,
+            metrics=metrics,
+        )
     )
 
 
@@ -1,8 +1,8 @@
+import asyncio
 import logging
-from typing import Union
+from typing import Optional, Union
 
 # from langchain import PromptTemplate
-from langchain.callbacks import get_openai_callback
 from langchain.chat_models import ChatOpenAI
 
 # from langchain.schema.language_model import BaseChatModel
@@ -33,11 +33,17 @@ from music_generator.music_generator_types.markup_types import (
     MarkupInstrument,
     MarkupSection,
 )
-from music_generator.music_generator_types.effect_types import (
-    SectionEffects,
-    SongEffects,
-)
+from music_generator.music_generator_types.effects_matrix import EffectsMatrix
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.utilities.llm_cache import get_llm_cache
 from music_generator.utilities.logs import get_logger
+from music_generator.utilities.rate_limit import estimate_tokens, rate_limited
+from music_generator.utilities.stage_metrics import (
+    record_cache_hit,
+    record_parse_failures,
+    timed_stage,
+    track_llm_call,
+)
 
 logger = get_logger(__name__)
 
@@ -50,13 +56,19 @@ logger = get_logger(__name__)
     ),
     stop=stop_after_attempt(3),
 )
-def generate_section_effects(
+@timed_stage("effects")
+async def agenerate_section_effects(
     markup_section: MarkupSection,
     number_bars: int,
     llm: Union[BaseChatModel, BaseLLM],
-) -> SectionEffects:
+    metrics: Optional[GenerationMetrics] = None,
+    samples_per_bar: int = 1,
+) -> EffectsMatrix:
     """
-    Generate the effects of a section from markup (MarkupSection). For the moment -> returns string
+    Generate the effects of a section from markup (MarkupSection).
+
+    :param samples_per_bar: How many filter values to ask for per bar and instrument. More make for more detailed
+        sweeps (they're interpolated to 16th notes either way, see `EffectsMatrix.curves`), but longer completions.
     """
     if isinstance(llm, BaseLLM):
         raise NotImplementedError("This only works with chat models")
@@ -85,29 +97,68 @@ The text you produce will be programatically parsed into a song. Please follow t
                 HumanMessagePromptTemplate.from_template("{prompt}"),
             ]
         )
+        per_bar = f" ({samples_per_bar} per bar)" if samples_per_bar > 1 else ""
         _input = chat_prompt_template.format_messages(
-            prompt=f"""Realize the following description into the required format: {markup_section.instruments["Effects"]} with {number_bars} numbers per instrument (bass, drums, pad)""".strip(),
+            prompt=f"""Realize the following description into the required format: {markup_section.instruments["Effects"]} with {number_bars * samples_per_bar} numbers per instrument (bass, drums, pad){per_bar}""".strip(),
         )
 
         logger.debug(
             "Prompt:\n" + "\n".join([f"{x.type}: {x.content}" for x in _input])
         )
 
-        with get_openai_callback() as cb:
-            logger.info("Generating section (this make take a while)...")
-            output = llm(_input)
-
-        logger.info(
-            f"Used {cb.total_tokens} tokens ({cb.prompt_tokens} prompt, {cb.completion_tokens} completion) @ ${(cb.total_cost):.3f}"
+        cache = get_llm_cache()
+        # Keyed on the section too, as sections can have the same effects description
+        cached = (
+            await cache.alookup(_input, llm, markup_section.name) if cache else None
         )
-        result = output.content
+        if cached is not None:
+            record_cache_hit()
+            result = cached
+        else:
+            async with rate_limited(
+                estimate_tokens(_input, 20 + 15 * number_bars * samples_per_bar)
+            ) as record_usage:
+                with track_llm_call(_input, llm) as call:
+                    logger.info("Generating section (this make take a while)...")
+                    output = await llm.apredict_messages(_input, callbacks=[call])
+                record_usage(call.total_tokens)
+            result = output.content
     logger.debug(f"Output:\n{result}")
 
     # return SongSection.from_llm_format(
     #     text=result, name=markup_section.name, length=markup_section.number_bars
     # )
-    return SectionEffects.from_llm_text(
-        input_string=result, name=markup_section.name, sample_number=1
+    try:
+        section_effects = EffectsMatrix.from_llm_text(
+            result, name=markup_section.name, samples_per_bar=samples_per_bar
+        )
+    except ValueError:
+        # Includes pydantic's ValidationError
+        record_parse_failures(1)
+        raise
+    if cache and cached is None:
+        await cache.aupdate(_input, llm, result, markup_section.name)
+    return section_effects
+
+
+def generate_section_effects(
+    markup_section: MarkupSection,
+    number_bars: int,
+    llm: Union[BaseChatModel, BaseLLM],
+    metrics: Optional[GenerationMetrics] = None,
+    samples_per_bar: int = 1,
+) -> EffectsMatrix:
+    """
+    Synchronous wrapper around `agenerate_section_effects`.
+    """
+    return asyncio.run(
+        agenerate_section_effects(
+            markup_section=markup_section,
+            number_bars=number_bars,
+            llm=llm,
+            metrics=metrics,
+            samples_per_bar=samples_per_bar,
+        )
     )
 
 
@@ -1104,7 +1155,7 @@ if __name__ == "__main__":
         ),
     }
     i = -1  # jank for the moment bc fuck it
-    test = SongEffects(sections={})
+    test: dict[str, EffectsMatrix] = {}
     for section in sections:
         i += 1
         generated_section = generate_section_effects(
@@ -1114,7 +1165,7 @@ if __name__ == "__main__":
         )
         # print("description: ", sections[section].instruments["Effects"])
         # print("section: ", generated_section)
-        test.add_section(generated_section)
+        test[generated_section.name] = generated_section
 
     full_song = Song(sections=gen_song)
     full_song.add_effects(test)
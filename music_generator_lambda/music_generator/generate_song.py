@@ -1,37 +1,123 @@
-from typing import Union
+import asyncio
+from typing import Optional, Union
 
 from langchain.chat_models.base import BaseChatModel
 from langchain.llms.base import BaseLLM
 
-from music_generator.generate_section import generate_section
-from music_generator.generate_section_effects import generate_section_effects
+from music_generator.generate_section import agenerate_section
+from music_generator.generate_section_effects import agenerate_section_effects
 from music_generator.music_generator_types.markup_types import (
+    MarkupSection,
     MusicalMarkup,
 )
-from music_generator.music_generator_types.base_song_types import Song
+from music_generator.music_generator_types.base_song_types import (
+    BarEncoding,
+    Song,
+    SongSection,
+)
+from music_generator.music_generator_types.effects_matrix import EffectsMatrix
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.utilities.logs import get_logger
 
+logger = get_logger(__name__)
 
-def generate_song(
-    musical_markup: MusicalMarkup, llm: Union[BaseChatModel, BaseLLM], key: int = 0
+
+async def agenerate_song(
+    musical_markup: MusicalMarkup,
+    llm: Union[BaseChatModel, BaseLLM],
+    key: int = 0,
+    max_parallelism: int = 4,
+    encoding: BarEncoding = "full",
+    metrics: Optional[GenerationMetrics] = None,
+    effects_samples_per_bar: int = 1,
 ) -> Song:
-    song = Song()
+    """
+    Generate every section of the markup, running independent sections concurrently.
+
+    Sections only wait on the sections they reference (see `MusicalMarkup.dependency_graph`), so the wall-clock time
+    is roughly the depth of the dependency graph rather than the number of sections. Effects only need the bar count
+    from the markup, so they are generated alongside the notes and attached once both are done.
+
+    :param max_parallelism: The maximum number of LLM calls in flight at once.
+    :param encoding: The format the LLM writes bars in (see `agenerate_section`).
+    :param metrics: Collects the metrics of every section and effects attempt, if given.
+    :param effects_samples_per_bar: Filter values per bar (see `agenerate_section_effects`).
+    :return: A Song with its sections in markup order.
+    """
     sections = musical_markup.sections
+    graph = musical_markup.dependency_graph()
+    semaphore = asyncio.Semaphore(max_parallelism)
+    section_tasks: dict[str, "asyncio.Task[SongSection]"] = {}
 
-    # Note: This relies on the fact that the sections are ordered. Each section might reference a previous section.
-    for section in sections.keys():
-        generated_section = generate_section(
-            markup_section=sections[section], prev_gens=song, llm=llm
+    async def _generate(name: str) -> SongSection:
+        # Only the referenced sections are needed to build the prompt
+        prev_gens = Song(
+            sections=[await section_tasks[dependency] for dependency in graph[name]]
         )
-        generated_effects = generate_section_effects(
-            markup_section=sections[section],
-            number_bars=len(generated_section.bars),
-            llm=llm,
-        )
-        generated_section.apply_effects(generated_effects)
+        async with semaphore:
+            logger.info(f"Generating section {name} (depends on {graph[name]}).")
+            return await agenerate_section(
+                markup_section=sections[name],
+                prev_gens=prev_gens,
+                llm=llm,
+                encoding=encoding,
+                metrics=metrics,
+            )
+
+    async def _generate_effects(markup_section: MarkupSection) -> EffectsMatrix:
+        async with semaphore:
+            return await agenerate_section_effects(
+                markup_section=markup_section,
+                number_bars=markup_section.number_bars,
+                llm=llm,
+                metrics=metrics,
+                samples_per_bar=effects_samples_per_bar,
+            )
+
+    # Sections are created first so that they are first in line for the semaphore
+    for name in sections.keys():
+        section_tasks[name] = asyncio.ensure_future(_generate(name))
+    effects_tasks = [
+        asyncio.ensure_future(_generate_effects(x)) for x in sections.values()
+    ]
 
-        song.append_section(generated_section)
+    try:
+        generated = await asyncio.gather(*section_tasks.values())
+        generated_effects = await asyncio.gather(*effects_tasks)
+    except BaseException:
+        for task in [*section_tasks.values(), *effects_tasks]:
+            task.cancel()
+        raise
 
-    return song
+    for generated_section, effects in zip(generated, generated_effects):
+        generated_section.apply_effects(effects)
+
+    return Song(sections=generated)
+
+
+def generate_song(
+    musical_markup: MusicalMarkup,
+    llm: Union[BaseChatModel, BaseLLM],
+    key: int = 0,
+    max_parallelism: int = 4,
+    encoding: BarEncoding = "full",
+    metrics: Optional[GenerationMetrics] = None,
+    effects_samples_per_bar: int = 1,
+) -> Song:
+    """
+    Synchronous wrapper around `agenerate_song`.
+    """
+    return asyncio.run(
+        agenerate_song(
+            musical_markup=musical_markup,
+            llm=llm,
+            key=key,
+            max_parallelism=max_parallelism,
+            encoding=encoding,
+            metrics=metrics,
+            effects_samples_per_bar=effects_samples_per_bar,
+        )
+    )
 
 
 if __name__ == "__main__":
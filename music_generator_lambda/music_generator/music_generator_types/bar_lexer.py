@@ -0,0 +1,378 @@
+import re
+from typing import List, Literal, NamedTuple, Optional, Tuple
+
+from music_generator.music_generator_types.notes import NOTES
+from music_generator.utilities.logs import get_logger
+
+logger = get_logger(__name__)
+
+# "full" spells out all 16 cells of every row. "compact" uses hex drum rows, run-length rests and bar references.
+# See `Bar.to_compact_format`.
+BarEncoding = Literal["full", "compact"]
+
+DRUM_ROWS = ("hi_hat", "kick", "snare")
+ROWS = (*DRUM_ROWS, "bass", "pad")
+STEPS = 16
+PAD_LENGTHS = (1, 2, 4, 8, 16)
+
+# A chord, or a run of a chord (e.g. []*3 for three rests)
+_COMPACT_PAD_CELL = re.compile(r"\[([^\]]*)\](?:\*(\d+))?")
+
+
+class BarSyntaxError(ValueError):
+    """
+    An invalid bar, with the line and column (both 1-based, within the text being lexed) of the problem.
+    """
+
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"{message} (line {line}, column {column})")
+        self.message = message
+        self.line = line
+        self.column = column
+
+
+class LexedBar(NamedTuple):
+    """
+    One {{{...}}} block, validated but not yet made into a Bar.
+    """
+
+    # Position of the block's {{{
+    line: int
+    column: int
+    # hi_hat, kick and snare hits (1 = hit)
+    drums: Tuple[List[int], List[int], List[int]]
+    # 16 interned note spellings, "0" for rests
+    bass: List[str]
+    # 16 chords of interned note spellings (expanded, if fewer were given)
+    pad: List[List[str]]
+    # The rows that were missing, and were defaulted to rests
+    defaulted: Tuple[str, ...]
+    # A compact `{{{ = N }}}` reference to bar N (1-based) of the section. The other fields are empty.
+    reference: Optional[int] = None
+    # Set instead of the other fields if the block is invalid
+    error: Optional[BarSyntaxError] = None
+
+
+class _BarBuilder:
+    """
+    The rows of the block being lexed.
+    """
+
+    __slots__ = ("line", "column", "rows", "reference", "error")
+
+    def __init__(self, line: int, column: int):
+        self.line = line
+        self.column = column
+        # Row name -> (cells, line, column)
+        self.rows: dict[str, Tuple[str, int, int]] = {}
+        self.reference: Optional[int] = None
+        self.error: Optional[BarSyntaxError] = None
+
+
+class BarLexer:
+    """
+    Lexes {{{...}}} blocks out of an LLM completion in a single pass, as it arrives (see `feed`), so the cost is linear
+    in the text. Each block is validated as soon as its }}} arrives: duplicated rows, missing (defaulted) rows and
+    ragged rows are all caught in the same pass, with the line and column of the problem.
+
+    Text outside of blocks, and lines inside blocks that don't start with a row name, are skipped.
+
+    The rows are validated by the same rules as the Bar models' validators, so the Bar can be built from the
+    LexedBar without validating it again.
+    """
+
+    def __init__(self, encoding: BarEncoding = "full"):
+        self.encoding = encoding
+        # Position of the start of `_pending`
+        self.line = 1
+        self.column = 1
+        # Text that hasn't been lexed yet: at most the row being received, or the two characters that may start a {{{
+        self._pending = ""
+        self._bar: Optional[_BarBuilder] = None
+
+    @property
+    def pending(self) -> str:
+        return self._pending
+
+    def feed(self, text: str) -> List[LexedBar]:
+        """
+        :param text: The next chunk of the completion.
+        :return: The blocks closed by this chunk. Invalid blocks have their `error` set.
+        """
+        buffer = self._pending + text
+        bars: List[LexedBar] = []
+        position = 0
+        while True:
+            if self._bar is None:
+                start = buffer.find("{{{", position)
+                if start == -1:
+                    # Keep the last two characters, in case they're the start of a {{{
+                    keep = max(position, len(buffer) - 2)
+                    self._skip(buffer, position, keep)
+                    position = keep
+                    break
+                self._skip(buffer, position, start)
+                self._bar = _BarBuilder(self.line, self.column)
+                self.column += 3
+                position = start + 3
+                continue
+
+            newline = buffer.find("\n", position)
+            end = buffer.find(
+                "}}}", position, newline if newline != -1 else len(buffer)
+            )
+            if end != -1:
+                self._row(buffer[position:end])
+                self.column += end + 3 - position
+                position = end + 3
+                bars.append(self._finish(self._bar))
+                self._bar = None
+            elif newline != -1:
+                self._row(buffer[position:newline])
+                self.line += 1
+                self.column = 1
+                position = newline + 1
+            else:
+                # The rest of the row hasn't arrived yet
+                break
+        self._pending = buffer[position:]
+        return bars
+
+    def _skip(self, buffer: str, start: int, end: int) -> None:
+        newlines = buffer.count("\n", start, end)
+        if newlines:
+            self.line += newlines
+            self.column = end - buffer.rindex("\n", start, end)
+        else:
+            self.column += end - start
+
+    def _row(self, segment: str) -> None:
+        bar = self._bar
+        assert bar is not None
+        if bar.error is not None or bar.reference is not None:
+            return
+        content = segment.lstrip()
+        if not content:
+            return
+        column = self.column + len(segment) - len(content)
+
+        if self.encoding == "compact" and content.startswith("=") and not bar.rows:
+            reference = content[1:].strip()
+            if not reference.isdigit() or int(reference) < 1:
+                bar.error = BarSyntaxError(
+                    f"Invalid bar reference: {content.rstrip()}", self.line, column
+                )
+            else:
+                bar.reference = int(reference)
+            return
+
+        token = content.split(None, 1)[0]
+        # "bass: ..." is accepted too
+        name = token[:-1] if token.endswith(":") else token
+        if name not in ROWS:
+            return
+        if name in bar.rows:
+            bar.error = BarSyntaxError(
+                f"{name} must not be duplicated (first given on line {bar.rows[name][1]})",
+                self.line,
+                column,
+            )
+            return
+        bar.rows[name] = (content[len(token) :], self.line, column + len(token))
+
+    def _finish(self, bar: _BarBuilder) -> LexedBar:
+        def invalid(error: BarSyntaxError) -> LexedBar:
+            return LexedBar(bar.line, bar.column, ([], [], []), [], [], (), error=error)
+
+        if bar.error is not None:
+            return invalid(bar.error)
+        if bar.reference is not None:
+            return LexedBar(
+                bar.line, bar.column, ([], [], []), [], [], (), reference=bar.reference
+            )
+        if "pad" not in bar.rows:
+            return invalid(BarSyntaxError("pad is missing", bar.line, bar.column))
+
+        try:
+            compact = self.encoding == "compact"
+            drums = tuple(
+                (_compact_drums if compact else _drums)(name, *bar.rows[name])
+                if name in bar.rows
+                else [0] * STEPS
+                for name in DRUM_ROWS
+            )
+            bass = (
+                (_compact_bass if compact else _bass)(*bar.rows["bass"])
+                if "bass" in bar.rows
+                else ["0"] * STEPS
+            )
+            pad = (_compact_pad if compact else _pad)(*bar.rows["pad"])
+        except BarSyntaxError as e:
+            return invalid(e)
+
+        return LexedBar(
+            bar.line,
+            bar.column,
+            drums,  # type: ignore
+            bass,
+            pad,
+            tuple(name for name in ROWS if name not in bar.rows),
+        )
+
+
+def _column_of_cell(cells: str, column: int, index: int) -> int:
+    """
+    :return: The column of the `index`th whitespace separated cell of a row that starts at `column`.
+    """
+    for i, match in enumerate(re.finditer(r"\S+", cells)):
+        if i == index:
+            return column + match.start()
+    return column + len(cells.rstrip())
+
+
+def _check_length(name: str, cells: List, raw: str, line: int, column: int) -> None:
+    if len(cells) != STEPS:
+        # Point at the first extra cell, or the end of a short row
+        raise BarSyntaxError(
+            f"{name} must be {STEPS} notes long. Got {len(cells)}",
+            line,
+            _column_of_cell(raw, column, STEPS),
+        )
+
+
+def _drums(name: str, raw: str, line: int, column: int) -> List[int]:
+    cells = raw.split()
+    hits = []
+    for index, cell in enumerate(cells):
+        if cell == "1":
+            hits.append(1)
+        elif cell == "0":
+            hits.append(0)
+        else:
+            raise BarSyntaxError(
+                f"Drum values must be 0 or 1. Got {cell} in {name}",
+                line,
+                _column_of_cell(raw, column, index),
+            )
+    _check_length(name, hits, raw, line, column)
+    return hits
+
+
+def _compact_drums(name: str, raw: str, line: int, column: int) -> List[int]:
+    value = raw.strip()
+    try:
+        if len(value) != 4:
+            raise ValueError
+        bits = f"{int(value, 16):016b}"
+    except ValueError:
+        raise BarSyntaxError(
+            f"{name} must be 4 hex digits. Got {value}",
+            line,
+            _column_of_cell(raw, column, 0),
+        ) from None
+    return [1 if x == "1" else 0 for x in bits]
+
+
+def _note(cell: str, raw: str, line: int, column: int, index: int) -> str:
+    note = NOTES.get(cell)
+    if note is None:
+        raise BarSyntaxError(
+            f"{cell} is not a valid note format.",
+            line,
+            _column_of_cell(raw, column, index),
+        )
+    return note.spelling
+
+
+def _bass(raw: str, line: int, column: int) -> List[str]:
+    cells = raw.split()
+    notes = [
+        "0" if cell == "0" else _note(cell, raw, line, column, index)
+        for index, cell in enumerate(cells)
+    ]
+    _check_length("bass", notes, raw, line, column)
+    return notes
+
+
+def _compact_bass(raw: str, line: int, column: int) -> List[str]:
+    notes: List[str] = []
+    for index, cell in enumerate(raw.split()):
+        if cell.startswith("0*"):
+            if not cell[2:].isdigit():
+                raise BarSyntaxError(
+                    f"Invalid rest run: {cell}",
+                    line,
+                    _column_of_cell(raw, column, index),
+                )
+            run = int(cell[2:])
+        else:
+            run = 1
+        if len(notes) + run > STEPS:
+            raise BarSyntaxError(
+                f"bass must be {STEPS} notes long. Got more",
+                line,
+                _column_of_cell(raw, column, index),
+            )
+        if run == 1:
+            notes.append("0" if cell == "0" else _note(cell, raw, line, column, index))
+        else:
+            notes.extend(["0"] * run)
+    if len(notes) != STEPS:
+        raise BarSyntaxError(
+            f"bass must be {STEPS} notes long. Got {len(notes)}",
+            line,
+            column + len(raw.rstrip()),
+        )
+    return notes
+
+
+def _chord(text: str, line: int, column: int) -> List[str]:
+    return [
+        _note(cell, text, line, column, index)
+        for index, cell in enumerate(text.split())
+    ]
+
+
+def _expand_pad(chords: List[List[str]], line: int, column: int) -> List[List[str]]:
+    if len(chords) not in PAD_LENGTHS:
+        raise BarSyntaxError(
+            f"pad must have 1, 2, 4, 8 or 16 chords. Got {len(chords)}", line, column
+        )
+    if len(chords) != STEPS:
+        logger.info(
+            f"Did not receive 16 notes for Pad. Expanding {len(chords)} notes to 16."
+        )
+        repetition_factor = STEPS // len(chords)
+        return [chord for chord in chords for _ in range(repetition_factor)]
+    return chords
+
+
+def _pad(raw: str, line: int, column: int) -> List[List[str]]:
+    # Anything outside of [...] is ignored
+    chords = []
+    position = 0
+    while True:
+        start = raw.find("[", position)
+        if start == -1:
+            break
+        end = raw.find("]", start + 1)
+        if end == -1:
+            raise BarSyntaxError("Unclosed chord", line, column + start)
+        chords.append(_chord(raw[start + 1 : end], line, column + start + 1))
+        position = end + 1
+    return _expand_pad(chords, line, column)
+
+
+def _compact_pad(raw: str, line: int, column: int) -> List[List[str]]:
+    chords: List[List[str]] = []
+    for match in _COMPACT_PAD_CELL.finditer(raw):
+        chord = _chord(match.group(1), line, column + match.start() + 1)
+        run = int(match.group(2)) if match.group(2) else 1
+        if len(chords) + run > STEPS:
+            raise BarSyntaxError(
+                f"pad must have at most {STEPS} chords. Got more",
+                line,
+                column + match.start(),
+            )
+        chords.extend(list(chord) for _ in range(run))
+    return _expand_pad(chords, line, column)
@@ -1,20 +1,44 @@
 import re
-from typing import List, Optional, TypeVar
+from typing import (
+    Any,
+    Dict,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
 
 from pydantic import BaseModel, Field, validator
 
+from music_generator.music_generator_types.bar_lexer import (
+    BarEncoding,
+    BarLexer,
+    BarSyntaxError,
+    LexedBar,
+)
 from music_generator.music_generator_types.effect_types import (
     EffectBar,
     EffectInformation,
+    FilterInformation,
     SectionEffects,
     SongEffects,
 )
+from music_generator.music_generator_types.effects_matrix import EffectsMatrix
 from music_generator.music_generator_types.markup_types import MusicalMarkup
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.music_generator_types.notes import validate_note
 from music_generator.utilities.logs import get_logger
 
 # from music_generator.music_generator_types.markup_types import MusicalMarkup
 logger = get_logger(__name__)
 
+# How a SongRecord's song is stored: every bar in full, as a DeduplicatedSong (see deduplicated_song.py), or encoded
+# as binary (see song_codec.py)
+SongStorageLayout = Literal["full", "deduplicated", "columnar"]
+
 
 # This file dictates musicData.ts. If you modify this, modify that.
 class Config(BaseModel):
@@ -24,15 +48,25 @@ class Config(BaseModel):
     db_name: str
     # If None, don't cache
     llm_cache_filename: Optional[str]
+    # Cache sampled (temperature > 0) completions too, like the markup's, keyed on the song's date, so that generating
+    # a day's song again replays all of it. For development: songs of the same day are then the same.
+    llm_cache_sampled: bool = False
     langchain_api_key: Optional[str]
     langchain_project: Optional[str]
-
-
-def validate_note(note: str) -> str:
-    pattern = re.compile(r"^[A-G][#b]?[0-8]$")
-    if not pattern.match(note):
-        raise ValueError(f"{note} is not a valid note format.")
-    return note
+    song_storage_layout: SongStorageLayout = "full"
+    # How many of a song's LLM calls may be in flight at once (see `agenerate_song`). Backfills generate several songs
+    # at a time, each with its own limit.
+    max_parallelism: int = 4
+    # Settings of the MongoDB client shared by the process (see `db.get_mongo_client`). A Lambda container handles one
+    # invocation at a time, so it needs few connections.
+    mongo_max_pool_size: int = 10
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_connect_timeout_ms: int = 10_000
+    mongo_server_selection_timeout_ms: int = 10_000
+    mongo_socket_timeout_ms: Optional[int] = None
+    # "majority", or how many members must acknowledge each write
+    mongo_write_concern: Union[int, str] = "majority"
 
 
 class BassBar(BaseModel):
@@ -42,7 +76,8 @@ class BassBar(BaseModel):
     pattern: list[str] = Field(
         description="Bass-line of a house song. Sixteenth notes. '0' = rest, 'Cb3' = C-flat 3 note, 'E2' = E2 note, 'G#4' = G-sharp 4 note, etc."
     )
-    effects: Optional[EffectInformation] = Field(default=None)
+    # `Bar.apply_effects` attaches the FilterInformation itself, so that's what stored songs have
+    effects: Optional[Union[EffectInformation, FilterInformation]] = Field(default=None)
 
     @validator("pattern")
     def validate_note_count(cls, field: list[str]) -> list[str]:
@@ -79,7 +114,7 @@ class DrumBar(BaseModel):
     snare: Optional[list[int]] = Field(
         description="Snare track, 16ths. 1 = hit, 0 = rest."
     )
-    effects: Optional[EffectInformation] = Field(default=None)
+    effects: Optional[Union[EffectInformation, FilterInformation]] = Field(default=None)
 
     def to_keypairs(self) -> dict[str, str]:
         # Yep this is a special case, returns a dict
@@ -150,7 +185,7 @@ def expand_if_necessary(field: list[T], length: int) -> list[T]:
 
 class PadBar(BaseModel):
     chord_sequence: Optional[list[Chord]]
-    effects: Optional[EffectInformation] = Field(default=None)
+    effects: Optional[Union[EffectInformation, FilterInformation]] = Field(default=None)
 
     @validator("chord_sequence")
     def validate_combinations(cls, field: list[str]) -> list[str]:
@@ -305,39 +340,7 @@ class Bar(BaseModel):
 
         """
 
-        # Isolate the music NOTE: NOT NEEDED ANYMORE HANDLED BY SongSection class but kept here incase needed later
-        # match = re.search(r"\{\{\{(.+?)\}\}\}", text, re.DOTALL)
-        # if not match:
-        #     logger.error(f"Invalid LLM format:\n{text}")
-        #     raise ValueError("Invalid LLM format. Must be wrapped in {{{...}}}")
-
-        # Splitting the input string by newline to process each line
-        # text = match.group(1)
-        lines = text.split("\n")
-
-        # Filter out instrument names
-        default_value = "0 " * 15 + "0"
-        data = {
-            k: [
-                line[len(k) + 1 :]
-                for line in filter(lambda line: line.startswith(k), lines)
-            ]
-            if any(line.startswith(k) for line in lines)
-            else [default_value]
-            for k in ("hi_hat", "kick", "snare", "bass", "pad")
-        }
-
-        for k, v in data.items():
-            if len(v) > 1:
-                logger.warning(f"Invalid structured text format:\n{text}")
-                raise ValueError(
-                    f"Invalid structured text format. {k} must must not be duplicated. Got {v}"
-                )
-
-        # We know there is one per key
-        data = {k: v[0] for k, v in data.items()}
-
-        return Bar.from_keypairs(data)
+        return Bar._from_block(text, encoding="full")
 
     @staticmethod
     def from_keypairs(data: dict[str, str]) -> "Bar":
@@ -397,6 +400,121 @@ class Bar(BaseModel):
             + "\n}}}"
         )
 
+    def to_compact_format(self, previous: Sequence["Bar"] = ()) -> str:
+        """
+        :param previous: The bars that came before this one in the section.
+        :return: A token-efficient string representation of the bar (see `from_compact_format`).
+
+        If the bar is the same as a previous one, it is written as a reference to it:
+
+        {{{ = 1 }}}
+
+        Otherwise drum rows are 4 hex digits (the first 16th is the most significant bit), and runs of rests in the bass
+        and pad are written as `0*N` and `[]*N`:
+
+        {{{
+        hi_hat aaaa
+        kick 8888
+        snare 0808
+        bass C2 0*3 A2 0*3 F2 0*3 G2 0*3
+        pad [C3 E3 G3 B3] []*3 [A3 C4 E4 G4] []*3 [F3 A3 C4 E4] []*3 [G3 B3 D4 F4] []*3
+        }}}
+        """
+        for index, bar in enumerate(previous):
+            if bar == self:
+                return f"{{{{{{ = {index + 1} }}}}}}"
+
+        def run_length(cells: list[str], rest: str) -> str:
+            encoded: list[str] = []
+            run = 0
+            for cell in cells + [""]:
+                if cell == rest:
+                    run += 1
+                    continue
+                if run:
+                    encoded.append(rest if run == 1 else f"{rest}*{run}")
+                    run = 0
+                if cell:
+                    encoded.append(cell)
+            return " ".join(encoded)
+
+        lines = [
+            f"{drum_type} {int(''.join(str(x) for x in sequence), 2):04x}"
+            for drum_type, sequence in (
+                ("hi_hat", self.drums.hi_hat),
+                ("kick", self.drums.kick),
+                ("snare", self.drums.snare),
+            )
+            if sequence is not None
+        ]
+        lines.append("bass " + run_length(self.bass.pattern, "0"))
+        chords = [
+            f"[{' '.join(chord.notes)}]" for chord in self.pad.chord_sequence or []
+        ]
+        lines.append("pad " + run_length(chords, "[]"))
+        return "{{{\n" + "\n".join(lines) + "\n}}}"
+
+    @staticmethod
+    def from_compact_format(
+        text: str, previous: Sequence[Optional["Bar"]] = ()
+    ) -> "Bar":
+        """
+        :param text: A bar in the format produced by `to_compact_format`.
+        :param previous: The bars that came before this one, which `{{{ = N }}}` references resolve against.
+        :return: A Bar object.
+        """
+        return Bar._from_block(text, encoding="compact", previous=previous)
+
+    @staticmethod
+    def _from_block(
+        text: str, encoding: BarEncoding, previous: Sequence[Optional["Bar"]] = ()
+    ) -> "Bar":
+        if "{{{" not in text:
+            text = "{{{\n" + text + "\n}}}"
+        lexed = BarLexer(encoding=encoding).feed(text)
+        if not lexed:
+            raise ValueError("Invalid LLM format. Must be wrapped in {{{...}}}")
+        return Bar.from_lexed(lexed[0], previous=previous)
+
+    @staticmethod
+    def from_lexed(lexed: LexedBar, previous: Sequence[Optional["Bar"]] = ()) -> "Bar":
+        """
+        :param lexed: A block lexed by `BarLexer`.
+        :param previous: The bars that came before this one, which `{{{ = N }}}` references resolve against.
+        :return: A Bar object. The lexer has already validated the rows, so it's built without validating them again.
+        :raises BarSyntaxError: If the block is invalid.
+        """
+        if lexed.error is not None:
+            raise lexed.error
+        if lexed.reference is not None:
+            if lexed.reference > len(previous):
+                raise BarSyntaxError(
+                    f"Invalid bar reference: {lexed.reference}",
+                    lexed.line,
+                    lexed.column,
+                )
+            referenced = previous[lexed.reference - 1]
+            if referenced is None:
+                raise BarSyntaxError(
+                    f"Bar reference {lexed.reference} points to an invalid bar.",
+                    lexed.line,
+                    lexed.column,
+                )
+            return referenced.copy(deep=True)
+
+        if lexed.defaulted:
+            logger.info(
+                f"Bar on line {lexed.line} has no {', '.join(lexed.defaulted)}. Defaulting to rests."
+            )
+        hi_hat, kick, snare = lexed.drums
+        return Bar.construct(
+            drums=DrumBar.construct(hi_hat=hi_hat, kick=kick, snare=snare),
+            bass=BassBar.construct(pattern=lexed.bass),
+            pad=PadBar.construct(
+                chord_sequence=[Chord.construct(notes=notes) for notes in lexed.pad]
+            ),
+        )
+
     def apply_effects(self, effects: EffectBar):
         for instrument in ["drums", "bass", "pad"]:
             effect_info = getattr(effects, f"{instrument}_effects")
@@ -411,12 +529,16 @@ class SongSection(BaseModel):
     name: str
 
     @staticmethod
-    def from_llm_format(text: str, name: str, length: int) -> "SongSection":
+    def from_llm_format(
+        text: str, name: str, length: int, encoding: BarEncoding = "full"
+    ) -> "SongSection":
         """
         :param text: A string representation of the section in the format expected by the LLM.
         :param name: A string representation of the section name.
         :param length: An int representing number of bars that should be made.
+        :param encoding: The format of each bar (see `BarEncoding`).
         :return: A SongSection object.
+        :raises BarSyntaxError: For the first invalid bar, with its line and column in `text`.
 
         The format is as follows:
 
@@ -437,18 +559,14 @@ class SongSection(BaseModel):
 
         """
 
-        pattern = r"{{{[\s\S]+?}}}"
-        matches = re.findall(pattern, text, re.DOTALL)
-        if not matches:
+        bar_array: List[Bar] = []
+        for lexed in BarLexer(encoding=encoding).feed(text):
+            bar_array.append(Bar.from_lexed(lexed, previous=bar_array))
+
+        if not bar_array:
             logger.error(f"Invalid LLM format:\n{text}")
             raise ValueError("Invalid LLM format. Must be wrapped in {{{...}}}")
 
-        bar_array = []
-
-        for match in matches:
-            match_bar = Bar.from_llm_format(match)
-            bar_array.append(match_bar)
-
         # if len(bar_array) != length:
         #     raise ValueError(
         #         f"Incorrect number of bars generated, generated {len(bar_array)} bars not {length}"
@@ -459,25 +577,157 @@ class SongSection(BaseModel):
     def __getitem__(self, index: int) -> Bar:
         return self.bars[index]
 
-    def apply_effects(self, effects: SectionEffects):
+    def apply_effects(self, effects: Union[SectionEffects, EffectsMatrix]):
         """
         add effects (SectionEffects) to the bars of a section
 
-        :param effects: A SectionEffects object
+        Effects are generated from the markup's bar count, which the generated notes don't always match. When the
+        counts differ, the effects are stretched (or truncated) over the bars that were actually generated.
+
+        :param effects: A SectionEffects object, or an EffectsMatrix, whose automation is applied as 16th-note curves
         """
+        num_effects_bars = (
+            effects.num_bars
+            if isinstance(effects, EffectsMatrix)
+            else len(effects.bars)
+        )
+        if not num_effects_bars:
+            logger.warning(f"No effects to apply to section {self.name}.")
+            return
+        if num_effects_bars != len(self.bars):
+            logger.info(
+                f"Section {self.name} has {len(self.bars)} bars but {num_effects_bars} bars of effects. Stretching effects to fit."
+            )
+        if isinstance(effects, EffectsMatrix):
+            effects.resized(len(self.bars)).apply(self.bars)
+            return
         for index, bar in enumerate(self.bars):
+            bar.apply_effects(
+                effects=effects.bars[index * len(effects.bars) // len(self.bars)]
+            )
+
+
+class SongSectionStreamParser:
+    """
+    Incrementally parses a streamed LLM completion into the bars of a SongSection.
+
+    Each {{{...}}} block is validated into a Bar as soon as it is closed, so an invalid bar raises while the
+    completion is still streaming, and the caller can stop reading once `length` bars have been collected.
+
+    When `strict` is False, invalid bars are recorded (in `errors`) instead of raised, so that only those bars need to
+    be regenerated and spliced back in (see `missing_indices` and `splice`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        length: int,
+        strict: bool = True,
+        encoding: BarEncoding = "full",
+        reference_bars: Optional[List[Optional[Bar]]] = None,
+    ):
+        """
+        :param name: A string representation of the section name.
+        :param length: An int representing number of bars that should be made.
+        :param strict: Whether to raise as soon as a bar is invalid.
+        :param encoding: The format of each bar (see `BarEncoding`).
+        :param reference_bars: The bars that compact `{{{ = N }}}` references resolve against. Defaults to the bars
+            parsed by this parser.
+        """
+        self.name = name
+        self.length = length
+        self.strict = strict
+        self.encoding = encoding
+        # None marks an invalid bar
+        self.bars: List[Optional[Bar]] = []
+        self._reference_bars = (
+            reference_bars if reference_bars is not None else self.bars
+        )
+        self.errors: dict[int, str] = {}
+        self._lexer = BarLexer(encoding=encoding)
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.bars) >= self.length
+
+    @property
+    def missing_indices(self) -> List[int]:
+        """
+        :return: The indices of the bars that are invalid or haven't been received.
+        """
+        return [
+            i for i in range(self.length) if i >= len(self.bars) or self.bars[i] is None
+        ]
+
+    def feed(self, text: str) -> List[Optional[Bar]]:
+        """
+        :param text: The next chunk of the completion.
+        :return: The bars closed by this chunk (None for invalid bars when not strict).
+        :raises ValueError: (or pydantic's ValidationError) as soon as a closed bar is invalid, when strict.
+        """
+        new_bars: List[Optional[Bar]] = []
+        for lexed in self._lexer.feed(text):
+            if self.is_complete:
+                break
             try:
-                bar.apply_effects(effects=effects.bars[index])
-            except IndexError:
+                bar: Optional[Bar] = Bar.from_lexed(
+                    lexed, previous=self._reference_bars
+                )
+            except ValueError as e:
+                if self.strict:
+                    raise
                 logger.warning(
-                    f"IndexError when attempting to apply effect[{index}] to bar[{index}]"
+                    f"Bar {len(self.bars) + 1} of {self.name} is invalid: {e}"
                 )
-                continue
+                self.errors[len(self.bars)] = str(e)
+                bar = None
+            self.bars.append(bar)
+            new_bars.append(bar)
+        return new_bars
+
+    def splice(self, index: int, bar: Bar) -> None:
+        """
+        Put a regenerated bar in place of an invalid or missing one.
+        """
+        while len(self.bars) <= index:
+            self.errors[len(self.bars)] = "missing"
+            self.bars.append(None)
+        self.bars[index] = bar
+        self.errors.pop(index, None)
+
+    def result(self) -> SongSection:
+        """
+        :return: A SongSection made of the bars parsed so far.
+        """
+        bars = [bar for bar in self.bars if bar is not None]
+        if not bars:
+            logger.error(f"Invalid LLM format:\n{self._lexer.pending}")
+            raise ValueError("Invalid LLM format. Must be wrapped in {{{...}}}")
+        if len(bars) != len(self.bars):
+            raise ValueError(
+                f"Invalid bars in section {self.name}: "
+                + "; ".join(f"bar {i + 1}: {e}" for i, e in self.errors.items())
+            )
+        return SongSection(bars=bars, name=self.name)
 
 
 class Song(BaseModel):
     sections: List[SongSection] = []
 
+    def dict(self, **kwargs: Any) -> Dict[str, Any]:
+        self._materialize_sections()
+        return super().dict(**kwargs)
+
+    def json(self, **kwargs: Any) -> str:
+        self._materialize_sections()
+        return super().json(**kwargs)
+
+    def _materialize_sections(self) -> None:
+        # Loaded songs build their sections lazily (see song_loader.LazySectionList). pydantic would copy that list
+        # as its own class when exporting, so exports would hold lazy sections rather than plain data
+        if type(self.sections) is not list:
+            object.__setattr__(self, "sections", list(self.sections))
+
     def __len__(self):
         return len(self.sections)
 
@@ -487,9 +737,19 @@ class Song(BaseModel):
     def append_section(self, item: SongSection) -> None:
         self.sections.append(item)
 
-    def add_effects(self, song_effects: SongEffects):
+    def add_effects(
+        self, song_effects: Union[SongEffects, Mapping[str, EffectsMatrix]]
+    ):
+        """
+        :param song_effects: The effects of every section: a SongEffects, or each section's EffectsMatrix by name.
+        """
+        sections = (
+            song_effects.sections
+            if isinstance(song_effects, SongEffects)
+            else song_effects
+        )
         for section in self.sections:
-            section.apply_effects(effects=song_effects.sections[section.name])
+            section.apply_effects(effects=sections[section.name])
 
 
 class SongRecord(BaseModel):
@@ -497,3 +757,4 @@ class SongRecord(BaseModel):
     song: Song
     created_at_utc: str
     markup: MusicalMarkup
+    metrics: Optional[GenerationMetrics] = None
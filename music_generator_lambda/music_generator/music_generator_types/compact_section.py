@@ -0,0 +1,235 @@
+from array import array
+from typing import List, Optional, Union
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    SongSection,
+)
+from music_generator.music_generator_types.effect_types import (
+    EffectInformation,
+    FilterInformation,
+)
+from music_generator.music_generator_types.notes import (
+    NOTE_CODES,
+    NOTE_SPELLINGS,
+    NOTES,
+)
+
+STEPS = 16
+DRUMS = ("hi_hat", "kick", "snare")
+INSTRUMENTS = ("drums", "bass", "pad")
+
+# Note code -> MIDI note number. Code 0 (a rest) maps to 0, but is never looked up.
+_MIDI_BY_CODE = array("B", [0] + [NOTES[x].midi for x in NOTE_SPELLINGS])
+
+# What an instrument's `effects` holds. `Bar.apply_effects` attaches the FilterInformation itself.
+_NO_EFFECTS, _FILTER_EFFECTS, _EFFECT_INFORMATION = 0, 1, 2
+
+
+class CompactSection:
+    """
+    A whole section in a few flat arrays, instead of a tree of pydantic models per bar (a 16 chord pad alone is 17
+    models and 17 lists). For parsing, transforming and analysing songs in memory. Convert to and from SongSection at
+    the persistence boundary with `from_section` and `to_section`, which round-trip losslessly.
+
+    Notes are stored as their spelling's code (see `notes.NOTE_CODES`, 0 = rest), so "Cb3" stays "Cb3" rather than
+    becoming B2. Use `bass_midi` and `chord_midi` for MIDI note numbers.
+
+    Layout, for bar b, sixteenth s, drum d (see DRUMS), instrument i (see INSTRUMENTS) and chord tone n:
+        drums[(b * 3 + d) * 16 + s]            1 = hit, 0 = rest
+        drums_present[b * 3 + d]               0 if the drum's row is None
+        bass[b * 16 + s]                       note code
+        pad[(b * 16 + s) * chord_width + n]    note code, 0-padded past the end of the chord
+        pad_present[b]                         0 if the bar's chord_sequence is None
+        effect_kinds[b * 3 + i]                0 = no effects, 1 = a FilterInformation, 2 = an EffectInformation
+        effect_filter_types[b * 3 + i]         index into filter_types
+        effect_values[effect_value_offsets[b * 3 + i]:effect_value_offsets[b * 3 + i + 1]]    filter values
+    """
+
+    __slots__ = (
+        "name",
+        "num_bars",
+        "chord_width",
+        "drums",
+        "drums_present",
+        "bass",
+        "pad",
+        "pad_present",
+        "filter_types",
+        "effect_kinds",
+        "effect_filter_types",
+        "effect_value_offsets",
+        "effect_values",
+    )
+
+    def __init__(self, name: str, num_bars: int, chord_width: int = 4):
+        """
+        An empty (silent) section.
+
+        :param chord_width: The most notes any chord can have.
+        """
+        self.name = name
+        self.num_bars = num_bars
+        self.chord_width = chord_width
+        self.drums = array("B", bytes(num_bars * len(DRUMS) * STEPS))
+        self.drums_present = array("B", [1]) * (num_bars * len(DRUMS))
+        self.bass = array("B", bytes(num_bars * STEPS))
+        self.pad = array("B", bytes(num_bars * STEPS * chord_width))
+        self.pad_present = array("B", [1]) * num_bars
+        self.filter_types: List[str] = []
+        self.effect_kinds = array("B", bytes(num_bars * len(INSTRUMENTS)))
+        self.effect_filter_types = array("H", bytes(2 * num_bars * len(INSTRUMENTS)))
+        self.effect_value_offsets = array("I", [0]) * (num_bars * len(INSTRUMENTS) + 1)
+        self.effect_values = array("d")
+
+    def __len__(self) -> int:
+        return self.num_bars
+
+    @staticmethod
+    def from_section(section: SongSection) -> "CompactSection":
+        chord_width = max(
+            (
+                len(chord.notes)
+                for bar in section.bars
+                for chord in bar.pad.chord_sequence or []
+            ),
+            default=1,
+        )
+        compact = CompactSection(
+            name=section.name,
+            num_bars=len(section.bars),
+            chord_width=max(chord_width, 1),
+        )
+        filter_type_indices: dict[str, int] = {}
+
+        for b, bar in enumerate(section.bars):
+            for d, drum in enumerate(DRUMS):
+                row = getattr(bar.drums, drum)
+                if row is None:
+                    compact.drums_present[b * 3 + d] = 0
+                else:
+                    start = (b * 3 + d) * STEPS
+                    compact.drums[start : start + STEPS] = array("B", row)
+
+            compact.bass[b * STEPS : (b + 1) * STEPS] = array(
+                "B", [0 if x == "0" else NOTE_CODES[x] for x in bar.bass.pattern]
+            )
+
+            if bar.pad.chord_sequence is None:
+                compact.pad_present[b] = 0
+            else:
+                for s, chord in enumerate(bar.pad.chord_sequence):
+                    start = (b * STEPS + s) * compact.chord_width
+                    compact.pad[start : start + len(chord.notes)] = array(
+                        "B", [NOTE_CODES[x] for x in chord.notes]
+                    )
+
+            for i, instrument in enumerate(INSTRUMENTS):
+                effects: Union[None, FilterInformation, EffectInformation] = getattr(
+                    bar, instrument
+                ).effects
+                index = b * 3 + i
+                if effects is not None:
+                    if isinstance(effects, EffectInformation):
+                        compact.effect_kinds[index] = _EFFECT_INFORMATION
+                        effects = effects.filter
+                    else:
+                        compact.effect_kinds[index] = _FILTER_EFFECTS
+                    if effects.filter_type not in filter_type_indices:
+                        filter_type_indices[effects.filter_type] = len(
+                            compact.filter_types
+                        )
+                        compact.filter_types.append(effects.filter_type)
+                    compact.effect_filter_types[index] = filter_type_indices[
+                        effects.filter_type
+                    ]
+                    compact.effect_values.extend(effects.filter_value)
+                compact.effect_value_offsets[index + 1] = len(compact.effect_values)
+
+        return compact
+
+    def to_section(self) -> SongSection:
+        return SongSection(
+            bars=[self.bar(b) for b in range(self.num_bars)], name=self.name
+        )
+
+    def bar(self, b: int) -> Bar:
+        """
+        :return: Bar `b` as a Bar model.
+        """
+        rows = {
+            drum: list(self.drums[(b * 3 + d) * STEPS : (b * 3 + d + 1) * STEPS])
+            if self.drums_present[b * 3 + d]
+            else None
+            for d, drum in enumerate(DRUMS)
+        }
+        bar = Bar(
+            drums=DrumBar(**rows),
+            bass=BassBar(
+                pattern=[
+                    NOTE_SPELLINGS[x - 1] if x else "0"
+                    for x in self.bass[b * STEPS : (b + 1) * STEPS]
+                ]
+            ),
+            pad=PadBar(
+                chord_sequence=[
+                    Chord(notes=[NOTE_SPELLINGS[x - 1] for x in self._chord(b, s) if x])
+                    for s in range(STEPS)
+                ]
+                if self.pad_present[b]
+                else None
+            ),
+        )
+
+        for i, instrument in enumerate(INSTRUMENTS):
+            index = b * 3 + i
+            kind = self.effect_kinds[index]
+            if kind == _NO_EFFECTS:
+                continue
+            effects: Union[FilterInformation, EffectInformation] = FilterInformation(
+                filter_type=self.filter_types[self.effect_filter_types[index]],
+                filter_value=list(
+                    self.effect_values[
+                        self.effect_value_offsets[index] : self.effect_value_offsets[
+                            index + 1
+                        ]
+                    ]
+                ),
+            )
+            if kind == _EFFECT_INFORMATION:
+                effects = EffectInformation(filter=effects)
+            getattr(bar, instrument).effects = effects
+
+        return bar
+
+    def drum_row(self, b: int, drum: str) -> Optional[array]:
+        """
+        :return: The drum's 16 hits in bar `b` (1 = hit), or None if the bar has no row for it.
+        """
+        d = DRUMS.index(drum)
+        if not self.drums_present[b * 3 + d]:
+            return None
+        return self.drums[(b * 3 + d) * STEPS : (b * 3 + d + 1) * STEPS]
+
+    def bass_midi(self, b: int) -> List[Optional[int]]:
+        """
+        :return: The MIDI note number of each sixteenth of the bass in bar `b`. None for rests.
+        """
+        return [
+            _MIDI_BY_CODE[x] if x else None
+            for x in self.bass[b * STEPS : (b + 1) * STEPS]
+        ]
+
+    def chord_midi(self, b: int, s: int) -> List[int]:
+        """
+        :return: The MIDI note numbers of the pad chord on sixteenth `s` of bar `b`. Empty for a rest.
+        """
+        return [_MIDI_BY_CODE[x] for x in self._chord(b, s) if x]
+
+    def _chord(self, b: int, s: int) -> array:
+        start = (b * STEPS + s) * self.chord_width
+        return self.pad[start : start + self.chord_width]
@@ -0,0 +1,186 @@
+from typing import Any, Dict, Hashable, List, Literal, Optional, Sequence, Union
+
+from pydantic import BaseModel, root_validator
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    Song,
+    SongSection,
+)
+from music_generator.music_generator_types.effect_types import (
+    EffectInformation,
+    FilterInformation,
+)
+
+Effects = Optional[Union[EffectInformation, FilterInformation]]
+TRACKS = ("drums", "bass", "pad")
+
+
+class DeduplicatedSection(BaseModel):
+    name: str
+    # For each bar, the index of its drums, bass and pad in the song's tables
+    drums: List[int]
+    bass: List[int]
+    pad: List[int]
+    # For each bar, the effects of each track. Effects are per bar automation, so they're kept out of the tables
+    # (where they'd make every bar distinct). None if no bar of the section has any.
+    drums_effects: Optional[List[Effects]] = None
+    bass_effects: Optional[List[Effects]] = None
+    pad_effects: Optional[List[Effects]] = None
+
+
+class DeduplicatedSong(BaseModel):
+    """
+    A Song that stores each distinct drum, bass and pad bar once, and its sections as sequences of indices into them.
+
+    Sections repeat themselves (the same drum bar 8 or 16 times), and tracks repeat independently of each other (the
+    drums stay while the bass changes), so each track has its own table. Convert with `from_song` and `to_song`, which
+    round-trip losslessly. Stored as a SongRecord's `song` when `Config.song_storage_layout` is "deduplicated".
+    """
+
+    layout: Literal["deduplicated"] = "deduplicated"
+    # Distinct bars of each track, without effects
+    drums: List[DrumBar]
+    bass: List[BassBar]
+    pad: List[PadBar]
+    sections: List[DeduplicatedSection]
+
+    @root_validator(skip_on_failure=True)
+    def validate_indices(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        for section in values["sections"]:
+            num_bars = len(section.drums)
+            for track in TRACKS:
+                indices = getattr(section, track)
+                effects = getattr(section, f"{track}_effects")
+                if len(indices) != num_bars or (
+                    effects is not None and len(effects) != num_bars
+                ):
+                    raise ValueError(
+                        f"Section {section.name} has {num_bars} bars, but a different number of {track}."
+                    )
+                if any(not 0 <= i < len(values[track]) for i in indices):
+                    raise ValueError(
+                        f"Section {section.name} refers to {track} that don't exist."
+                    )
+        return values
+
+    @classmethod
+    def from_song(cls, song: Song) -> "DeduplicatedSong":
+        tables: Dict[str, Dict[Hashable, int]] = {track: {} for track in TRACKS}
+        rows: Dict[str, List[Any]] = {track: [] for track in TRACKS}
+
+        def index(track: str, key: Hashable, build: Any) -> int:
+            table = tables[track]
+            if key not in table:
+                table[key] = len(rows[track])
+                rows[track].append(build())
+            return table[key]
+
+        sections = []
+        for section in song.sections:
+            indices: Dict[str, List[int]] = {track: [] for track in TRACKS}
+            effects: Dict[str, List[Effects]] = {track: [] for track in TRACKS}
+            for bar in section.bars:
+                drums, bass, pad = bar.drums, bar.bass, bar.pad
+                indices["drums"].append(
+                    index(
+                        "drums",
+                        (_key(drums.hi_hat), _key(drums.kick), _key(drums.snare)),
+                        lambda: DrumBar.construct(
+                            hi_hat=drums.hi_hat, kick=drums.kick, snare=drums.snare
+                        ),
+                    )
+                )
+                indices["bass"].append(
+                    index(
+                        "bass",
+                        tuple(bass.pattern),
+                        lambda: BassBar.construct(pattern=bass.pattern),
+                    )
+                )
+                indices["pad"].append(
+                    index(
+                        "pad",
+                        None
+                        if pad.chord_sequence is None
+                        else tuple(tuple(x.notes) for x in pad.chord_sequence),
+                        lambda: PadBar.construct(chord_sequence=pad.chord_sequence),
+                    )
+                )
+                for track in TRACKS:
+                    effects[track].append(bar[track].effects)
+
+            sections.append(
+                DeduplicatedSection.construct(
+                    name=section.name,
+                    **indices,
+                    **{
+                        f"{track}_effects": effects[track]
+                        if any(x is not None for x in effects[track])
+                        else None
+                        for track in TRACKS
+                    },
+                )
+            )
+
+        return cls.construct(
+            layout="deduplicated",
+            drums=rows["drums"],
+            bass=rows["bass"],
+            pad=rows["pad"],
+            sections=sections,
+        )
+
+    def to_song(self) -> Song:
+        """
+        :return: The song, with every bar its own copy of the tables' rows.
+        """
+        sections = []
+        for section in self.sections:
+            bars = []
+            for i, (drums_index, bass_index, pad_index) in enumerate(
+                zip(section.drums, section.bass, section.pad)
+            ):
+                drums = self.drums[drums_index]
+                chord_sequence = self.pad[pad_index].chord_sequence
+                bars.append(
+                    Bar.construct(
+                        drums=DrumBar.construct(
+                            hi_hat=_copy(drums.hi_hat),
+                            kick=_copy(drums.kick),
+                            snare=_copy(drums.snare),
+                            effects=_effects(section.drums_effects, i),
+                        ),
+                        bass=BassBar.construct(
+                            pattern=list(self.bass[bass_index].pattern),
+                            effects=_effects(section.bass_effects, i),
+                        ),
+                        pad=PadBar.construct(
+                            chord_sequence=None
+                            if chord_sequence is None
+                            else [
+                                Chord.construct(notes=list(x.notes))
+                                for x in chord_sequence
+                            ],
+                            effects=_effects(section.pad_effects, i),
+                        ),
+                    )
+                )
+            sections.append(SongSection.construct(bars=bars, name=section.name))
+        return Song.construct(sections=sections)
+
+
+def _key(row: Optional[Sequence[Any]]) -> Optional[tuple]:
+    return None if row is None else tuple(row)
+
+
+def _copy(row: Optional[List[int]]) -> Optional[List[int]]:
+    return None if row is None else list(row)
+
+
+def _effects(effects: Optional[List[Effects]], index: int) -> Effects:
+    return None if effects is None else effects[index]
@@ -85,6 +85,7 @@ class SectionEffects(BaseModel):
         :param name: Name of the section.
         :param sample_number: Number of filter values per bar
         :return: An instance of SectionEffects.
+        :raises ValueError: If no line of the text is in the format.
         """
         lines = input_string.strip().split("\n")
         instrument_effects = {}
@@ -97,6 +98,8 @@ class SectionEffects(BaseModel):
                 instrument_effects[instrument] = effects
             except ValueError as ve:
                 print(f"Error processing line '{line}': {ve}")
+        if not instrument_effects:
+            raise ValueError("No effects found in the provided text.")
 
         # Ensure all instruments are present
         for instrument in ["drums", "bass", "pad"]:
@@ -0,0 +1,274 @@
+from array import array
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from music_generator.music_generator_types.effect_types import (
+    EffectBar,
+    EffectInformation,
+    FilterInformation,
+    SectionEffects,
+)
+from music_generator.utilities.logs import get_logger
+
+if TYPE_CHECKING:
+    from music_generator.music_generator_types.base_song_types import Bar
+
+logger = get_logger(__name__)
+
+INSTRUMENTS = ("drums", "bass", "pad")
+STEPS = 16
+# Curves are rounded to this many decimals. Far finer than a filter sweep can be heard, and it keeps them compact when
+# stored (see song_codec.py).
+CURVE_DECIMALS = 3
+
+
+class EffectsMatrix:
+    """
+    A section's filter automation as one matrix: a row per instrument (see INSTRUMENTS), and `samples_per_bar` columns
+    per bar. Unlike SectionEffects (a model per bar per instrument), it's a single flat array however many samples
+    there are. When applied to bars, the samples are interpolated into 16th-note automation curves (see `curves`), so
+    that sweeps are smooth rather than a step per bar.
+
+    Layout, for instrument i, bar b and sample s:
+        values[(i * num_bars + b) * samples_per_bar + s]
+        filter_types[i]     the instrument's filter, or "" if it has none (its values are then 0)
+    """
+
+    __slots__ = ("name", "num_bars", "samples_per_bar", "filter_types", "values")
+
+    def __init__(
+        self,
+        name: str,
+        num_bars: int,
+        samples_per_bar: int = 1,
+        filter_types: Optional[List[str]] = None,
+        values: Optional[array] = None,
+    ):
+        """
+        :param values: See the layout. No automation (all 0) if None.
+        """
+        self.name = name
+        self.num_bars = num_bars
+        self.samples_per_bar = samples_per_bar
+        self.filter_types = filter_types or [""] * len(INSTRUMENTS)
+        self.values = (
+            array("d", bytes(8 * len(INSTRUMENTS) * num_bars * samples_per_bar))
+            if values is None
+            else values
+        )
+
+    def __len__(self) -> int:
+        return self.num_bars
+
+    def row(self, instrument: str) -> array:
+        """
+        :return: The instrument's samples, `samples_per_bar` for each bar.
+        """
+        width = self.num_bars * self.samples_per_bar
+        i = INSTRUMENTS.index(instrument)
+        return self.values[i * width : (i + 1) * width]
+
+    @staticmethod
+    def from_llm_text(
+        text: str, name: str, samples_per_bar: int = 1
+    ) -> "EffectsMatrix":
+        """
+        Parse the LLM's effects, in the format SectionEffects.from_llm_text reads:
+
+            #pad lowpass 1.0 1.0 1.0 1.0
+            #bass hipass 1.0 0.3 0.2 0.8
+
+        Lines that aren't in the format are skipped, and instruments without a line have no filter. An instrument
+        with fewer samples than the others holds its last one.
+
+        :param samples_per_bar: How many of each instrument's numbers make up a bar.
+        :raises ValueError: If no line of the text is in the format.
+        """
+        rows: Dict[str, Tuple[str, List[float]]] = {}
+        for line in text.strip().split("\n"):
+            parts = line.split()
+            if not parts:
+                continue
+            instrument = parts[0].replace("#", "")
+            try:
+                if instrument not in INSTRUMENTS:
+                    raise ValueError(f"Invalid instrument name: {instrument}")
+                if len(parts) < 3:
+                    raise ValueError("No filter values")
+                rows[instrument] = (parts[1], [float(x) for x in parts[2:]])
+            except ValueError as e:
+                logger.warning(f"Skipping effects line '{line}': {e}")
+        if not rows:
+            raise ValueError("No effects found in the provided text.")
+
+        num_bars = max(
+            -(-len(samples) // samples_per_bar) for _, samples in rows.values()
+        )
+        width = num_bars * samples_per_bar
+        matrix = EffectsMatrix(
+            name=name, num_bars=num_bars, samples_per_bar=samples_per_bar
+        )
+        for i, instrument in enumerate(INSTRUMENTS):
+            if instrument not in rows:
+                continue
+            filter_type, samples = rows[instrument]
+            matrix.filter_types[i] = filter_type
+            matrix.values[i * width : (i + 1) * width] = array(
+                "d", samples[:width] + samples[-1:] * (width - len(samples))
+            )
+        return matrix
+
+    @staticmethod
+    def from_section_effects(effects: SectionEffects) -> "EffectsMatrix":
+        """
+        :return: The effects as a matrix, with as many samples per bar as the bar with the most has. Bars with fewer
+            hold their last sample.
+        """
+        bars = [
+            (x.drums_effects.filter, x.bass_effects.filter, x.pad_effects.filter)
+            for x in effects.bars
+        ]
+        samples_per_bar = max(
+            (len(x.filter_value) for bar in bars for x in bar), default=1
+        )
+        matrix = EffectsMatrix(
+            name=effects.name,
+            num_bars=len(bars),
+            samples_per_bar=max(samples_per_bar, 1),
+        )
+        width = matrix.num_bars * matrix.samples_per_bar
+        for i in range(len(INSTRUMENTS)):
+            filter_types = {bar[i].filter_type for bar in bars} - {""}
+            if not filter_types:
+                continue
+            if len(filter_types) > 1:
+                logger.warning(
+                    f"Section {effects.name} changes filter type mid-section. Using the first."
+                )
+            matrix.filter_types[i] = next(
+                bar[i].filter_type for bar in bars if bar[i].filter_type
+            )
+            row: List[float] = []
+            for bar in bars:
+                samples = bar[i].filter_value or [row[-1] if row else 0.0]
+                row.extend(
+                    samples + samples[-1:] * (matrix.samples_per_bar - len(samples))
+                )
+            matrix.values[i * width : (i + 1) * width] = array("d", row)
+        return matrix
+
+    def to_section_effects(self) -> SectionEffects:
+        """
+        :return: The effects with their samples (rather than curves) as each bar's filter values.
+        """
+        rows = [self.row(x) for x in INSTRUMENTS]
+        k = self.samples_per_bar
+
+        def _effects(i: int, b: int) -> EffectInformation:
+            filter_type = self.filter_types[i]
+            return EffectInformation(
+                filter=FilterInformation(
+                    filter_type=filter_type,
+                    filter_value=rows[i][b * k : (b + 1) * k].tolist()
+                    if filter_type
+                    else [],
+                )
+            )
+
+        return SectionEffects(
+            bars=[
+                EffectBar(
+                    drums_effects=_effects(0, b),
+                    bass_effects=_effects(1, b),
+                    pad_effects=_effects(2, b),
+                )
+                for b in range(self.num_bars)
+            ],
+            name=self.name,
+        )
+
+    def resized(self, num_bars: int) -> "EffectsMatrix":
+        """
+        :return: The effects stretched (or truncated) over `num_bars` bars, a bar at a time, like
+            `SongSection.apply_effects` does with SectionEffects.
+        """
+        if num_bars == self.num_bars:
+            return self
+        k = self.samples_per_bar
+        values = array("d")
+        for i in range(len(INSTRUMENTS)):
+            start = i * self.num_bars * k
+            for b in range(num_bars):
+                source = start + b * self.num_bars // num_bars * k
+                values.extend(self.values[source : source + k])
+        return EffectsMatrix(
+            name=self.name,
+            num_bars=num_bars,
+            samples_per_bar=k,
+            filter_types=list(self.filter_types),
+            values=values,
+        )
+
+    def curves(self) -> List[array]:
+        """
+        :return: For each instrument, its automation on every sixteenth of the section: the value it reaches by the
+            end of the sixteenth, which is when the web player sets it (see Scheduler.ts). The samples fall evenly
+            over each bar, each reached by the end of its share of it, so with one sample per bar the filter sweeps
+            from one bar's value to the next over the next bar, as it did when the player set each bar's value at its
+            end. Values are interpolated linearly between samples, and the first sample is held until it's reached.
+        """
+        left, right, weights = _interpolation(self.samples_per_bar, self.num_bars)
+        curves = []
+        for instrument in INSTRUMENTS:
+            row = self.row(instrument)
+            curves.append(
+                array(
+                    "d",
+                    [
+                        round(row[a] + (row[b] - row[a]) * w, CURVE_DECIMALS)
+                        for a, b, w in zip(left, right, weights)
+                    ],
+                )
+            )
+        return curves
+
+    def apply(self, bars: Sequence["Bar"]) -> None:
+        """
+        Set the effects of every instrument of every bar to its filter, with its 16 step curve as the filter values.
+
+        :raises ValueError: If there isn't a bar for every bar of effects (see `resized`).
+        """
+        if len(bars) != self.num_bars:
+            raise ValueError(
+                f"{self.num_bars} bars of effects can't be applied to {len(bars)} bars."
+            )
+        curves = self.curves()
+        for i, instrument in enumerate(INSTRUMENTS):
+            filter_type = self.filter_types[i]
+            curve = curves[i]
+            for b, bar in enumerate(bars):
+                getattr(bar, instrument).effects = FilterInformation.construct(
+                    filter_type=filter_type,
+                    filter_value=curve[b * STEPS : (b + 1) * STEPS].tolist()
+                    if filter_type
+                    else [],
+                )
+
+
+@lru_cache(maxsize=128)
+def _interpolation(samples_per_bar: int, num_bars: int) -> Tuple[array, array, array]:
+    """
+    :return: For each sixteenth of `num_bars` bars, the samples before and after its end, and the weight of the one
+        after. Sample j is at the end of the (j + 1)th share of the bar, so the last one ends the section.
+    """
+    last = num_bars * samples_per_bar - 1
+    left = array("I")
+    right = array("I")
+    weights = array("d")
+    for step in range(num_bars * STEPS):
+        position = max((step + 1) * samples_per_bar / STEPS - 1, 0.0)
+        before = int(position)
+        left.append(min(before, last))
+        right.append(min(before + 1, last))
+        weights.append(position - before if before < last else 0.0)
+    return left, right, weights
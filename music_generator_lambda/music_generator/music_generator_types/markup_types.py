@@ -3,6 +3,11 @@ from pydantic import BaseModel, Field
 import re
 
 
+# The instruments that a section's prompt describes, with the bars of the sections they reference (see
+# generate_section.py). Effects are generated separately, from their description alone.
+SECTION_PROMPT_INSTRUMENTS = ("Bass", "Pad", "Drums")
+
+
 class MarkupInstrument(BaseModel):
     description: str
     dependencies: List[str]
@@ -84,3 +89,29 @@ class MusicalMarkup(BaseModel):
             )
 
         return MusicalMarkup(original_text=outline, sections=sections_dict)
+
+    def dependency_graph(self) -> Dict[str, List[str]]:
+        """
+        :return: A mapping of section name -> names of the sections it references (via %section-name), in song order.
+
+        Only references to *earlier* sections are kept. A section can only be conditioned on material that has
+        already been generated, so forward references and references to unknown sections are dropped (which also
+        guarantees the graph is acyclic). Only the references of SECTION_PROMPT_INSTRUMENTS count, as the others
+        (e.g. Effects) don't make the section's prompt need the referenced section's bars.
+        """
+        graph: Dict[str, List[str]] = {}
+        seen: Dict[str, str] = {}  # upper-cased name: section name
+        for name, section in self.sections.items():
+            dependencies = []
+            for instrument_name in SECTION_PROMPT_INSTRUMENTS:
+                instrument = section.instruments.get(instrument_name)
+                if instrument is None:
+                    continue
+                for dependency in instrument.dependencies:
+                    match = seen.get(dependency.upper())
+                    if match is not None and match not in dependencies:
+                        dependencies.append(match)
+            # Keep song order, so prompts built from these are deterministic
+            graph[name] = [x for x in self.sections.keys() if x in dependencies]
+            seen[name.upper()] = name
+        return graph
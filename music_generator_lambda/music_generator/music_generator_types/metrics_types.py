@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class StageAttempt(BaseModel):
+    """
+    One attempt at one stage of generating a song (including the LLM calls it made and the parsing of their output).
+    """
+
+    stage: str = Field(description="markup, section, effects or encode_song")
+    section: Optional[str] = Field(default=None, description="Section name, if any")
+    attempt: int = Field(
+        default=1, description="1 for the first try, 2 for the first retry, etc."
+    )
+    wall_time_seconds: float = 0.0
+    time_to_first_token_seconds: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    llm_calls: int = 0
+    cached_llm_calls: int = 0
+    parse_failures: int = 0
+    error: Optional[str] = None
+
+
+class GenerationMetrics(BaseModel):
+    """
+    Latency, token and cost metrics for every stage and attempt of generating a song. The totals are kept up to date
+    by `add`, so that they can be queried without unwinding `attempts`.
+    """
+
+    attempts: List[StageAttempt] = []
+    wall_time_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    retries: int = 0
+    parse_failures: int = 0
+
+    def next_attempt_number(self, stage: str, section: Optional[str]) -> int:
+        return 1 + sum(
+            1 for x in self.attempts if x.stage == stage and x.section == section
+        )
+
+    def add(self, attempt: StageAttempt) -> None:
+        self.attempts.append(attempt)
+        self.prompt_tokens += attempt.prompt_tokens
+        self.completion_tokens += attempt.completion_tokens
+        self.cost += attempt.cost
+        self.retries += attempt.attempt > 1
+        self.parse_failures += attempt.parse_failures
@@ -0,0 +1,63 @@
+import sys
+from typing import Dict, NamedTuple, Tuple
+
+_LETTER_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_ACCIDENTAL_SEMITONES = {"": 0, "#": 1, "b": -1}
+
+
+class Note(NamedTuple):
+    spelling: str
+    # Index into NOTE_SPELLINGS + 1. 0 is reserved for a rest (or an empty chord slot), so codes all fit in a byte.
+    code: int
+    # C4 = 60. Enharmonic spellings share a number, e.g. "Cb3" and "B2" are both 47.
+    midi: int
+    # 0 = C, 1 = C#/Db, ..., 11 = B
+    pitch_class: int
+
+
+# Every legal note spelling: a letter, an optional sharp or flat, and an octave from 0 to 8. Interned, so that every
+# validated note shares its string with the table.
+NOTE_SPELLINGS: Tuple[str, ...] = tuple(
+    sys.intern(f"{letter}{accidental}{octave}")
+    for octave in range(9)
+    for letter in _LETTER_SEMITONES
+    for accidental in _ACCIDENTAL_SEMITONES
+)
+
+
+def _note(spelling: str, code: int) -> Note:
+    midi = (
+        (int(spelling[-1]) + 1) * 12
+        + _LETTER_SEMITONES[spelling[0]]
+        + _ACCIDENTAL_SEMITONES[spelling[1:-1]]
+    )
+    return Note(spelling=spelling, code=code, midi=midi, pitch_class=midi % 12)
+
+
+# Spelling -> Note, for every legal spelling
+NOTES: Dict[str, Note] = {
+    spelling: _note(spelling, code)
+    for code, spelling in enumerate(NOTE_SPELLINGS, start=1)
+}
+
+# Spelling -> code
+NOTE_CODES: Dict[str, int] = {spelling: note.code for spelling, note in NOTES.items()}
+
+
+def validate_note(note: str) -> str:
+    """
+    :param note: A note spelling, e.g. "C4", "F#2" or "Cb3".
+    :return: The interned spelling.
+    """
+    try:
+        return NOTES[note].spelling
+    except KeyError:
+        raise ValueError(f"{note} is not a valid note format.") from None
+
+
+def note_to_midi(note: str) -> int:
+    """
+    :param note: A note spelling, e.g. "C4", "F#2" or "Cb3".
+    :return: Its MIDI note number (C4 = 60).
+    """
+    return NOTES[note].midi
@@ -0,0 +1,531 @@
+"""
+A compact, versioned binary encoding of Song and SongEffects, for storage (see `Config.song_storage_layout`).
+
+Songs are encoded column by column: each section's drums, bass and pad are fixed-width arrays, with one entry per
+bar, drum or sixteenth, and no key names. Notes, chords and filter types are stored once per song, in dictionaries
+that the arrays index into. All integers are little-endian. Version 1:
+
+    header          "GGSN" (a Song) or "GGFX" (a SongEffects), then u8 version
+    notes           u8 count, then each spelling as a u8 length and ASCII. Note code c is notes[c - 1], 0 is a rest.
+    chords          u16 count, then each as a u8 length and the note codes. Empty for a SongEffects.
+    filter types    u8 count, then each as a u16 length and UTF-8
+    sections        u16 count, then for each:
+        name            u16 length and UTF-8
+        bars            u16
+        A Song's section continues with:
+        flags           u8 per bar: bits 0-2 set if it has a hi-hat, kick or snare row, bit 3 if it has a pad
+        drums           u16 per bar and drum (0 for a missing row): bit s set for a hit on sixteenth s
+        bass            u8 per bar and sixteenth: note code
+        pad width       u8: 1 or 2, the size of a chord index
+        pad             u8 or u16 per sixteenth of each bar that has a pad: chord index
+        Both continue with the effects of each bar and instrument (drums, bass, pad):
+        effect kinds    u8 per bar and instrument: 0 none, 1 a FilterInformation, 2 an EffectInformation
+        filter types    u8 per bar and instrument: index into filter types
+        value counts    u8 per bar and instrument: filter values
+        value format    u8: 0 for f64 values, 1 for i16 thousandths (when they all round-trip)
+        values          every filter value, in order
+
+Decoding builds models with `construct`, trusting that what was encoded was valid, as the encoder only encodes songs
+whose rows are the right length.
+"""
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    Song,
+    SongSection,
+)
+from music_generator.music_generator_types.compact_section import CompactSection
+from music_generator.music_generator_types.effect_types import (
+    EffectBar,
+    EffectInformation,
+    FilterInformation,
+    SectionEffects,
+    SongEffects,
+)
+from music_generator.music_generator_types.notes import NOTE_CODES
+
+VERSION = 1
+SONG_MAGIC = b"GGSN"
+EFFECTS_MAGIC = b"GGFX"
+
+STEPS = 16
+_HAS_PAD = 1 << 3
+_NO_EFFECTS, _FILTER_EFFECTS, _EFFECT_INFORMATION = 0, 1, 2
+_VALUES_F64, _VALUES_THOUSANDTHS = 0, 1
+# A byte of drum hits -> the 8 hits, 1 byte each
+_HITS = [bytes((x >> s) & 1 for s in range(8)) for x in range(256)]
+
+Effects = Optional[Union[EffectInformation, FilterInformation]]
+
+
+class SongDecodeError(ValueError):
+    """
+    Data that isn't an encoded song (or effects), or is of a version this code can't read.
+    """
+
+
+def encode_song(song: Song) -> bytes:
+    """
+    :raises ValueError: If a row isn't 16 sixteenths long, or the song has too many distinct notes or filter types.
+    """
+    writer = _Writer()
+    notes: _Dictionary = _Dictionary(start=1)
+    chords: _Dictionary = _Dictionary()
+    filter_types: _Dictionary = _Dictionary()
+
+    writer.pack("<H", len(song.sections))
+    for section in song.sections:
+        bars = section.bars
+        writer.string(section.name)
+        writer.pack("<H", len(bars))
+        flags = array("B")
+        drums = array("H")
+        bass = array("B")
+        pad: List[int] = []
+        for bar in bars:
+            flag = 0
+            for d, row in enumerate(
+                (bar.drums.hi_hat, bar.drums.kick, bar.drums.snare)
+            ):
+                if row is None:
+                    drums.append(0)
+                    continue
+                flag |= 1 << d
+                drums.append(_bits(_checked(row, "drum row")))
+            bass.extend(
+                0 if x == "0" else notes.code(x)
+                for x in _checked(bar.bass.pattern, "bass line")
+            )
+            if bar.pad.chord_sequence is not None:
+                flag |= _HAS_PAD
+                pad.extend(
+                    chords.code(tuple(notes.code(x) for x in chord.notes))
+                    for chord in _checked(bar.pad.chord_sequence, "chord sequence")
+                )
+            flags.append(flag)
+        writer.array(flags)
+        writer.array(drums)
+        writer.array(bass)
+        pad_width = 1 if max(pad, default=0) < 256 else 2
+        writer.pack("<B", pad_width)
+        writer.array(array("B" if pad_width == 1 else "H", pad))
+        _write_effects(
+            writer,
+            filter_types,
+            [(bar.drums.effects, bar.bass.effects, bar.pad.effects) for bar in bars],
+        )
+
+    return _header(SONG_MAGIC, notes, chords, filter_types) + writer.getvalue()
+
+
+def decode_song(data: Union[bytes, memoryview]) -> Song:
+    """
+    :raises SongDecodeError: If `data` isn't an encoded song, or is of a newer version.
+    """
+    reader = _Reader(data)
+    spellings, chords, filter_types = _read_header(reader, SONG_MAGIC)
+    sections = []
+    for _ in range(reader.unpack("<H")):
+        name = reader.string()
+        num_bars = reader.unpack("<H")
+        flags = reader.array("B", num_bars)
+        drums = reader.array("H", num_bars * 3)
+        bass = reader.array("B", num_bars * STEPS)
+        pad_width = reader.unpack("<B")
+        pad = reader.array(
+            "B" if pad_width == 1 else "H",
+            sum(1 for x in flags if x & _HAS_PAD) * STEPS,
+        )
+        effects = _read_effects(reader, filter_types, num_bars)
+
+        bars = []
+        pad_start = 0
+        for b in range(num_bars):
+            flag = flags[b]
+            rows = [
+                _row(drums[b * 3 + d]) if flag & (1 << d) else None for d in range(3)
+            ]
+            chord_sequence = None
+            if flag & _HAS_PAD:
+                chord_sequence = [
+                    Chord.construct(notes=list(chords[x]))
+                    for x in pad[pad_start : pad_start + STEPS]
+                ]
+                pad_start += STEPS
+            bars.append(
+                Bar.construct(
+                    drums=DrumBar.construct(
+                        hi_hat=rows[0],
+                        kick=rows[1],
+                        snare=rows[2],
+                        effects=effects[b * 3],
+                    ),
+                    bass=BassBar.construct(
+                        pattern=[
+                            spellings[x] for x in bass[b * STEPS : (b + 1) * STEPS]
+                        ],
+                        effects=effects[b * 3 + 1],
+                    ),
+                    pad=PadBar.construct(
+                        chord_sequence=chord_sequence, effects=effects[b * 3 + 2]
+                    ),
+                )
+            )
+        sections.append(SongSection.construct(bars=bars, name=name))
+    return Song.construct(sections=sections)
+
+
+def decode_compact_sections(data: Union[bytes, memoryview]) -> List[CompactSection]:
+    """
+    Decode a song straight into CompactSections, for jobs that analyse or transform songs without needing models.
+    Much faster than `decode_song`, as it's mostly copying arrays.
+
+    :raises SongDecodeError: If `data` isn't an encoded song, or is of a newer version.
+    """
+    reader = _Reader(data)
+    spellings, chords, filter_types = _read_header(reader, SONG_MAGIC)
+    # The song's note codes, as NOTE_CODES
+    note_codes = bytes([0] + [NOTE_CODES[x] for x in spellings[1:]]).ljust(256, b"\0")
+    chord_width = max(max((len(x) for x in chords), default=1), 1)
+    chord_codes = [
+        bytes(NOTE_CODES[x] for x in chord).ljust(chord_width, b"\0")
+        for chord in chords
+    ]
+    silent_bar = bytes(STEPS * chord_width)
+
+    sections = []
+    for _ in range(reader.unpack("<H")):
+        compact = CompactSection(
+            name=reader.string(), num_bars=reader.unpack("<H"), chord_width=chord_width
+        )
+        flags = reader.array("B", compact.num_bars)
+        drums = reader.array("H", compact.num_bars * 3)
+        bass = reader.array("B", compact.num_bars * STEPS)
+        pad_width = reader.unpack("<B")
+        pad = reader.array(
+            "B" if pad_width == 1 else "H",
+            sum(1 for x in flags if x & _HAS_PAD) * STEPS,
+        )
+        effects = _read_effect_columns(reader, compact.num_bars)
+
+        compact.drums = array(
+            "B", b"".join(_HITS[x & 0xFF] + _HITS[x >> 8] for x in drums)
+        )
+        compact.drums_present = array(
+            "B", [(flag >> d) & 1 for flag in flags for d in range(3)]
+        )
+        compact.bass = array("B", bass.tobytes().translate(note_codes))
+        if len(pad) == compact.num_bars * STEPS:
+            compact.pad = array("B", b"".join(map(chord_codes.__getitem__, pad)))
+        else:
+            # Bars without a pad are silent
+            pad_bars = []
+            pad_start = 0
+            for flag in flags:
+                if flag & _HAS_PAD:
+                    pad_bars.append(
+                        b"".join(
+                            map(
+                                chord_codes.__getitem__,
+                                pad[pad_start : pad_start + STEPS],
+                            )
+                        )
+                    )
+                    pad_start += STEPS
+                else:
+                    pad_bars.append(silent_bar)
+            compact.pad = array("B", b"".join(pad_bars))
+        compact.pad_present = array("B", [(flag >> 3) & 1 for flag in flags])
+        compact.filter_types = list(filter_types)
+        compact.effect_kinds = effects.kinds
+        compact.effect_filter_types = array("H", effects.types)
+        compact.effect_value_offsets = array("I", accumulate(effects.counts, initial=0))
+        compact.effect_values = array("d", effects.values)
+        sections.append(compact)
+    return sections
+
+
+def encode_song_effects(song_effects: SongEffects) -> bytes:
+    """
+    :raises ValueError: If the effects have too many distinct filter types.
+    """
+    writer = _Writer()
+    filter_types: _Dictionary = _Dictionary()
+    writer.pack("<H", len(song_effects.sections))
+    for name, section in song_effects.sections.items():
+        writer.string(name)
+        writer.pack("<H", len(section.bars))
+        _write_effects(
+            writer,
+            filter_types,
+            [(x.drums_effects, x.bass_effects, x.pad_effects) for x in section.bars],
+        )
+    return (
+        _header(EFFECTS_MAGIC, _Dictionary(start=1), _Dictionary(), filter_types)
+        + writer.getvalue()
+    )
+
+
+def decode_song_effects(data: Union[bytes, memoryview]) -> SongEffects:
+    """
+    :raises SongDecodeError: If `data` isn't encoded effects, or is of a newer version.
+    """
+    reader = _Reader(data)
+    _, _, filter_types = _read_header(reader, EFFECTS_MAGIC)
+    sections = {}
+    for _ in range(reader.unpack("<H")):
+        name = reader.string()
+        num_bars = reader.unpack("<H")
+        effects = _read_effects(reader, filter_types, num_bars)
+        sections[name] = SectionEffects.construct(
+            bars=[
+                EffectBar.construct(
+                    drums_effects=_effect_information(effects[b * 3]),
+                    bass_effects=_effect_information(effects[b * 3 + 1]),
+                    pad_effects=_effect_information(effects[b * 3 + 2]),
+                )
+                for b in range(num_bars)
+            ],
+            name=name,
+        )
+    return SongEffects.construct(sections=sections)
+
+
+class _Dictionary:
+    """
+    Assigns each distinct value a code, in the order they're first seen.
+    """
+
+    def __init__(self, start: int = 0):
+        self.start = start
+        self.values: List[Hashable] = []
+        self._codes: Dict[Hashable, int] = {}
+
+    def code(self, value: Hashable) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values) + self.start
+            self.values.append(value)
+        return code
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def pack(self, fmt: str, *values: int) -> None:
+        self._parts.append(struct.pack(fmt, *values))
+
+    def string(self, value: str, length_format: str = "<H") -> None:
+        encoded = value.encode("utf-8")
+        self.pack(length_format, len(encoded))
+        self._parts.append(encoded)
+
+    def array(self, values: array) -> None:
+        if sys.byteorder == "big" and values.itemsize > 1:
+            values = array(values.typecode, values)
+            values.byteswap()
+        self._parts.append(values.tobytes())
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._parts)
+
+
+class _Reader:
+    def __init__(self, data: Union[bytes, memoryview]):
+        self._data = memoryview(data)
+        self._offset = 0
+
+    def remaining(self) -> int:
+        return len(self._data) - self._offset
+
+    def take(self, size: int) -> memoryview:
+        if self._offset + size > len(self._data):
+            raise SongDecodeError("The data ends early.")
+        start = self._offset
+        self._offset += size
+        return self._data[start : self._offset]
+
+    def unpack(self, fmt: str) -> int:
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))[0]
+
+    def string(self, length_format: str = "<H") -> str:
+        return str(self.take(self.unpack(length_format)), "utf-8")
+
+    def array(self, typecode: str, count: int) -> array:
+        values = array(typecode)
+        values.frombytes(self.take(count * values.itemsize))
+        if sys.byteorder == "big" and values.itemsize > 1:
+            values.byteswap()
+        return values
+
+
+def _header(
+    magic: bytes, notes: _Dictionary, chords: _Dictionary, filter_types: _Dictionary
+) -> bytes:
+    if len(notes.values) > 255 or len(filter_types.values) > 255:
+        raise ValueError("Too many distinct notes or filter types to encode.")
+    if len(chords.values) > 65535:
+        raise ValueError("Too many distinct chords to encode.")
+    writer = _Writer()
+    writer.pack("<4sB", magic, VERSION)
+    writer.pack("<B", len(notes.values))
+    for note in notes.values:
+        writer.string(note, "<B")  # type: ignore
+    writer.pack("<H", len(chords.values))
+    for chord in chords.values:
+        writer.pack("<B", len(chord))  # type: ignore
+        writer.array(array("B", chord))  # type: ignore
+    writer.pack("<B", len(filter_types.values))
+    for filter_type in filter_types.values:
+        writer.string(filter_type)  # type: ignore
+    return writer.getvalue()
+
+
+def _read_header(
+    reader: _Reader, magic: bytes
+) -> Tuple[List[str], List[Tuple[str, ...]], List[str]]:
+    """
+    :return: The spelling of each note code (with "0" for a rest), the notes of each chord, and the filter types.
+    """
+    if reader.remaining() < 5 or bytes(reader.take(4)) != magic:
+        raise SongDecodeError(f"Not encoded with {magic!r}.")
+    version = reader.unpack("<B")
+    if version > VERSION:
+        raise SongDecodeError(
+            f"Encoded with version {version}, but only {VERSION} can be read."
+        )
+    spellings = ["0"] + [
+        sys.intern(reader.string("<B")) for _ in range(reader.unpack("<B"))
+    ]
+    chords = [
+        tuple(spellings[x] for x in reader.array("B", reader.unpack("<B")))
+        for _ in range(reader.unpack("<H"))
+    ]
+    filter_types = [reader.string() for _ in range(reader.unpack("<B"))]
+    return spellings, chords, filter_types
+
+
+def _write_effects(
+    writer: _Writer,
+    filter_types: _Dictionary,
+    bars: Sequence[Tuple[Effects, Effects, Effects]],
+) -> None:
+    kinds = array("B")
+    types = array("B")
+    counts = array("B")
+    values = array("d")
+    for bar in bars:
+        for effects in bar:
+            if effects is None:
+                kinds.append(_NO_EFFECTS)
+                types.append(0)
+                counts.append(0)
+                continue
+            if isinstance(effects, EffectInformation):
+                kinds.append(_EFFECT_INFORMATION)
+                effects = effects.filter
+            else:
+                kinds.append(_FILTER_EFFECTS)
+            types.append(min(filter_types.code(effects.filter_type), 255))
+            if len(effects.filter_value) > 255:
+                raise ValueError("Too many filter values in a bar to encode.")
+            counts.append(len(effects.filter_value))
+            values.extend(effects.filter_value)
+
+    writer.array(kinds)
+    writer.array(types)
+    writer.array(counts)
+    thousandths = array("h")
+    for value in values:
+        scaled = round(value * 1000)
+        if not -32768 <= scaled <= 32767 or scaled / 1000 != value:
+            writer.pack("<B", _VALUES_F64)
+            writer.array(values)
+            return
+        thousandths.append(scaled)
+    writer.pack("<B", _VALUES_THOUSANDTHS)
+    writer.array(thousandths)
+
+
+class _EffectColumns(NamedTuple):
+    kinds: array
+    types: array
+    counts: array
+    values: List[float]
+
+
+def _read_effect_columns(reader: _Reader, num_bars: int) -> _EffectColumns:
+    kinds = reader.array("B", num_bars * 3)
+    types = reader.array("B", num_bars * 3)
+    counts = reader.array("B", num_bars * 3)
+    value_format = reader.unpack("<B")
+    if value_format == _VALUES_THOUSANDTHS:
+        values = [x / 1000 for x in reader.array("h", sum(counts))]
+    else:
+        values = reader.array("d", sum(counts)).tolist()
+    return _EffectColumns(kinds, types, counts, values)
+
+
+def _read_effects(
+    reader: _Reader, filter_types: List[str], num_bars: int
+) -> List[Effects]:
+    """
+    :return: The effects of each bar and instrument, drums, bass and pad for bar 0, then for bar 1, and so on.
+    """
+    columns = _read_effect_columns(reader, num_bars)
+    values = columns.values
+    effects: List[Effects] = []
+    start = 0
+    for kind, filter_type, count in zip(columns.kinds, columns.types, columns.counts):
+        if kind == _NO_EFFECTS:
+            effects.append(None)
+            continue
+        filter_information = FilterInformation.construct(
+            filter_type=filter_types[filter_type],
+            filter_value=values[start : start + count],
+        )
+        start += count
+        effects.append(
+            EffectInformation.construct(filter=filter_information)
+            if kind == _EFFECT_INFORMATION
+            else filter_information
+        )
+    return effects
+
+
+def _effect_information(effects: Effects) -> EffectInformation:
+    if effects is None:
+        return EffectInformation.construct(
+            filter=FilterInformation.construct(filter_type="", filter_value=[])
+        )
+    if isinstance(effects, FilterInformation):
+        return EffectInformation.construct(filter=effects)
+    return effects
+
+
+def _checked(row: Sequence, name: str) -> Sequence:
+    if len(row) != STEPS:
+        raise ValueError(f"Can't encode a {name} of {len(row)} sixteenths.")
+    return row
+
+
+def _bits(row: Sequence[int]) -> int:
+    bits = 0
+    for s, hit in enumerate(row):
+        if hit:
+            bits |= 1 << s
+    return bits
+
+
+def _row(bits: int) -> List[int]:
+    return list(_HITS[bits & 0xFF] + _HITS[bits >> 8])
@@ -0,0 +1,238 @@
+import random
+from typing import Any, Callable, Iterator, List, Mapping, Optional, Sequence, Union
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    Song,
+    SongRecord,
+    SongSection,
+)
+from music_generator.music_generator_types.deduplicated_song import (
+    TRACKS,
+    DeduplicatedSong,
+)
+from music_generator.music_generator_types.effect_types import (
+    EffectInformation,
+    FilterInformation,
+)
+from music_generator.music_generator_types.markup_types import (
+    MarkupInstrument,
+    MarkupSection,
+    MusicalMarkup,
+)
+from music_generator.music_generator_types.metrics_types import (
+    GenerationMetrics,
+    StageAttempt,
+)
+from music_generator.music_generator_types.song_codec import decode_song
+
+# Stored documents: dicts, or pymongo's RawBSONDocument (which only decodes the parts that are accessed)
+Document = Mapping[str, Any]
+
+
+class LazySectionList(list):
+    """
+    The sections of a song, each built from its stored document the first time it's accessed.
+
+    Holds the documents until then, so comparing the list itself (rather than the Song) compares documents.
+    """
+
+    def __init__(
+        self,
+        documents: Sequence[Document],
+        build: Optional[Callable[[Document], SongSection]] = None,
+    ):
+        """
+        :param build: Builds a section from its document. `_section` (for the full layout) if None.
+        """
+        super().__init__(documents)
+        self._build = build or _section
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = super().__getitem__(index)
+        if not isinstance(item, SongSection):
+            item = self._build(item)
+            super().__setitem__(index, item)
+        return item
+
+    def __iter__(self) -> Iterator[SongSection]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def materialized(self) -> int:
+        """
+        :return: How many sections have been built so far.
+        """
+        return sum(1 for x in super().__iter__() if isinstance(x, SongSection))
+
+
+def load_song_record(
+    document: Document, validation_sample_rate: float = 0.0
+) -> SongRecord:
+    """
+    Build a SongRecord from a stored document, trusting that it was valid when it was stored.
+
+    Models are built with `construct`, so none of the validators run, and each section is only built when it's first
+    accessed (see LazySectionList). For catalog-wide jobs that read many songs. Songs stored deduplicated (see
+    DeduplicatedSong) are expanded, and songs stored columnar (see song_codec.py) are decoded.
+
+    :param document: A document from the songs collection.
+    :param validation_sample_rate: The fraction of records to validate fully instead, to catch stored songs that have
+        drifted from the models. 1.0 validates every record.
+    :return: The record.
+    :raises ValidationError: If the record was sampled for validation, and is invalid.
+    :raises SongDecodeError: If the song is stored columnar, but can't be decoded.
+    """
+    if validation_sample_rate and random.random() < validation_sample_rate:
+        plain = _plain(document)
+        layout = plain["song"].get("layout")
+        if layout == "deduplicated":
+            plain["song"] = DeduplicatedSong.parse_obj(plain["song"]).to_song()
+        elif layout == "columnar":
+            plain["song"] = decode_song(plain["song"]["data"]).dict()
+        return SongRecord.parse_obj(plain)
+
+    song = document["song"]
+    layout = song.get("layout")
+    if layout == "columnar":
+        # Decoding is cheap enough that there's nothing to gain from doing it lazily
+        sections = decode_song(song["data"]).sections
+    elif layout == "deduplicated":
+        tables = {track: list(song[track]) for track in TRACKS}
+        sections = LazySectionList(
+            song["sections"], build=lambda x: _deduplicated_section(x, tables)
+        )
+    else:
+        sections = LazySectionList(song["sections"])
+    markup = document["markup"]
+    metrics = document.get("metrics")
+    return SongRecord.construct(
+        song=Song.construct(sections=sections),
+        created_at_utc=document["created_at_utc"],
+        markup=MusicalMarkup.construct(
+            original_text=markup["original_text"],
+            sections={
+                name: MarkupSection.construct(
+                    number_bars=section["number_bars"],
+                    instruments={
+                        instrument: MarkupInstrument.construct(
+                            description=x["description"],
+                            dependencies=list(x["dependencies"]),
+                        )
+                        for instrument, x in section["instruments"].items()
+                    },
+                    name=section["name"],
+                )
+                for name, section in markup["sections"].items()
+            },
+        ),
+        metrics=None
+        if metrics is None
+        else GenerationMetrics.construct(
+            **{k: v for k, v in metrics.items() if k != "attempts"},
+            attempts=[StageAttempt.construct(**x) for x in metrics["attempts"]],
+        ),
+    )
+
+
+def _plain(value: Any) -> Any:
+    """
+    :return: `value` with every mapping made a dict, and every list a list (RawBSONDocuments aren't dicts).
+    """
+    if isinstance(value, Mapping):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(x) for x in value]
+    return value
+
+
+def _section(document: Document) -> SongSection:
+    return SongSection.construct(
+        bars=[_bar(x) for x in document["bars"]], name=document["name"]
+    )
+
+
+def _bar(document: Document) -> Bar:
+    drums = document["drums"]
+    bass = document["bass"]
+    pad = document["pad"]
+    return Bar.construct(
+        drums=_drums(drums, drums.get("effects")),
+        bass=_bass(bass, bass.get("effects")),
+        pad=_pad(pad, pad.get("effects")),
+    )
+
+
+def _deduplicated_section(
+    document: Document, tables: Mapping[str, List[Document]]
+) -> SongSection:
+    drums_effects = document.get("drums_effects")
+    bass_effects = document.get("bass_effects")
+    pad_effects = document.get("pad_effects")
+    bars = []
+    for i, (drums, bass, pad) in enumerate(
+        zip(document["drums"], document["bass"], document["pad"])
+    ):
+        bars.append(
+            Bar.construct(
+                drums=_drums(
+                    tables["drums"][drums], drums_effects and drums_effects[i]
+                ),
+                bass=_bass(tables["bass"][bass], bass_effects and bass_effects[i]),
+                pad=_pad(tables["pad"][pad], pad_effects and pad_effects[i]),
+            )
+        )
+    return SongSection.construct(bars=bars, name=document["name"])
+
+
+def _drums(document: Document, effects: Optional[Document]) -> DrumBar:
+    return DrumBar.construct(
+        hi_hat=_optional_list(document.get("hi_hat")),
+        kick=_optional_list(document.get("kick")),
+        snare=_optional_list(document.get("snare")),
+        effects=_effects(effects),
+    )
+
+
+def _bass(document: Document, effects: Optional[Document]) -> BassBar:
+    return BassBar.construct(
+        pattern=list(document["pattern"]), effects=_effects(effects)
+    )
+
+
+def _pad(document: Document, effects: Optional[Document]) -> PadBar:
+    chord_sequence = document.get("chord_sequence")
+    return PadBar.construct(
+        chord_sequence=None
+        if chord_sequence is None
+        else [Chord.construct(notes=list(x["notes"])) for x in chord_sequence],
+        effects=_effects(effects),
+    )
+
+
+def _optional_list(value: Optional[list]) -> Optional[list]:
+    return None if value is None else list(value)
+
+
+def _effects(
+    document: Optional[Document],
+) -> Union[None, EffectInformation, FilterInformation]:
+    if document is None:
+        return None
+    if "filter" in document:
+        return EffectInformation.construct(filter=_filter(document["filter"]))
+    return _filter(document)
+
+
+def _filter(document: Document) -> FilterInformation:
+    return FilterInformation.construct(
+        filter_type=document["filter_type"],
+        filter_value=list(document["filter_value"]),
+    )
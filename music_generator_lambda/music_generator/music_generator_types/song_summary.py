@@ -0,0 +1,46 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from music_generator.music_generator_types.base_song_types import (
+    SongRecord,
+    SongStorageLayout,
+)
+
+
+class SectionSummary(BaseModel):
+    name: str
+    number_bars: int
+
+
+class SongSummary(BaseModel):
+    """
+    What lists of songs need of a SongRecord, without its bars: kept in its own collection (see
+    `db.get_song_summaries_collection`), with the same ID and date fields as the song, so that the web app can list
+    songs without reading them.
+
+    Songs have no tempo or key to summarize: the player sets the tempo, and the key is only implied by the notes.
+    """
+
+    created_at_utc: str
+    sections: List[SectionSummary]
+    number_bars: int
+    # How the song is stored, and the BSON size of its record
+    layout: SongStorageLayout
+    size_bytes: int
+
+    @staticmethod
+    def from_song_record(
+        song_record: SongRecord, layout: SongStorageLayout, size_bytes: int
+    ) -> "SongSummary":
+        sections = [
+            SectionSummary(name=x.name, number_bars=len(x.bars))
+            for x in song_record.song.sections
+        ]
+        return SongSummary(
+            created_at_utc=song_record.created_at_utc,
+            sections=sections,
+            number_bars=sum(x.number_bars for x in sections),
+            layout=layout,
+            size_bytes=size_bytes,
+        )
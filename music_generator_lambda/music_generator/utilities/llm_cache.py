@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence, Union
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import BaseLLM
+from langchain.schema.messages import BaseMessage
+
+from music_generator.music_generator_types.base_song_types import Config
+from music_generator.utilities.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMResponseCache:
+    """
+    On-disk (SQLite) cache of LLM completions, keyed on the normalized messages, model, temperature and scope.
+
+    Callers should only `update` the cache with completions that parsed successfully. Otherwise a bad completion
+    would be replayed on every retry.
+
+    By default only deterministic (temperature 0) calls are cached. A sampled call, like the markup's, is meant to
+    differ every time: replaying it would make every song the same. With `cache_sampled`, they're cached too, and
+    callers give them a scope (e.g. the song's date) so that they're only replayed within it.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_entries: Optional[int] = 10_000,
+        max_age_seconds: Optional[float] = 30 * 24 * 60 * 60,
+        cache_sampled: bool = False,
+    ):
+        """
+        :param filename: The SQLite database to store completions in. Created if it doesn't exist.
+        :param max_entries: Least recently used entries are evicted past this count. None for no limit.
+        :param max_age_seconds: Entries older than this are evicted. None for no limit.
+        :param cache_sampled: Cache calls at any temperature, not only 0.
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+
+    def is_cacheable(self, llm: Union[BaseChatModel, BaseLLM]) -> bool:
+        """
+        :return: Whether `llm`'s completions are cached: if its temperature is 0, or sampled calls are cached.
+        """
+        return self.cache_sampled or getattr(llm, "temperature", None) == 0
+
+    @staticmethod
+    def key(
+        messages: Sequence[BaseMessage],
+        llm: Union[BaseChatModel, BaseLLM],
+        scope: Optional[str] = None,
+    ) -> str:
+        """
+        :return: A hash of the normalized messages, model, temperature and scope.
+        """
+        normalized = {
+            "messages": [(x.type, x.content.strip()) for x in messages],
+            "model": getattr(llm, "model_name", type(llm).__name__),
+            "temperature": getattr(llm, "temperature", None),
+            "scope": scope,
+        }
+        return hashlib.sha256(
+            json.dumps(normalized, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(
+        self,
+        messages: Sequence[BaseMessage],
+        llm: Union[BaseChatModel, BaseLLM],
+        scope: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        :param scope: What else the completion is keyed on, e.g. the song's date for a sampled call.
+        :return: The cached completion, or None if there isn't one (or it has expired, or `llm` isn't cacheable).
+        """
+        if not self.is_cacheable(llm):
+            return None
+        key = self.key(messages, llm, scope)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self._is_expired(row[1], now):
+                self._connection.execute(
+                    "DELETE FROM llm_responses WHERE key = ?", (key,)
+                )
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            logger.info("LLM cache hit.")
+            return row[0]
+
+    def update(
+        self,
+        messages: Sequence[BaseMessage],
+        llm: Union[BaseChatModel, BaseLLM],
+        response: str,
+        scope: Optional[str] = None,
+    ) -> None:
+        if not self.is_cacheable(llm):
+            return
+        key = self.key(messages, llm, scope)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._evict(now)
+
+    async def alookup(
+        self,
+        messages: Sequence[BaseMessage],
+        llm: Union[BaseChatModel, BaseLLM],
+        scope: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Async variant of `lookup`. SQLite is blocking, so it runs on a worker thread rather than stalling every other
+        stream on the event loop.
+        """
+        return await asyncio.to_thread(self.lookup, messages, llm, scope)
+
+    async def aupdate(
+        self,
+        messages: Sequence[BaseMessage],
+        llm: Union[BaseChatModel, BaseLLM],
+        response: str,
+        scope: Optional[str] = None,
+    ) -> None:
+        """
+        Async variant of `update`. SQLite is blocking, so it runs on a worker thread rather than stalling every other
+        stream on the event loop.
+        """
+        await asyncio.to_thread(self.update, messages, llm, response, scope)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM llm_responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return (
+            self.max_age_seconds is not None and now - created_at > self.max_age_seconds
+        )
+
+    def _evict(self, now: float) -> None:
+        # Expects the lock to be held
+        if self.max_age_seconds is not None:
+            deleted = self._connection.execute(
+                "DELETE FROM llm_responses WHERE created_at < ?",
+                (now - self.max_age_seconds,),
+            )
+            self.evictions += deleted.rowcount
+        if self.max_entries is not None:
+            deleted = self._connection.execute(
+                """
+                DELETE FROM llm_responses WHERE key IN (
+                    SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self.evictions += deleted.rowcount
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    :return: The process-wide response cache, or None if caching is off.
+    """
+    return _llm_cache
+
+
+def set_llm_cache(cache: Optional[LLMResponseCache]) -> None:
+    global _llm_cache
+    _llm_cache = cache
+
+
+def configure_llm_cache(config: Config) -> None:
+    """
+    Turn the response cache on if `config.llm_cache_filename` is set.
+    """
+    if config.llm_cache_filename:
+        logger.info(f"Caching LLM responses in {config.llm_cache_filename}.")
+        set_llm_cache(
+            LLMResponseCache(
+                filename=config.llm_cache_filename,
+                cache_sampled=config.llm_cache_sampled,
+            )
+        )
+    else:
+        set_llm_cache(None)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Optional, Sequence
+
+from langchain.schema.messages import BaseMessage
+
+from music_generator.utilities.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class RateLimiter:
+    """
+    A requests-per-minute and tokens-per-minute budget shared by every LLM call made while it is active (see
+    `use_rate_limiter`), over a sliding one minute window.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        window_seconds: float = 60,
+    ):
+        """
+        :param requests_per_minute: None for no limit.
+        :param tokens_per_minute: None for no limit. Calls are charged an estimate up front, corrected once the
+            actual usage is known.
+        :param window_seconds: The length of the "minute". Shorter in simulations that run faster than real time
+            (see benchmarks/load_test.py).
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        # [start time, tokens] of the calls made in the last window
+        self._calls: deque[list[float]] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> list[float]:
+        """
+        Wait until there is room in the budget for a call of `tokens` tokens, and charge it.
+
+        :return: The call's entry in the window, so that its token count can be corrected.
+        """
+        # Waiters queue on the lock, so calls are let through in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0][0] >= self.window_seconds:
+                    self._calls.popleft()
+                used = sum(x[1] for x in self._calls)
+                if (
+                    self.requests_per_minute is None
+                    or len(self._calls) < self.requests_per_minute
+                ) and (
+                    self.tokens_per_minute is None
+                    or used + tokens <= self.tokens_per_minute
+                    # A single call bigger than the budget would otherwise never go through
+                    or not self._calls
+                ):
+                    entry = [now, float(tokens)]
+                    self._calls.append(entry)
+                    return entry
+                wait = self.window_seconds - (now - self._calls[0][0])
+                logger.info(f"Rate limit reached. Waiting {wait:.1f}s.")
+                await asyncio.sleep(wait)
+
+
+_rate_limiter: ContextVar[Optional[RateLimiter]] = ContextVar(
+    "rate_limiter", default=None
+)
+
+
+def use_rate_limiter(rate_limiter: Optional[RateLimiter]) -> None:
+    """
+    Make every LLM call in the current context (and the tasks it creates from now on) share `rate_limiter`.
+    """
+    _rate_limiter.set(rate_limiter)
+
+
+def estimate_tokens(messages: Sequence[BaseMessage], completion_tokens: int) -> int:
+    """
+    A rough token count for a call, for budgeting before the call is made (~4 characters per token).
+    """
+    return sum(len(x.content) for x in messages) // 4 + completion_tokens
+
+
+@asynccontextmanager
+async def rate_limited(tokens: int) -> AsyncIterator[Callable[[int], None]]:
+    """
+    Wait for room in the active rate limiter's budget (if any) before making an LLM call.
+
+    :param tokens: The estimated number of tokens the call will use.
+    :return: A function to report the call's actual token usage with. Usage of 0 (e.g. when streaming, where OpenAI
+        doesn't report it) keeps the estimate.
+    """
+    rate_limiter = _rate_limiter.get()
+    if rate_limiter is None:
+        yield lambda _: None
+        return
+
+    entry = await rate_limiter.acquire(tokens)
+
+    def record(actual_tokens: int) -> None:
+        if actual_tokens:
+            entry[1] = float(actual_tokens)
+
+    yield record
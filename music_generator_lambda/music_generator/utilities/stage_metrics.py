@@ -0,0 +1,175 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional, Sequence, TypeVar
+
+from langchain.callbacks import get_openai_callback
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.callbacks.openai_info import (
+    OpenAICallbackHandler,
+    get_openai_token_cost_for_model,
+)
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.schema.messages import BaseMessage
+
+from music_generator.music_generator_types.metrics_types import (
+    GenerationMetrics,
+    StageAttempt,
+)
+from music_generator.utilities.logs import get_logger
+from music_generator.utilities.rate_limit import estimate_tokens
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_current_attempt: ContextVar[Optional[StageAttempt]] = ContextVar(
+    "current_attempt", default=None
+)
+
+
+def timed_stage(
+    stage: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Record every call of the decorated stage as a StageAttempt in its `metrics` argument (if given).
+
+    Goes *under* tenacity's @retry, so that every attempt is recorded. The section name is read from the
+    `markup_section` argument, if there is one. Parse failures are counted by the stage (see
+    `record_parse_failures`), not here.
+    """
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            metrics: Optional[GenerationMetrics] = arguments.get("metrics")
+            if metrics is None:
+                return await fn(*args, **kwargs)
+
+            markup_section = arguments.get("markup_section")
+            section = markup_section.name if markup_section is not None else None
+            attempt = StageAttempt(
+                stage=stage,
+                section=section,
+                attempt=metrics.next_attempt_number(stage, section),
+            )
+            token = _current_attempt.set(attempt)
+            start = time.monotonic()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                attempt.error = repr(e)
+                raise
+            finally:
+                attempt.wall_time_seconds = time.monotonic() - start
+                _current_attempt.reset(token)
+                metrics.add(attempt)
+
+        return wrapper
+
+    return decorator
+
+
+def record_cache_hit() -> None:
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.cached_llm_calls += 1
+
+
+def record_parse_failures(count: int) -> None:
+    """
+    Count parse failures (e.g. invalid bars, whether or not they were repaired) against the current attempt.
+    """
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.parse_failures += count
+
+
+class LLMCallTracker(AsyncCallbackHandler):
+    """
+    Measures an LLM call's time to first token, and counts its streamed tokens (OpenAI doesn't report usage for
+    streamed completions).
+    """
+
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.time_to_first_token: Optional[float] = None
+        self.streamed_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def on_first_token(self) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.start
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.on_first_token()
+        self.streamed_tokens += 1
+
+
+@contextmanager
+def track_llm_call(
+    messages: Sequence[BaseMessage], llm: BaseLanguageModel
+) -> Iterator[LLMCallTracker]:
+    """
+    Track the usage of the LLM call made inside the block, log it, and add it to the current stage attempt (even if
+    the call is aborted).
+
+    Pass the tracker to the call as a callback, so that it sees streamed tokens.
+    """
+    tracker = LLMCallTracker()
+    with get_openai_callback() as cb:
+        try:
+            yield tracker
+        finally:
+            _record_llm_call(
+                tracker, cb, messages, getattr(llm, "model_name", type(llm).__name__)
+            )
+
+
+def _record_llm_call(
+    tracker: LLMCallTracker,
+    cb: OpenAICallbackHandler,
+    messages: Sequence[BaseMessage],
+    model_name: str,
+) -> None:
+    if cb.total_tokens:
+        tracker.prompt_tokens = cb.prompt_tokens
+        tracker.completion_tokens = cb.completion_tokens
+        tracker.cost = cb.total_cost
+    else:
+        # Streamed, so estimate from what we saw
+        tracker.prompt_tokens = estimate_tokens(messages, 0)
+        tracker.completion_tokens = tracker.streamed_tokens
+        try:
+            tracker.cost = get_openai_token_cost_for_model(
+                model_name, tracker.prompt_tokens
+            ) + get_openai_token_cost_for_model(
+                model_name, tracker.completion_tokens, is_completion=True
+            )
+        except ValueError:
+            # Not an OpenAI model
+            tracker.cost = 0.0
+
+    logger.info(
+        f"Used {tracker.total_tokens} tokens ({tracker.prompt_tokens} prompt, {tracker.completion_tokens} completion) @ ${(tracker.cost):.3f}"
+    )
+
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.llm_calls += 1
+        attempt.prompt_tokens += tracker.prompt_tokens
+        attempt.completion_tokens += tracker.completion_tokens
+        attempt.cost += tracker.cost
+        if attempt.time_to_first_token_seconds is None:
+            attempt.time_to_first_token_seconds = tracker.time_to_first_token
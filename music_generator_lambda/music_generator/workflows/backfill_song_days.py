@@ -1,67 +1,164 @@
+import asyncio
+import time as timer
 from datetime import datetime, time, timedelta, timezone
+from typing import Optional
 
-import dateutil.parser
-from bson.raw_bson import RawBSONDocument
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from langchain.chat_models.base import BaseChatModel
+from pydantic import BaseModel
 
+from music_generator.db import find_song_days
 from music_generator.music_generator_types.base_song_types import Config
 from music_generator.utilities.logs import get_logger
+from music_generator.utilities.rate_limit import RateLimiter, use_rate_limiter
 from music_generator.utilities.set_langchain_environment import (
     set_langchain_environment,
 )
 from music_generator.workflows.daily_generate_song import (
-    daily_generate_song_and_persist,
+    adaily_generate_song_and_persist,
 )
 
 logger = get_logger(__name__)
 
 
-def fill_missing_songs(config: Config, num_days: int = 14):
+class BackfillResult(BaseModel):
+    date: datetime
+    succeeded: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+class BackfillReport(BaseModel):
+    results: list[BackfillResult]
+    seconds: float
+
+    @property
+    def succeeded(self) -> list[BackfillResult]:
+        return [x for x in self.results if x.succeeded]
+
+    @property
+    def failed(self) -> list[BackfillResult]:
+        return [x for x in self.results if not x.succeeded]
+
+    @property
+    def songs_per_hour(self) -> float:
+        return len(self.succeeded) / self.seconds * 3600 if self.seconds else 0.0
+
+
+def find_missing_dates(config: Config, num_days: int) -> list[datetime]:
     """
-    Iterates over the last two weeks and calls create_song(date) on every date
-    that doesn't have a song for it.
+    :return: Noon (UTC) on each of the last `num_days` days that doesn't have a song.
     """
-    client = MongoClient(
-        config.atlas_cluster_uri,
-        server_api=ServerApi("1"),
-        document_class=RawBSONDocument,
-    )
-    db = client.get_database(config.db_name)
-    collection = db.get_collection("songs")
-
     # Calculate the date range for the last two weeks
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=num_days)
 
-    # Fetch all records in the last two weeks
-    query = {
-        "created_at_utc": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}
-    }
-    songs = list(collection.find(query))
-
-    # Group songs by date
-    existing_dates = set()
-    for song in songs:
-        date = dateutil.parser.parse(song["created_at_utc"]).date()
-        existing_dates.add(date)
+    # Only the days that have songs are read, not the songs
+    existing_dates = set(find_song_days(config, start=start_date, end=end_date))
 
     queue = []
     for single_date in (start_date + timedelta(n) for n in range(num_days)):
-        if single_date not in existing_dates:
+        if single_date.isoformat() not in existing_dates:
             datetime_object = datetime.combine(
                 single_date, time(12, 0, 0, tzinfo=timezone.utc)
             )
             queue.append(datetime_object)
+    return queue
+
+
+async def afill_missing_songs(
+    config: Config,
+    num_days: int = 14,
+    max_workers: int = 4,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    llm: Optional[BaseChatModel] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> BackfillReport:
+    """
+    Iterates over the last `num_days` days and creates a song for every date that doesn't have one.
+
+    Up to `max_workers` songs are generated at once, and all of their LLM calls share one requests-per-minute and
+    tokens-per-minute budget. A failure on one date doesn't stop the others.
+
+    :param llm: The model for every stage (see `adaily_generate_song_and_persist`).
+    :param rate_limiter: The budget to share, instead of one built from `requests_per_minute` and
+        `tokens_per_minute`.
+    """
+    queue = await asyncio.to_thread(find_missing_dates, config, num_days)
     print("Will create songs for dates:\n" + "\n".join([x.isoformat() for x in queue]))
 
-    count = 0
-    # Check each date in the range
+    # Set before the workers are created, so that they all inherit it
+    use_rate_limiter(
+        rate_limiter
+        or RateLimiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
+    )
+
+    pending: asyncio.Queue[datetime] = asyncio.Queue()
     for d in queue:
-        daily_generate_song_and_persist(config=config, d=d)
-        count += 1
+        pending.put_nowait(d)
+    results: list[BackfillResult] = []
 
-    return count
+    async def _worker() -> None:
+        while not pending.empty():
+            d = pending.get_nowait()
+            start = timer.monotonic()
+            try:
+                await adaily_generate_song_and_persist(config=config, d=d, llm=llm)
+                results.append(
+                    BackfillResult(
+                        date=d, succeeded=True, seconds=timer.monotonic() - start
+                    )
+                )
+                logger.info(f"Created song for {d.isoformat()}.")
+            except Exception as e:
+                logger.exception(f"Failed to create song for {d.isoformat()}.")
+                results.append(
+                    BackfillResult(
+                        date=d,
+                        succeeded=False,
+                        seconds=timer.monotonic() - start,
+                        error=repr(e),
+                    )
+                )
+
+    start = timer.monotonic()
+    await asyncio.gather(*[_worker() for _ in range(min(max_workers, len(queue)))])
+    report = BackfillReport(
+        results=sorted(results, key=lambda x: x.date),
+        seconds=timer.monotonic() - start,
+    )
+    logger.info(
+        f"Created {len(report.succeeded)} songs ({len(report.failed)} failed) in {report.seconds:.0f}s: {report.songs_per_hour:.1f} songs/hour."
+    )
+    return report
+
+
+def fill_missing_songs(
+    config: Config,
+    num_days: int = 14,
+    max_workers: int = 4,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    llm: Optional[BaseChatModel] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> BackfillReport:
+    """
+    Synchronous wrapper around `afill_missing_songs`.
+    """
+    return asyncio.run(
+        afill_missing_songs(
+            config=config,
+            num_days=num_days,
+            max_workers=max_workers,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            llm=llm,
+            rate_limiter=rate_limiter,
+        )
+    )
 
 
 if __name__ == "__main__":
@@ -69,10 +166,13 @@ if __name__ == "__main__":
 
     config = Config(**dotenv_values())  # type: ignore
     set_langchain_environment(config=config)
-    # langchain.llm_cache = (
-    #     SQLiteCache(database_path=config.llm_cache_filename)
-    #     if config.llm_cache_filename
-    #     else None
-    # )
-    count = fill_missing_songs(config=config, num_days=28)
-    print(f"Created {count} backdated songs.")
+    report = fill_missing_songs(
+        config=config,
+        num_days=28,
+        max_workers=4,
+        requests_per_minute=200,
+        tokens_per_minute=40_000,
+    )
+    print(f"Created {len(report.succeeded)} backdated songs.")
+    for result in report.failed:
+        print(f"Failed {result.date.isoformat()}: {result.error}")
@@ -1,12 +1,19 @@
+import asyncio
 import datetime
+import functools
+import time
+from typing import Optional
 
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.base import BaseChatModel
 
-from music_generator.db import insert_song
-from music_generator.generate_markup import generate_markup
-from music_generator.generate_song import generate_song
+from music_generator.db import ainsert_song, day_key
+from music_generator.generate_markup import agenerate_markup
+from music_generator.generate_song import agenerate_song
 from music_generator.music_generator_types.base_song_types import Config, SongRecord
+from music_generator.music_generator_types.metrics_types import GenerationMetrics
+from music_generator.utilities.llm_cache import configure_llm_cache, get_llm_cache
 from music_generator.utilities.logs import get_logger
 from music_generator.utilities.set_langchain_environment import (
     set_langchain_environment,
@@ -15,56 +22,89 @@ from music_generator.utilities.set_langchain_environment import (
 logger = get_logger(__name__)
 
 
-def daily_generate_song_and_persist(config: Config, d: datetime.datetime) -> None:
+@functools.lru_cache(maxsize=None)
+def get_chat_openai(openai_api_key: str, temperature: float) -> ChatOpenAI:
     """
-    Generate a bar using each of the LLMs and save them to the database.
+    :return: A GPT-4 client, shared across songs (and warm Lambda invocations) so that it's only built once.
     """
+    return ChatOpenAI(
+        openai_api_key=openai_api_key,
+        model="gpt-4",
+        temperature=temperature,
+        streaming=True,
+        callbacks=[StreamingStdOutCallbackHandler()],
+    )
+
+
+async def adaily_generate_song_and_persist(
+    config: Config, d: datetime.datetime, llm: Optional[BaseChatModel] = None
+) -> None:
+    """
+    Generate a bar using each of the LLMs and save them to the database, along with the metrics of every stage.
+
+    :param llm: The model for every stage, e.g. a replayed one for offline runs (see benchmarks/cassette.py). GPT-4
+        if None.
+    """
+    start = time.monotonic()
+    metrics = GenerationMetrics()
 
-    musical_markup = generate_markup(
+    musical_markup = await agenerate_markup(
         song_description="""Create an outline for a house music track""".strip(),
-        llm=ChatOpenAI(
-            openai_api_key=config.openai_api_key,
-            model="gpt-4",
-            temperature=0.70,
-            streaming=True,
-            callbacks=[StreamingStdOutCallbackHandler()],
-        ),
+        llm=llm
+        or get_chat_openai(openai_api_key=config.openai_api_key, temperature=0.70),
+        metrics=metrics,
+        # A day's outline is only replayed (if sampled calls are cached at all) for that day's song
+        cache_scope=day_key(d),
     )
 
-    song = generate_song(
-        llm=ChatOpenAI(
-            openai_api_key=config.openai_api_key,
-            model="gpt-4",
-            temperature=0.0,
-            streaming=True,
-            callbacks=[StreamingStdOutCallbackHandler()],
-        ),
+    song = await agenerate_song(
+        llm=llm
+        or get_chat_openai(openai_api_key=config.openai_api_key, temperature=0.0),
         musical_markup=musical_markup,
+        max_parallelism=config.max_parallelism,
+        metrics=metrics,
     )
+    metrics.wall_time_seconds = time.monotonic() - start
 
     song_record = SongRecord(
         song=song,
         created_at_utc=(d).isoformat(),
         markup=musical_markup,
+        metrics=metrics,
     )
 
-    insert_song(
+    await ainsert_song(
         config=config,
         song_record=song_record,
     )
 
+    logger.info(
+        f"Generated song in {metrics.wall_time_seconds:.0f}s with {metrics.retries} retries, using {metrics.prompt_tokens + metrics.completion_tokens} tokens @ ${metrics.cost:.3f}"
+    )
+    cache = get_llm_cache()
+    if cache:
+        logger.info(f"LLM cache stats: {cache.stats()}")
+
+
+def daily_generate_song_and_persist(
+    config: Config, d: datetime.datetime, llm: Optional[BaseChatModel] = None
+) -> None:
+    """
+    Synchronous wrapper around `adaily_generate_song_and_persist`.
+    """
+    asyncio.run(adaily_generate_song_and_persist(config=config, d=d, llm=llm))
+
 
 if __name__ == "__main__":
     from dotenv import dotenv_values
 
     config = Config(**dotenv_values())  # type: ignore
     set_langchain_environment(config=config)
-    # langchain.llm_cache = (
-    #     SQLiteCache(database_path=config.llm_cache_filename)
-    #     if config.llm_cache_filename
-    #     else None
-    # )
+    configure_llm_cache(config=config)
 
+    today = datetime.datetime.now(datetime.timezone.utc)
     for i in range(4):
         print(f"Generating song {i}")
-        daily_generate_song_and_persist(config=config, i=i)
+        daily_generate_song_and_persist(
+            config=config, d=today - datetime.timedelta(days=i)
+        )
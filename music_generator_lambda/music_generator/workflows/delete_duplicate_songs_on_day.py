@@ -1,10 +1,7 @@
-from collections import defaultdict
-
-import dateutil.parser
-from bson.raw_bson import RawBSONDocument
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
+from music_generator.db import as_utc, delete_songs, get_songs_collection
 from music_generator.music_generator_types.base_song_types import Config
 from music_generator.utilities.logs import get_logger
 from music_generator.utilities.set_langchain_environment import (
@@ -13,47 +10,87 @@ from music_generator.utilities.set_langchain_environment import (
 
 logger = get_logger(__name__)
 
+# How many songs each delete removes. Only the IDs of one batch are held at a time.
+DELETE_BATCH_SIZE = 1000
+
+
+def _duplicates_pipeline(
+    start: Optional[datetime], end: Optional[datetime]
+) -> List[Dict[str, Any]]:
+    """
+    :return: An aggregation that yields the ID and `created_at` of every song that isn't the last one on its (UTC) day,
+        within the range. Songs are read in the order of the (`created_day`, `created_at`) index.
+    """
+    created_at: Dict[str, datetime] = {}
+    if start is not None:
+        created_at["$gte"] = as_utc(start)
+    if end is not None:
+        created_at["$lt"] = as_utc(end)
+    return [
+        # Songs that haven't been migrated (see migrate_song_dates.py) aren't on any day, so they're left alone
+        {
+            "$match": {
+                "created_day": {"$exists": True},
+                **({"created_at": created_at} if created_at else {}),
+            }
+        },
+        # BSON dates only keep milliseconds, so songs created in the same one are told apart by the later ID
+        {"$sort": {"created_day": 1, "created_at": -1, "_id": -1}},
+        {
+            "$group": {
+                "_id": "$created_day",
+                "songs": {"$push": {"_id": "$_id", "created_at": "$created_at"}},
+            }
+        },
+        # The first (latest) song of each day survives
+        {"$match": {"songs.1": {"$exists": True}}},
+        {"$unwind": {"path": "$songs", "includeArrayIndex": "index"}},
+        {"$match": {"index": {"$gt": 0}}},
+        {"$replaceRoot": {"newRoot": "$songs"}},
+    ]
+
 
-def delete_except_last_song_per_day(config: Config) -> int:
+def delete_except_last_song_per_day(
+    config: Config,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dry_run: bool = False,
+) -> int:
     """
-    Deletes all but the last song on each day.
+    Deletes all but the last song on each (UTC) day. The database picks them, so only their IDs are read, and they're
+    deleted (with their summaries) DELETE_BATCH_SIZE at a time. Songs are only considered once their dates have been
+    migrated (see migrate_song_dates.py).
 
-    :returns: The number of deleted records.
+    :param start: Only consider songs created at or after this time, if given.
+    :param end: Only consider songs created before this time, if given.
+    :param dry_run: Log the songs that would be deleted, without deleting them.
+    :returns: The number of deleted (or, on a dry run, deletable) records.
     """
-    client = MongoClient(
-        config.atlas_cluster_uri,
-        server_api=ServerApi("1"),
-        document_class=RawBSONDocument,
+    collection = get_songs_collection(config)
+    duplicates = collection.aggregate(
+        _duplicates_pipeline(start=start, end=end), allowDiskUse=True
     )
-    db = client.get_database(config.db_name)
-    collection = db.get_collection("songs")
 
-    # Fetch all records
-    songs = list(collection.find({}))
+    deleted_count = 0
+    batch: List[Any] = []
 
-    # Group songs by date
-    grouped_songs = defaultdict(list)
-    for song in songs:
-        date = dateutil.parser.parse(song["created_at_utc"]).date()
-        grouped_songs[date].append(song)
+    def _delete() -> None:
+        nonlocal deleted_count
+        if dry_run:
+            deleted_count += len(batch)
+        else:
+            deleted_count += delete_songs(config, {"_id": {"$in": batch}})
+        batch.clear()
 
-    # Identify songs to delete (all but the last song of each day)
-    songs_to_delete = []
-    for date, song_list in grouped_songs.items():
-        sorted_songs = sorted(
-            song_list, key=lambda x: dateutil.parser.parse(x["created_at_utc"])
+    for song in duplicates:
+        logger.info(
+            f"{'Would delete' if dry_run else 'Deleting'} the song created at {song['created_at'].isoformat()}."
         )
-        songs_to_delete.extend(sorted_songs[:-1])  # All but the last song
-
-    print(
-        "Deleting the following dates: "
-        + "\n".join([x["created_at_utc"] for x in songs_to_delete])
-    )
-    # Delete the identified songs
-    deleted_count = 0
-    for song in songs_to_delete:
-        collection.delete_one({"_id": song["_id"]})
-        deleted_count += 1
+        batch.append(song["_id"])
+        if len(batch) == DELETE_BATCH_SIZE:
+            _delete()
+    if batch:
+        _delete()
     return deleted_count
 
 
@@ -62,10 +99,5 @@ if __name__ == "__main__":
 
     config = Config(**dotenv_values())  # type: ignore
     set_langchain_environment(config=config)
-    # langchain.llm_cache = (
-    #     SQLiteCache(database_path=config.llm_cache_filename)
-    #     if config.llm_cache_filename
-    #     else None
-    # )
     count = delete_except_last_song_per_day(config)
-    print(f"Deleted {count} future dated songs.")
+    print(f"Deleted {count} duplicate songs.")
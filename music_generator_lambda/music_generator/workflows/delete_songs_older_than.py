@@ -1,9 +1,6 @@
 from datetime import datetime
 
-from bson.raw_bson import RawBSONDocument
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-
+from music_generator.db import as_utc, delete_songs, find_song_dates
 from music_generator.music_generator_types.base_song_types import Config
 from music_generator.utilities.logs import get_logger
 from music_generator.utilities.set_langchain_environment import (
@@ -13,26 +10,29 @@ from music_generator.utilities.set_langchain_environment import (
 logger = get_logger(__name__)
 
 
-def delete_songs_older_than(config: Config, cutoff_date: datetime) -> int:
+def delete_songs_older_than(
+    config: Config, cutoff_date: datetime, dry_run: bool = False
+) -> int:
     """
-    Deletes all songs with a created_at_utc date in the future.
+    Deletes all songs created before `cutoff_date` (UTC if naive).
 
-    :returns: The number of deleted records.
+    :param dry_run: Log the songs that would be deleted (reading only their dates), without deleting them.
+    :returns: The number of deleted (or, on a dry run, deletable) records.
     """
-    client = MongoClient(
-        config.atlas_cluster_uri,
-        server_api=ServerApi("1"),
-        document_class=RawBSONDocument,
-    )
-    db = client.get_database(config.db_name)
-    collection = db.get_collection("songs")
-
-    # Query to find records with a future date
-    query = {"created_at_utc": {"$lt": cutoff_date.isoformat()}}
+    if dry_run:
+        count = 0
+        for song in find_song_dates(config, end=cutoff_date):
+            logger.info(
+                f"Would delete the song created at {song.created_at.isoformat()}."
+            )
+            count += 1
+        return count
+
+    # Query to find records created before the cutoff
+    query = {"created_at": {"$lt": as_utc(cutoff_date)}}
 
     # Delete matching records
-    result = collection.delete_many(query)
-    return result.deleted_count
+    return delete_songs(config, query)
 
 
 if __name__ == "__main__":
@@ -40,11 +40,6 @@ if __name__ == "__main__":
 
     config = Config(**dotenv_values())  # type: ignore
     set_langchain_environment(config=config)
-    # langchain.llm_cache = (
-    #     SQLiteCache(database_path=config.llm_cache_filename)
-    #     if config.llm_cache_filename
-    #     else None
-    # )
     cutoff = datetime(2023, 11, 5, 0, 0, 0, 0)
     count = delete_songs_older_than(config, cutoff)
     print(f"Deleted {count} songs older than {cutoff.isoformat()}")
@@ -0,0 +1,64 @@
+from typing import Any, Optional
+
+from pymongo import UpdateOne
+
+from music_generator.db import ensure_song_indexes, get_songs_collection, song_dates
+from music_generator.music_generator_types.base_song_types import Config
+from music_generator.utilities.logs import get_logger
+from music_generator.utilities.set_langchain_environment import (
+    set_langchain_environment,
+)
+
+logger = get_logger(__name__)
+
+
+def migrate_song_dates(config: Config, batch_size: int = 500) -> int:
+    """
+    Adds the indexed date fields (see `db.song_dates`) to songs stored before `insert_song` wrote them, and creates
+    their indexes. Songs are read `batch_size` at a time (only their `created_at_utc`) and each batch is written in
+    one request, so it can be stopped at any point: running it again carries on with the songs that are left.
+
+    Songs whose `created_at_utc` can't be parsed are logged and skipped.
+
+    :returns: The number of migrated records.
+    """
+    ensure_song_indexes(config)
+    collection = get_songs_collection(config)
+
+    migrated = 0
+    last_id: Optional[Any] = None
+    while True:
+        query: dict[str, Any] = {"created_day": {"$exists": False}}
+        if last_id is not None:
+            # Skipped songs still match, so pick up after the last batch rather than from the start
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            collection.find(query, projection={"created_at_utc": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        updates = []
+        for song in batch:
+            try:
+                dates = song_dates(song["created_at_utc"])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping song {song['_id']}: {e!r}")
+                continue
+            updates.append(UpdateOne({"_id": song["_id"]}, {"$set": dates}))
+        if updates:
+            migrated += collection.bulk_write(updates, ordered=False).modified_count
+        logger.info(f"Migrated {migrated} songs.")
+    return migrated
+
+
+if __name__ == "__main__":
+    from dotenv import dotenv_values
+
+    config = Config(**dotenv_values())  # type: ignore
+    set_langchain_environment(config=config)
+    count = migrate_song_dates(config)
+    print(f"Migrated the dates of {count} songs.")
@@ -0,0 +1,87 @@
+from typing import Any, Optional
+
+import bson
+from pymongo.errors import BulkWriteError
+
+from music_generator.db import (
+    ensure_song_indexes,
+    get_song_summaries_collection,
+    get_songs_collection,
+    song_summary_document,
+)
+from music_generator.music_generator_types.base_song_types import Config
+from music_generator.music_generator_types.song_loader import load_song_record
+from music_generator.utilities.logs import get_logger
+from music_generator.utilities.set_langchain_environment import (
+    set_langchain_environment,
+)
+
+logger = get_logger(__name__)
+
+
+def migrate_song_summaries(config: Config, batch_size: int = 100) -> int:
+    """
+    Adds a summary (see SongSummary) for every song stored before `insert_song` wrote them. Songs are read
+    `batch_size` at a time, and only those without a summary are loaded. Each batch's summaries are written in one
+    request, so it can be stopped at any point: running it again skips the songs that have one.
+
+    Run it after migrate_song_dates.py, as summaries take the song's date fields. Songs whose `created_at_utc` can't
+    be parsed are logged and skipped.
+
+    :returns: The number of summaries written.
+    """
+    ensure_song_indexes(config)
+    songs = get_songs_collection(config)
+    summaries = get_song_summaries_collection(config)
+
+    migrated = 0
+    last_id: Optional[Any] = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        ids = [
+            x["_id"]
+            for x in songs.find(query, projection={"_id": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        summarized = {
+            x["_id"]
+            for x in summaries.find({"_id": {"$in": ids}}, projection={"_id": 1})
+        }
+        missing = [x for x in ids if x not in summarized]
+        documents = []
+        for document in songs.find({"_id": {"$in": missing}}) if missing else []:
+            try:
+                documents.append(
+                    song_summary_document(
+                        document["_id"],
+                        load_song_record(document),  # type: ignore
+                        layout=document["song"].get("layout", "full"),
+                        size_bytes=len(bson.encode(document)),
+                    )
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping song {document['_id']}: {e!r}")
+        if documents:
+            try:
+                migrated += len(
+                    summaries.insert_many(documents, ordered=False).inserted_ids
+                )
+            except BulkWriteError as e:
+                # Another run wrote some of them first
+                migrated += e.details["nInserted"]
+        logger.info(f"Wrote {migrated} summaries.")
+    return migrated
+
+
+if __name__ == "__main__":
+    from dotenv import dotenv_values
+
+    config = Config(**dotenv_values())  # type: ignore
+    set_langchain_environment(config=config)
+    count = migrate_song_summaries(config)
+    print(f"Wrote the summaries of {count} songs.")
@@ -0,0 +1,84 @@
+"""
+The LLM response cache (see `llm_cache.py`): what it caches, and that it replays whole songs when asked to.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import datetime
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.local_db import LocalMongoClient
+from benchmarks.offline_daily import OFFLINE_CONFIG
+from benchmarks.synthetic_chat_model import SyntheticChatModel
+from music_generator.db import find_song_records, set_mongo_client
+from music_generator.utilities.llm_cache import LLMResponseCache, set_llm_cache
+from music_generator.workflows.daily_generate_song import (
+    adaily_generate_song_and_persist,
+)
+
+
+class _SampledChatModel(SyntheticChatModel):
+    # Like the markup's model: every call is sampled
+    temperature: float = 0.7
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self) -> None:
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = str(Path(self.directory.name) / "llm_cache.db")
+        set_mongo_client(OFFLINE_CONFIG, LocalMongoClient())
+        self.llm = _SampledChatModel(seed=0, time_scale=0.001)
+        self.day = datetime.datetime(2023, 11, 5, 12, tzinfo=datetime.timezone.utc)
+
+    def tearDown(self) -> None:
+        set_llm_cache(None)
+        set_mongo_client(OFFLINE_CONFIG, None)
+        self.directory.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def _generate(self, d: datetime.datetime) -> None:
+        asyncio.run(
+            adaily_generate_song_and_persist(config=OFFLINE_CONFIG, d=d, llm=self.llm)
+        )
+
+    def test_sampled_calls_are_not_cached_by_default(self) -> None:
+        cache = LLMResponseCache(filename=self.filename)
+        set_llm_cache(cache)
+        self._generate(self.day)
+        self._generate(self.day)
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual(cache.hits, 0)
+
+    def test_second_run_of_a_song_replays_it(self) -> None:
+        cache = LLMResponseCache(filename=self.filename, cache_sampled=True)
+        set_llm_cache(cache)
+        self._generate(self.day)
+        requests = self.llm.requests
+        misses = cache.misses
+
+        self._generate(self.day)
+        self.assertEqual(self.llm.requests, requests)
+        self.assertEqual(cache.misses, misses)
+        self.assertGreater(cache.hits, 0)
+        (_, first), (_, second) = find_song_records(OFFLINE_CONFIG)
+        self.assertEqual(first.markup, second.markup)
+        self.assertEqual(first.song, second.song)
+
+    def test_other_days_get_new_songs(self) -> None:
+        cache = LLMResponseCache(filename=self.filename, cache_sampled=True)
+        set_llm_cache(cache)
+        self._generate(self.day)
+        requests = self.llm.requests
+
+        self._generate(self.day + datetime.timedelta(days=1))
+        self.assertGreater(self.llm.requests, requests)
+        (_, first), (_, second) = find_song_records(OFFLINE_CONFIG)
+        self.assertNotEqual(first.markup, second.markup)
+
+
+if __name__ == "__main__":
+    unittest.main()
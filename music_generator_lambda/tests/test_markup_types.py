@@ -0,0 +1,49 @@
+"""
+Which sections a section waits on (see `MusicalMarkup.dependency_graph`).
+
+    python -m unittest discover tests
+"""
+import unittest
+
+from music_generator.music_generator_types.markup_types import MusicalMarkup
+
+OUTLINE = """
+##intro (4 bars)
+*Pad - Warm chords
+*Bass - Low root notes
+*Drums - Four to the floor
+*Effects - The filter opens
+##verse (8 bars)
+*Pad - Like %intro
+*Bass - Busier than %intro, leading into %drop
+*Drums - Four to the floor
+*Effects - Sweep like %intro
+##drop (8 bars)
+*Pad - Big stabs
+*Bass - Like %verse
+*Drums - Like %missing
+*Effects - Sweep like %verse
+##outro (4 bars)
+*Pad - Fading out
+*Bass - Low root notes
+*Drums - Sparse
+*Effects - Close the filter like %drop
+"""
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def test_references_to_earlier_sections(self) -> None:
+        graph = MusicalMarkup.from_outline(OUTLINE).dependency_graph()
+        # Forward references (verse -> drop) and unknown sections are dropped
+        self.assertEqual(graph["verse"], ["intro"])
+        self.assertEqual(graph["drop"], ["verse"])
+
+    def test_effects_references_are_ignored(self) -> None:
+        # The outro only references the drop in its effects, which its prompt doesn't include
+        graph = MusicalMarkup.from_outline(OUTLINE).dependency_graph()
+        self.assertEqual(graph["intro"], [])
+        self.assertEqual(graph["outro"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+Round trips of the song codec (see `song_codec.py`), and a golden fixture that pins version 1 of the format: stored
+songs must keep decoding as they were encoded, whatever changes in the encoder.
+
+    python -m unittest discover tests
+
+If the format changes, bump `song_codec.VERSION` and keep decoding the old one, rather than rewriting the fixture.
+"""
+import unittest
+from pathlib import Path
+
+from music_generator.music_generator_types.base_song_types import (
+    Bar,
+    BassBar,
+    Chord,
+    DrumBar,
+    PadBar,
+    Song,
+    SongSection,
+)
+from music_generator.music_generator_types.compact_section import CompactSection
+from music_generator.music_generator_types.effect_types import (
+    EffectBar,
+    EffectInformation,
+    FilterInformation,
+    SectionEffects,
+    SongEffects,
+)
+from music_generator.music_generator_types.song_codec import (
+    SongDecodeError,
+    decode_compact_sections,
+    decode_song,
+    decode_song_effects,
+    encode_song,
+    encode_song_effects,
+)
+
+FIXTURE = Path(__file__).parent / "fixtures" / "song_v1.bin"
+
+C_MAJOR = Chord(notes=["C3", "E3", "G3"])
+F_MAJOR_7 = Chord(notes=["F3", "A3", "C4", "E4"])
+
+
+def _bar(
+    hi_hat=(1, 0) * 8,
+    kick=(1, 0, 0, 0) * 4,
+    snare=(0, 0, 0, 0, 1, 0, 0, 0) * 2,
+    bass=("C2", "0", "0", "G2") * 4,
+    pad=(C_MAJOR,) * 8 + (F_MAJOR_7,) * 8,
+    effects=(None, None, None),
+) -> Bar:
+    return Bar(
+        drums=DrumBar(
+            hi_hat=list(hi_hat) if hi_hat is not None else None,
+            kick=list(kick) if kick is not None else None,
+            snare=list(snare) if snare is not None else None,
+            effects=effects[0],
+        ),
+        bass=BassBar(pattern=list(bass), effects=effects[1]),
+        pad=PadBar(
+            chord_sequence=list(pad) if pad is not None else None, effects=effects[2]
+        ),
+    )
+
+
+def _song() -> Song:
+    """
+    :return: A song with missing drum rows, bars without a pad, every kind of effects, and filter values that are
+        stored as thousandths (in "intro") and as f64 (in "drop", where 1 / 3 doesn't round-trip as thousandths).
+    """
+    intro = SongSection(
+        name="intro",
+        bars=[
+            _bar(
+                kick=None,
+                snare=None,
+                pad=None,
+                effects=(
+                    None,
+                    FilterInformation(filter_type="lowpass", filter_value=[0.25, 0.5]),
+                    EffectInformation(
+                        filter=FilterInformation(
+                            filter_type="highpass", filter_value=[1.0]
+                        )
+                    ),
+                ),
+            ),
+            _bar(
+                hi_hat=None,
+                bass=("Eb2",) * 16,
+                effects=(
+                    FilterInformation(filter_type="bandpass", filter_value=[0.125]),
+                    None,
+                    None,
+                ),
+            ),
+        ],
+    )
+    drop = SongSection(
+        name="drop",
+        bars=[
+            _bar(
+                effects=(
+                    FilterInformation(
+                        filter_type="lowpass", filter_value=[1 / 3, 2 / 3, 1.0]
+                    ),
+                    None,
+                    FilterInformation(filter_type="lowpass", filter_value=[0.001]),
+                )
+            ),
+            _bar(hi_hat=None, kick=None, snare=None, pad=None),
+        ],
+    )
+    return Song(sections=[intro, drop])
+
+
+def _song_effects() -> SongEffects:
+    def _effects(filter_type: str, *values: float) -> EffectInformation:
+        return EffectInformation(
+            filter=FilterInformation(filter_type=filter_type, filter_value=list(values))
+        )
+
+    return SongEffects(
+        sections={
+            "intro": SectionEffects(
+                name="intro",
+                bars=[
+                    EffectBar(
+                        drums_effects=_effects("lowpass", 0.5, 0.75),
+                        bass_effects=_effects("highpass", 1.0),
+                        pad_effects=_effects("lowpass", 0.0),
+                    )
+                ],
+            ),
+            "drop": SectionEffects(
+                name="drop",
+                bars=[
+                    EffectBar(
+                        drums_effects=_effects("bandpass", 1 / 3),
+                        bass_effects=_effects(""),
+                        pad_effects=_effects("lowpass", 0.2, 0.4, 0.6, 0.8),
+                    )
+                ]
+                * 2,
+            ),
+        }
+    )
+
+
+class TestSongCodec(unittest.TestCase):
+    def test_golden_fixture_decodes(self) -> None:
+        self.assertEqual(decode_song(FIXTURE.read_bytes()), _song())
+
+    def test_encoding_matches_golden_fixture(self) -> None:
+        self.assertEqual(encode_song(_song()), FIXTURE.read_bytes())
+
+    def test_song_round_trip(self) -> None:
+        song = _song()
+        decoded = decode_song(encode_song(song))
+        self.assertEqual(decoded, song)
+        # Decoded songs are built with `construct`, so check they're still valid
+        self.assertEqual(Song.parse_obj(decoded.dict()), song)
+
+    def test_f64_and_thousandths_values(self) -> None:
+        intro, drop = decode_song(FIXTURE.read_bytes()).sections
+        self.assertEqual(intro.bars[0].bass.effects.filter_value, [0.25, 0.5])
+        self.assertEqual(drop.bars[0].drums.effects.filter_value, [1 / 3, 2 / 3, 1.0])
+        self.assertEqual(drop.bars[0].pad.effects.filter_value, [0.001])
+
+    def test_missing_rows_and_pads(self) -> None:
+        intro, drop = decode_song(FIXTURE.read_bytes()).sections
+        self.assertIsNone(intro.bars[0].drums.kick)
+        self.assertIsNone(intro.bars[0].drums.snare)
+        self.assertIsNone(intro.bars[0].pad.chord_sequence)
+        self.assertIsNone(intro.bars[1].drums.hi_hat)
+        self.assertIsNotNone(intro.bars[1].pad.chord_sequence)
+        self.assertIsNone(drop.bars[1].drums.hi_hat)
+        self.assertIsNone(drop.bars[1].pad.chord_sequence)
+
+    def test_compact_sections_match_song(self) -> None:
+        song = _song()
+        compact = decode_compact_sections(FIXTURE.read_bytes())
+        self.assertEqual([x.to_section() for x in compact], song.sections)
+        for decoded, expected in zip(
+            compact, map(CompactSection.from_section, song.sections)
+        ):
+            self.assertEqual(decoded.drums_present, expected.drums_present)
+            self.assertEqual(decoded.pad_present, expected.pad_present)
+            self.assertEqual(decoded.effect_values, expected.effect_values)
+
+    def test_song_effects_round_trip(self) -> None:
+        song_effects = _song_effects()
+        self.assertEqual(
+            decode_song_effects(encode_song_effects(song_effects)), song_effects
+        )
+
+    def test_rejects_other_data(self) -> None:
+        data = encode_song_effects(_song_effects())
+        with self.assertRaises(SongDecodeError):
+            decode_song(data)
+        with self.assertRaises(SongDecodeError):
+            decode_song_effects(FIXTURE.read_bytes())
+        with self.assertRaises(SongDecodeError):
+            decode_song(FIXTURE.read_bytes()[:-1])
+
+    def test_rejects_newer_versions(self) -> None:
+        data = bytearray(FIXTURE.read_bytes())
+        data[4] += 1
+        with self.assertRaises(SongDecodeError):
+            decode_song(bytes(data))
+
+    def test_rejects_rows_of_the_wrong_length(self) -> None:
+        song = _song()
+        song.sections[0].bars[0].bass.pattern = ["C2"] * 8
+        with self.assertRaises(ValueError):
+            encode_song(song)
+
+
+if __name__ == "__main__":
+    unittest.main()